@@ -652,7 +652,18 @@ def make_schema():
             },
             "gather_profiler": {"type": "boolean", "default": False},
             "gather_allow_reuse": {"type": "boolean", "default": False},
+            "gather_repo_cache_size": {
+                "type": "number",
+                "default": 4 * 1024 * 1024 * 1024,
+            },
             "pkgset_allow_reuse": {"type": "boolean", "default": True},
+            "pkgset_reader_backend": {
+                "type": "string",
+                "enum": ["threads", "processes"],
+                "default": "threads",
+            },
+            "pkgset_reader_workers": {"type": "number"},
+            "pkgset_reader_chunk_size": {"type": "number", "default": 32},
             "createiso_allow_reuse": {"type": "boolean", "default": True},
             "extraiso_allow_reuse": {"type": "boolean", "default": True},
             "pkgset_source": {"type": "string", "enum": ["koji", "repos"]},
@@ -663,9 +674,13 @@ def make_schema():
                 "enum": ["sha1", "sha256", "sha512"],
             },
             "createrepo_enable_cache": {"type": "boolean", "default": True},
+            "createrepo_cache_max_age": {"type": "number", "default": 30},
             "createrepo_use_xz": {"type": "boolean", "default": False},
+            "createrepo_in_process": {"type": "boolean", "default": False},
+            "createrepo_incremental": {"type": "boolean", "default": False},
             "createrepo_num_threads": {"type": "number", "default": get_num_cpus()},
             "createrepo_num_workers": {"type": "number", "default": 3},
+            "max_parallel_tasks": {"type": "number", "default": get_num_cpus()},
             "createrepo_database": {"type": "boolean"},
             "createrepo_extra_args": {
                 "type": "array",
@@ -795,6 +810,7 @@ def make_schema():
             "cts_url": {"type": "string"},
             "cts_keytab": {"type": "string"},
             "koji_profile": {"type": "string"},
+            "koji_watch_tasks_in_process": {"type": "boolean", "default": False},
             "koji_event": {"type": "number"},
             "pkgset_koji_tag": {"$ref": "#/definitions/strings"},
             "pkgset_koji_builds": {"$ref": "#/definitions/strings"},
@@ -809,6 +825,7 @@ def make_schema():
             },
             "pkgset_koji_inherit": {"type": "boolean", "default": True},
             "pkgset_koji_inherit_modules": {"type": "boolean", "default": False},
+            "pkgset_koji_num_threads": {"type": "number", "default": 5},
             "pkgset_exclusive_arch_considers_noarch": {
                 "type": "boolean",
                 "default": True,
@@ -890,6 +907,9 @@ def make_schema():
                     "hardlink-or-copy",
                     "symlink",
                     "abspath-symlink",
+                    "reflink",
+                    "hardlink-or-reflink",
+                    "reflink-or-copy",
                 ],
                 "default": "hardlink-or-copy",
             },
@@ -1204,6 +1224,11 @@ def make_schema():
                 "anyOf": [{"type": "string"}, {"type": "number"}],
                 "default": 10 * 1024 * 1024,
             },
+            "split_iso_method": {
+                "type": "string",
+                "enum": ["sequential", "first-fit-decreasing"],
+                "default": "sequential",
+            },
             "osbs_allow_reuse": {"type": "boolean", "default": False},
             "osbs": {
                 "type": "object",
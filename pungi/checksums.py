@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://gnu.org/licenses/>.
+
+"""
+Computing checksums of files.
+
+Each file is read only once into a reused buffer, and all requested digests
+are updated from the same data. Hashlib releases the GIL while hashing large
+blocks of data, so checksums of multiple files are computed in parallel by a
+pool of threads.
+
+Computed digests can be remembered in a `ChecksumCache`, keyed by identity
+of the file (device and inode), its size, modification time and checksum
+type. A file that is replaced or modified gets a new key, so it is hashed
+again. The cache is saved in the compose, and a new compose loads the cache
+of the old one, so images reused from it are not hashed again.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+from kobo.shortcuts import force_list
+
+# Size of blocks read from the file. Multiple of page size.
+CHUNK_SIZE = 8 * 1024 * 1024
+
+DEFAULT_WORKERS = 4
+
+
+def get_hashers(checksum_types):
+    """Return a dict mapping checksum type to a new hash object."""
+    hashers = {}
+    for checksum_type in force_list(checksum_types):
+        try:
+            hashers[checksum_type] = hashlib.new(checksum_type)
+        except ValueError:
+            raise ValueError("Checksum is not supported in hashlib: %s" % checksum_type)
+    return hashers
+
+
+def compute_file_checksums(path, checksum_types):
+    """Compute checksums of given types for a file.
+
+    :return: dict mapping checksum type to digest in lowercase hex
+    """
+    hashers = get_hashers(checksum_types)
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            size = f.readinto(buf)
+            if not size:
+                break
+            for hasher in hashers.values():
+                hasher.update(view[:size])
+    return dict((t, h.hexdigest().lower()) for t, h in hashers.items())
+
+
+def _get_mtime_ns(st):
+    if hasattr(st, "st_mtime_ns"):
+        return st.st_mtime_ns
+    return int(st.st_mtime * 10**9)
+
+
+class ChecksumCache(object):
+    """Thread safe mapping of file stat data and checksum type to digest. If
+    `path` is given, the cache can be saved there.
+
+    Only entries that were looked up or added since the cache was created are
+    saved, so entries loaded from an old file do not pile up forever.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._digests = {}
+        self._used = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_key(st, checksum_type):
+        return (st.st_dev, st.st_ino, st.st_size, _get_mtime_ns(st), checksum_type)
+
+    def get(self, st, checksum_types):
+        """Return a dict with cached digests of given types for a file with
+        stat result `st`. Types that are not cached are missing in the dict.
+        """
+        result = {}
+        with self._lock:
+            for checksum_type in checksum_types:
+                key = self.get_key(st, checksum_type)
+                digest = self._digests.get(key)
+                if digest:
+                    result[checksum_type] = digest
+                    self._used.add(key)
+        return result
+
+    def update(self, st, digests):
+        """Remember digests (a dict mapping type to digest) of a file with stat
+        result `st`.
+        """
+        with self._lock:
+            for checksum_type, digest in digests.items():
+                key = self.get_key(st, checksum_type)
+                self._digests[key] = digest
+                self._used.add(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._digests)
+
+    def load(self, path):
+        """Add entries from a file written by `save`. A missing or broken file
+        is ignored, it only means that files will be hashed again.
+        """
+        try:
+            with open(path) as f:
+                entries = json.load(f)["checksums"]
+            with self._lock:
+                for entry in entries:
+                    self._digests[tuple(entry[:-1])] = entry[-1]
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def save(self):
+        """Write entries used so far into `path`."""
+        if not self.path:
+            return
+        with self._lock:
+            entries = [list(key) + [self._digests[key]] for key in self._used]
+            tmp_path = "%s.%s.tmp" % (self.path, threading.current_thread().ident)
+            with open(tmp_path, "w") as f:
+                json.dump({"checksums": sorted(entries)}, f)
+            os.rename(tmp_path, self.path)
+
+
+def map_in_threads(func, items, num_workers=DEFAULT_WORKERS):
+    """Call `func` on each item using a pool of threads, return list of
+    results in the same order.
+    """
+    if len(items) <= 1 or num_workers <= 1:
+        return [func(item) for item in items]
+
+    pool = ThreadPool(min(num_workers, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def compute_checksums(paths, checksum_types, num_workers=DEFAULT_WORKERS, cache=None):
+    """Compute checksums of given types for multiple files in parallel. Each
+    distinct path is read only once. With a `ChecksumCache`, digests found
+    there are not computed again and the new ones are added to it. The cache
+    is not saved, that is up to its owner.
+
+    :return: dict mapping path to a dict of checksums as returned by
+             `compute_file_checksums`
+    """
+    checksum_types = force_list(checksum_types)
+    results = {}
+    # List of files to read as tuples (path, stat result, missing types).
+    todo = []
+    for path in sorted(set(paths)):
+        st = None
+        results[path] = {}
+        if cache is not None:
+            st = os.stat(path)
+            results[path] = cache.get(st, checksum_types)
+        missing = [t for t in checksum_types if t not in results[path]]
+        if missing:
+            todo.append((path, st, missing))
+
+    computed = map_in_threads(
+        lambda item: compute_file_checksums(item[0], item[2]), todo, num_workers
+    )
+    for (path, st, _), digests in zip(todo, computed):
+        results[path].update(digests)
+        if cache is not None:
+            cache.update(st, digests)
+
+    return results
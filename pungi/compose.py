@@ -24,6 +24,7 @@ import time
 import tempfile
 import shutil
 import json
+import threading
 
 import kobo.log
 import kobo.tback
@@ -32,9 +33,11 @@ from productmd.images import Images
 from dogpile.cache import make_region
 
 
+from pungi.checksums import ChecksumCache
 from pungi.graph import SimpleAcyclicOrientedGraph
 from pungi.wrappers.variants import VariantsXmlParser
 from pungi.paths import Paths
+from pungi.rpm_manifest import RpmManifest
 from pungi.wrappers.scm import get_file_from_scm
 from pungi.util import (
     makedirs,
@@ -317,6 +320,13 @@ class Compose(kobo.log.LoggingBase):
 
         self.containers_metadata = {}
 
+        # RPM manifest shared by all phases. Gather phase sets it when it
+        # starts linking packages, otherwise it's loaded on first use.
+        self.rpm_manifest = None
+        self._rpm_manifest_lock = threading.Lock()
+        self._checksum_cache = None
+        self._checksum_cache_lock = threading.Lock()
+
         # Stores list of deliverables that failed, but did not abort the
         # compose.
         # {deliverable: [(Variant.uid, arch, subvariant)]}
@@ -452,6 +462,39 @@ class Compose(kobo.log.LoggingBase):
             self._status_file = os.path.join(self.topdir, "STATUS")
         return self._status_file
 
+    def get_rpm_manifest(self):
+        """Return RPM manifest of this compose. If it was not created by
+        gather phase in this process, it is loaded from rpms.json.
+        """
+        with self._rpm_manifest_lock:
+            if self.rpm_manifest is None:
+                self.rpm_manifest = RpmManifest.from_file(
+                    self.paths.compose.metadata("rpms.json")
+                )
+            return self.rpm_manifest
+
+    def get_checksum_cache(self):
+        """Return cache of file checksums computed in this compose. It starts
+        with checksums from the old compose, if there is one.
+        """
+        with self._checksum_cache_lock:
+            if self._checksum_cache is None:
+                path = self.paths.work.checksum_cache()
+                self._checksum_cache = ChecksumCache(path)
+                old_path = self.paths.old_compose_path(path)
+                if old_path:
+                    self._checksum_cache.load(old_path)
+                self._checksum_cache.load(path)
+            return self._checksum_cache
+
+    def save_checksum_cache(self):
+        """Save checksums used in this compose, so that the next compose can
+        reuse them. Nothing is written if no checksums were needed.
+        """
+        with self._checksum_cache_lock:
+            if self._checksum_cache is not None:
+                self._checksum_cache.save()
+
     def _log_failed_deliverables(self):
         for kind, data in self.failed_deliverables.items():
             for variant, arch, subvariant in data:
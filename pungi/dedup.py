@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://gnu.org/licenses/>.
+
+"""
+Finding and hardlinking files with identical content.
+
+Files are compared in stages, so that data is only read when it has to be.
+Files with different sizes can not be identical, and files that are already
+hardlinked together are known to be identical. Only the remaining candidates
+are hashed, and digests known from a `ChecksumCache` are not computed again.
+"""
+
+import os
+import stat
+from collections import defaultdict
+
+from pungi.checksums import DEFAULT_WORKERS, compute_checksums, map_in_threads
+from pungi.util import copy_file, makedirs
+
+CHECKSUM_TYPE = "sha256"
+
+
+def group_identical(paths, num_workers=DEFAULT_WORKERS, cache=None):
+    """Split files into groups with identical content. Paths that are not
+    regular files are ignored.
+
+    :return: sorted list of groups, each group is a sorted list of paths
+    """
+    # Mapping of size to a mapping of inode to paths.
+    by_size = defaultdict(lambda: defaultdict(list))
+    for path in set(paths):
+        st = os.stat(path)
+        if stat.S_ISREG(st.st_mode):
+            by_size[st.st_size][(st.st_dev, st.st_ino)].append(path)
+
+    groups = []
+    candidates = []
+    for size, by_inode in by_size.items():
+        if len(by_inode) == 1 or size == 0:
+            groups.append(sum(by_inode.values(), []))
+        else:
+            candidates.append(list(by_inode.values()))
+
+    digests = compute_checksums(
+        [links[0] for inodes in candidates for links in inodes],
+        CHECKSUM_TYPE,
+        num_workers=num_workers,
+        cache=cache,
+    )
+    for inodes in candidates:
+        by_digest = defaultdict(list)
+        for links in inodes:
+            by_digest[digests[links[0]][CHECKSUM_TYPE]].extend(links)
+        groups.extend(by_digest.values())
+
+    return sorted(sorted(group) for group in groups)
+
+
+def _link(src, dst):
+    if os.path.lexists(dst):
+        os.remove(dst)
+    os.link(src, dst)
+
+
+def copy_deduplicated(files, num_workers=DEFAULT_WORKERS, cache=None):
+    """Copy files given as a dict mapping destination path to source path.
+    For each group of sources with identical content only the first
+    destination is copied (sharing data blocks with the source if the
+    filesystem supports reflinks), the other destinations are hardlinked to
+    it. Groups are processed in parallel.
+
+    :return: number of bytes saved by hardlinking
+    """
+    dests = defaultdict(list)
+    for dst, src in files.items():
+        dests[src].append(dst)
+
+    def process(group):
+        targets = sorted(dst for src in group for dst in dests[src])
+        makedirs(os.path.dirname(targets[0]))
+        copy_file(group[0], targets[0])
+        for dst in targets[1:]:
+            makedirs(os.path.dirname(dst))
+            _link(targets[0], dst)
+        return os.path.getsize(targets[0]) * (len(targets) - 1)
+
+    groups = group_identical(list(dests), num_workers=num_workers, cache=cache)
+    return sum(map_in_threads(process, groups, num_workers))
@@ -24,6 +24,7 @@ import dnf.repo
 import dnf.sack
 
 import pungi.arch
+from pungi.solv_cache import SolvCache
 
 try:
     import dnf.rpm as dnf_arch
@@ -48,9 +49,31 @@ class Substitutions(dict):
 
 class DnfWrapper(dnf.Base):
     def __init__(self, *args, **kwargs):
+        solv_cache_dir = kwargs.pop("solv_cache_dir", None)
         super(DnfWrapper, self).__init__(*args, **kwargs)
         self.arch_wrapper = ArchWrapper(self.conf.substitutions["arch"])
         self.comps_wrapper = CompsWrapper(self)
+        self.solv_cache = SolvCache(solv_cache_dir) if solv_cache_dir else None
+
+    def fill_sack(self, *args, **kwargs):
+        """Fill the sack. If a solv cache directory was given, libsolv cache
+        files for local repos are taken from it and new ones stored into it.
+        """
+        if not self.solv_cache:
+            return super(DnfWrapper, self).fill_sack(*args, **kwargs)
+
+        keys = {}
+        for repo in self.repos.iter_enabled():
+            key = self.solv_cache.get_key(repo.baseurl[0]) if repo.baseurl else None
+            if key:
+                keys[repo.id] = key
+                self.solv_cache.link_into(self.conf.cachedir, repo.id, key)
+
+        result = super(DnfWrapper, self).fill_sack(*args, **kwargs)
+
+        for repoid, key in keys.items():
+            self.solv_cache.store_from(self.conf.cachedir, repoid, key)
+        return result
 
     def add_repo(
         self, repoid, baseurl=None, enablegroups=True, lookaside=False, **kwargs
@@ -119,6 +119,48 @@ class QueryCache(object):
         return self.cache.get(key, None)
 
 
+def get_reldep_name(reldep):
+    """Return name of capability or file path from a hawkey reldep, or None
+    for rich dependencies.
+    """
+    reldep = str(reldep)
+    if reldep.startswith("("):
+        return None
+    return reldep.split(" ", 1)[0]
+
+
+class ProvidesIndex(object):
+    """Reverse index mapping capability names and file paths to packages that
+    provide them.
+
+    Packages found in the index only provide something with the same name, it
+    does not check versions. The exact check must still be done by hawkey, but
+    only on the few candidates instead of the whole queue.
+
+    Only files listed in `file_requires` are indexed to keep the index small.
+    """
+
+    def __init__(self, queue, file_requires=()):
+        self.provides = {}
+        self.files = {}
+        for pkg in queue:
+            for prov in pkg.provides:
+                self.provides.setdefault(get_reldep_name(prov), set()).add(pkg)
+            if file_requires:
+                for path in pkg.files:
+                    if path in file_requires:
+                        self.files.setdefault(path, set()).add(pkg)
+
+    def get_candidates(self, req):
+        """Return set of packages that may satisfy `req`, or None if the index
+        can not answer that.
+        """
+        name = get_reldep_name(req)
+        if name is None:
+            return None
+        return self.provides.get(name, set()) | self.files.get(name, set())
+
+
 class PkgFlag(Enum):
     lookaside = 1
     input = 2
@@ -218,6 +260,9 @@ class Gather(GatherBase):
         self.finished_add_source_package_deps = {}  # {pkg: [deps]}
 
         self.finished_get_package_deps_reqs = {}
+        # Created by init_query_cache()
+        self.binary_provides_index = None
+        self.debug_provides_index = None
 
         self.finished_add_conditional_packages = {}  # {pkg: [pkgs]}
         self.finished_add_source_packages = {}  # {pkg: src-pkg|None}
@@ -227,6 +272,9 @@ class Gather(GatherBase):
         self.finished_add_langpack_packages = {}  # {pkg: [pkgs]}
         self.finished_add_multilib_packages = {}  # {pkg: pkg|None}
 
+        # packages already handed to each step of gather()
+        self.worklist = pungi.util.Worklist()
+
         # result
         self.result_binary_packages = set()
         self.result_debug_packages = set()
@@ -345,6 +393,15 @@ class Gather(GatherBase):
                 if i.sourcerpm.rsplit("-", 2)[0] in self.opts.fulltree_excludes:
                     self._set_flag(i, PkgFlag.fulltree_exclude)
 
+    def _get_worklist(self, step, packages):
+        """Return packages that were not yet processed by given step of the
+        depsolving loop and mark them as processed. The number of returned
+        packages is recorded in profiling data.
+        """
+        worklist = self.worklist.get(step, packages)
+        Profiler.count("Gather.%s():packages" % step, len(worklist))
+        return worklist
+
     def _get_package_deps(self, pkg, debuginfo=False):
         """Return all direct (1st level) deps for a package.
 
@@ -368,7 +425,7 @@ class Gather(GatherBase):
             + getattr(pkg, "requires_post", [])
         )
 
-        q = queue.filter(provides=requires).apply()
+        index = self.debug_provides_index if debuginfo else self.binary_provides_index
         for req in requires:
             deps = self.finished_get_package_deps_reqs.setdefault(str(req), set())
             if deps:
@@ -376,7 +433,13 @@ class Gather(GatherBase):
                 continue
 
             # TODO: need query also debuginfo
-            deps = q.filter(provides=req)
+            candidates = index.get_candidates(req) if index else None
+            if candidates is None:
+                deps = queue.filter(provides=req)
+            elif candidates:
+                deps = queue.filter(pkg=list(candidates), provides=req)
+            else:
+                deps = []
             if deps:
                 deps = self._get_best_package(deps, req=req, debuginfo=debuginfo)
                 self.finished_get_package_deps_reqs[str(req)].update(deps)
@@ -568,6 +631,23 @@ class Gather(GatherBase):
         # prepopulate
         self.prepopulate_cache = QueryCache(self.q_binary_packages, "name", "arch")
 
+        # dependencies
+        file_requires = set()
+        for queue in (
+            self.q_binary_packages,
+            self.q_debug_packages,
+            self.q_source_packages,
+        ):
+            for pkg in queue:
+                for req in pkg.requires:
+                    name = get_reldep_name(req)
+                    if name and name.startswith("/"):
+                        file_requires.add(name)
+        self.binary_provides_index = ProvidesIndex(
+            self.q_binary_packages, file_requires
+        )
+        self.debug_provides_index = ProvidesIndex(self.q_debug_packages, file_requires)
+
     @Profiler("Gather.add_prepopulate_packages()")
     def add_prepopulate_packages(self):
         added = set()
@@ -593,7 +673,10 @@ class Gather(GatherBase):
         if not self.opts.resolve_deps:
             return added
 
-        for pkg in self.result_binary_packages.copy():
+        worklist = self._get_worklist(
+            "add_binary_package_deps", self.result_binary_packages
+        )
+        for pkg in worklist:
             assert pkg is not None
 
             if pkg not in self.finished_add_binary_package_deps:
@@ -615,7 +698,10 @@ class Gather(GatherBase):
         if not self.opts.resolve_deps or self.opts.exclude_debug:
             return added
 
-        for pkg in self.result_debug_packages.copy():
+        worklist = self._get_worklist(
+            "add_debug_package_deps", self.result_debug_packages
+        )
+        for pkg in worklist:
 
             if pkg not in self.finished_add_debug_package_deps:
                 deps = self._get_package_deps(pkg, debuginfo=True)
@@ -648,7 +734,10 @@ class Gather(GatherBase):
         if not self.opts.resolve_deps:
             return added
 
-        for pkg in self.result_binary_packages.copy():
+        worklist = self._get_worklist(
+            "add_conditional_packages", self.result_binary_packages
+        )
+        for pkg in worklist:
             assert pkg is not None
 
             try:
@@ -682,7 +771,10 @@ class Gather(GatherBase):
         if self.opts.exclude_source:
             return added
 
-        for pkg in self.result_source_packages:
+        worklist = self._get_worklist(
+            "add_source_package_deps", self.result_source_packages
+        )
+        for pkg in worklist:
             assert pkg is not None
 
             try:
@@ -723,7 +815,10 @@ class Gather(GatherBase):
         if self.opts.exclude_source:
             return added
 
-        for pkg in self.result_binary_packages:
+        worklist = self._get_worklist(
+            "add_source_packages", self.result_binary_packages
+        )
+        for pkg in worklist:
             assert pkg is not None
 
             try:
@@ -767,7 +862,8 @@ class Gather(GatherBase):
         if self.opts.exclude_debug:
             return added
 
-        for pkg in self.result_binary_packages:
+        worklist = self._get_worklist("add_debug_packages", self.result_binary_packages)
+        for pkg in worklist:
             assert pkg is not None
 
             if pkg in self.finished_add_debug_packages:
@@ -817,7 +913,10 @@ class Gather(GatherBase):
         if not self.opts.fulltree:
             return added
 
-        for pkg in sorted(self.result_binary_packages):
+        worklist = self._get_worklist(
+            "add_fulltree_packages", self.result_binary_packages
+        )
+        for pkg in sorted(worklist):
             assert pkg is not None
 
             if get_source_name(pkg) in self.opts.fulltree_excludes:
@@ -889,7 +988,10 @@ class Gather(GatherBase):
 
         exceptions = ["man-pages-overrides"]
 
-        for pkg in sorted(self.result_binary_packages):
+        worklist = self._get_worklist(
+            "add_langpack_packages", self.result_binary_packages
+        )
+        for pkg in sorted(worklist):
             assert pkg is not None
 
             try:
@@ -936,7 +1038,10 @@ class Gather(GatherBase):
     def add_multilib_packages(self):
         added = set()
 
-        for pkg in sorted(self.result_binary_packages):
+        worklist = self._get_worklist(
+            "add_multilib_packages", self.result_binary_packages
+        )
+        for pkg in sorted(worklist):
             if pkg in self.finished_add_multilib_packages:
                 continue
 
@@ -963,6 +1068,11 @@ class Gather(GatherBase):
                     self.finished_add_multilib_packages[pkg] = i
                     # TODO: ^^^ may get multiple results; i686, i586, etc.
 
+            if pkg not in self.finished_add_multilib_packages:
+                # The best multilib package depends on what is already in
+                # the result, so try again in next pass.
+                self.worklist.retry("add_multilib_packages", pkg)
+
         return added
 
     @Profiler("Gather.gather()")
@@ -980,6 +1090,7 @@ class Gather(GatherBase):
 
         for pass_num in count(1):
             self.logger.debug("PASS %s" % pass_num)
+            Profiler.count("Gather.gather():passes")
 
             if self.log_count("CONDITIONAL DEPS", self.add_conditional_packages):
                 continue
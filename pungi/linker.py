@@ -18,12 +18,75 @@ import contextlib
 import errno
 import os
 import shutil
+import stat
 
 import kobo.log
 from kobo.shortcuts import relative_path
 from kobo.threads import WorkerThread, ThreadPool
 
-from pungi.util import makedirs
+from pungi.util import copy_file, makedirs, reflink_file
+
+# Number of files linked in one task of a worker thread.
+BATCH_SIZE = 100
+
+
+# Not available on Python 2.
+scandir = getattr(os, "scandir", None)
+
+
+class _DirEntry(object):
+    """Replacement for ``os.DirEntry`` where ``os.scandir`` is not available.
+    Only the parts used by the linker are implemented.
+    """
+
+    def __init__(self, dirpath, name):
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+        self._lstat = os.lstat(self.path)
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self._lstat.st_mode)
+
+    def is_dir(self, follow_symlinks=True):
+        if follow_symlinks and self.is_symlink():
+            return os.path.isdir(self.path)
+        return stat.S_ISDIR(self._lstat.st_mode)
+
+    def stat(self, follow_symlinks=True):
+        if follow_symlinks and self.is_symlink():
+            return os.stat(self.path)
+        return self._lstat
+
+
+def _scandir(path):
+    if scandir is not None:
+        return scandir(path)
+    return [_DirEntry(path, name) for name in os.listdir(path)]
+
+
+def walk_tree(src, skip_dir_symlinks=False):
+    """Walk directory tree `src` top-down using ``os.scandir`` (or
+    ``os.listdir`` and ``os.lstat`` on Python 2).
+
+    For each directory yield its path relative to `src` (empty string for
+    `src` itself) and a list of ``os.DirEntry`` objects for everything in it
+    that is not a directory. Symlinks to directories are included in the
+    list too, unless `skip_dir_symlinks` is set. The entries know their type
+    and cache stat result, so the tree can be linked without looking up each
+    file again.
+    """
+    stack = [""]
+    while stack:
+        reldir = stack.pop()
+        files = []
+        for entry in _scandir(os.path.join(src, reldir) if reldir else src):
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(os.path.join(reldir, entry.name))
+            elif skip_dir_symlinks and entry.is_symlink() and entry.is_dir():
+                continue
+            else:
+                files.append(entry)
+        yield reldir, files
 
 
 class LinkerPool(ThreadPool):
@@ -32,6 +95,20 @@ class LinkerPool(ThreadPool):
         self.link_type = link_type
         self.linker = Linker()
 
+    def queue_tree(self, src, dst, batch_size=BATCH_SIZE, skip_dir_symlinks=False):
+        """Create all directories from `src` in `dst` and queue linking of
+        all files in batches of `batch_size`. Symlinks to directories are
+        linked as files, or ignored if `skip_dir_symlinks` is set.
+        """
+        batch = []
+        for item in self.linker.iter_tree(src, dst, skip_dir_symlinks):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                self.queue_put(batch)
+                batch = []
+        if batch:
+            self.queue_put(batch)
+
     @classmethod
     def with_workers(cls, num_workers, *args, **kwargs):
         pool = cls(*args, **kwargs)
@@ -53,6 +130,13 @@ def linker_pool(link_type="hardlink-or-copy", num_workers=10):
 
 class LinkerThread(WorkerThread):
     def process(self, item, num):
+        """The item is either a tuple of source and destination path, or a
+        batch from `LinkerPool.queue_tree`.
+        """
+        if isinstance(item, list):
+            self.process_batch(item, num)
+            return
+
         src, dst = item
 
         if (num % 100 == 0) or (num == self.pool.queue_total):
@@ -64,6 +148,16 @@ class LinkerThread(WorkerThread):
         makedirs(directory)
         self.pool.linker.link(src, dst, link_type=self.pool.link_type)
 
+    def process_batch(self, batch, num):
+        # Directories are already created by queue_tree().
+        for src, dst, entry in batch:
+            self.pool.linker._link_file(src, dst, self.pool.link_type, entry)
+
+        if (num % 10 == 0) or (num == self.pool.queue_total):
+            self.pool.log_debug(
+                "Linked %s out of %s batches" % (num, self.pool.queue_total)
+            )
+
 
 class Linker(kobo.log.LoggingBase):
     def __init__(self, always_copy=None, test=False, logger=None):
@@ -81,15 +175,17 @@ class Linker(kobo.log.LoggingBase):
             return False
         return True
 
-    def _is_same(self, path1, path2):
+    def _is_same(self, path1, path2, stat1=None):
         if path1 == path2:
             return True
         if os.path.islink(path2) and not os.path.exists(path2):
             # Broken symlink
             return True
-        if os.path.getsize(path1) != os.path.getsize(path2):
+        stat1 = stat1 or os.stat(path1)
+        stat2 = os.stat(path2)
+        if stat1.st_size != stat2.st_size:
             return False
-        if int(os.path.getmtime(path1)) != int(os.path.getmtime(path2)):
+        if int(stat1.st_mtime) != int(stat2.st_mtime):
             return False
         return True
 
@@ -155,22 +251,35 @@ class Linker(kobo.log.LoggingBase):
             else:
                 raise
 
-    def copy(self, src, dst):
+    def copy(self, src, dst, link_type="copy", src_entry=None):
+        """Copy a file. With `link_type` set to ``reflink`` the copy must
+        share data with the source, and with ``reflink-or-copy`` it does if
+        the filesystem supports it. If `src_entry` is given, it must be an
+        ``os.DirEntry`` for `src` and its cached data is used.
+        """
         if src == dst:
             return True
 
-        if os.path.islink(src):
+        src_is_link = src_entry.is_symlink() if src_entry else os.path.islink(src)
+
+        if src_is_link:
             msg = "Copying symlink %s to %s" % (src, dst)
-        else:
+        elif link_type == "copy":
             msg = "Copying file %s to %s" % (src, dst)
+        else:
+            msg = "Reflinking file %s to %s" % (src, dst)
 
         if self.test:
             self.log_info("TEST: %s" % msg)
             return
         self.log_info(msg)
 
+        src_stat = None
+        if not src_is_link:
+            src_stat = src_entry.stat() if src_entry else os.stat(src)
+
         if os.path.exists(dst):
-            if self._is_same(src, dst):
+            if self._is_same(src, dst, src_stat):
                 if not self._is_same_type(src, dst):
                     self.log_error(
                         "File %s already exists but has different type than %s"
@@ -184,13 +293,12 @@ class Linker(kobo.log.LoggingBase):
             else:
                 raise OSError(errno.EEXIST, "File exists")
 
-        if os.path.islink(src):
+        if src_is_link:
             if not os.path.islink(dst):
                 os.symlink(os.readlink(src), dst)
                 return
             return
 
-        src_stat = os.stat(src)
         src_key = (src_stat.st_dev, src_stat.st_ino)
         if src_key in self._inode_map:
             # (st_dev, st_ino) found in the mapping
@@ -201,18 +309,26 @@ class Linker(kobo.log.LoggingBase):
             os.link(self._inode_map[src_key], dst)
             return
 
-        # BEWARE: shutil.copy2 automatically *rewrites* existing files
-        shutil.copy2(src, dst)
+        # BEWARE: copy_file automatically *rewrites* existing files
+        if link_type == "reflink":
+            if not reflink_file(src, dst):
+                raise OSError(
+                    errno.EOPNOTSUPP,
+                    "Can not reflink %s to %s" % (src, dst),
+                )
+            shutil.copystat(src, dst)
+        else:
+            copy_file(src, dst, reflink=link_type == "reflink-or-copy")
         self._inode_map[src_key] = dst
 
-    def _link_file(self, src, dst, link_type):
+    def _link_file(self, src, dst, link_type, src_entry=None):
         if link_type == "hardlink":
             self.hardlink(src, dst)
-        elif link_type == "copy":
-            self.copy(src, dst)
+        elif link_type in ("copy", "reflink", "reflink-or-copy"):
+            self.copy(src, dst, link_type, src_entry)
         elif link_type in ("symlink", "abspath-symlink"):
-            if os.path.islink(src):
-                self.copy(src, dst)
+            if src_entry.is_symlink() if src_entry else os.path.islink(src):
+                self.copy(src, dst, src_entry=src_entry)
             else:
                 relative = link_type != "abspath-symlink"
                 self.symlink(src, dst, relative)
@@ -221,7 +337,17 @@ class Linker(kobo.log.LoggingBase):
                 self.hardlink(src, dst)
             except OSError as ex:
                 if ex.errno == errno.EXDEV:
-                    self.copy(src, dst)
+                    self.copy(src, dst, src_entry=src_entry)
+                else:
+                    raise
+        elif link_type == "hardlink-or-reflink":
+            try:
+                self.hardlink(src, dst)
+            except OSError as ex:
+                if ex.errno == errno.EXDEV:
+                    # Different mount points or Btrfs subvolumes can still
+                    # share data.
+                    self.copy(src, dst, "reflink", src_entry)
                 else:
                     raise
         else:
@@ -233,6 +359,10 @@ class Linker(kobo.log.LoggingBase):
             self._link_file(src, dst, link_type)
             return
 
+        for src_path, dst_path, entry in self.iter_tree(src, dst):
+            self._link_file(src_path, dst_path, link_type, entry)
+
+    def _make_dir(self, src, dst):
         if os.path.isfile(dst):
             raise OSError(errno.EEXIST, "File exists")
 
@@ -241,7 +371,14 @@ class Linker(kobo.log.LoggingBase):
                 makedirs(dst)
             shutil.copystat(src, dst)
 
-        for i in os.listdir(src):
-            src_path = os.path.join(src, i)
-            dst_path = os.path.join(dst, i)
-            self.link(src_path, dst_path, link_type)
+    def iter_tree(self, src, dst, skip_dir_symlinks=False):
+        """Create all directories of tree `src` in `dst`, and yield a tuple
+        of source path, destination path and ``os.DirEntry`` for each file
+        that should be linked.
+        """
+        for reldir, entries in walk_tree(src, skip_dir_symlinks):
+            src_dir = os.path.join(src, reldir) if reldir else src
+            dst_dir = os.path.join(dst, reldir) if reldir else dst
+            self._make_dir(src_dir, dst_dir)
+            for entry in entries:
+                yield entry.path, os.path.join(dst_dir, entry.name), entry
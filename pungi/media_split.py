@@ -57,9 +57,12 @@ class MediaSplitter(object):
 
     Each file added to the spliter has a size in bytes that will be rounded to
     the nearest multiple of block size. If the file is sticky, it will be
-    included on each disk. The files will be on disks in the same order they
-    are added; there is no re-ordering. The number of disk is thus not the
-    possible minimum.
+    included on each disk. With `split` the files will be on disks in the same
+    order they are added; there is no re-ordering. The number of disk is thus
+    not the possible minimum.
+
+    `split_packed` reorders files to use fewer disks. Files can be added with
+    a group, and all files in a group are kept on the same disk if possible.
     """
 
     def __init__(self, media_size, compose=None, logger=None):
@@ -67,12 +70,13 @@ class MediaSplitter(object):
         self.files = []  # to preserve order
         self.file_sizes = {}
         self.sticky_files = set()
+        self.file_groups = {}
         self.compose = compose
         self.logger = logger
         if not self.logger and self.compose:
             self.logger = self.compose._logger
 
-    def add_file(self, name, size, sticky=False):
+    def add_file(self, name, size, sticky=False, group=None):
         name = os.path.normpath(name)
         size = int(size)
         old_size = self.file_sizes.get(name, None)
@@ -88,6 +92,8 @@ class MediaSplitter(object):
         self.file_sizes[name] = size
         if sticky:
             self.sticky_files.add(name)
+        if group is not None:
+            self.file_groups[name] = group
 
     @property
     def total_size(self):
@@ -125,3 +131,65 @@ class MediaSplitter(object):
             disk["size"] += size
             total_size_single += size
         return disks
+
+    def split_packed(self):
+        """Split files using first-fit-decreasing algorithm.
+
+        Files without a group are put on the first disks in the order they
+        were added, same as with `split`. That keeps files needed for booting
+        at the beginning. Groups of files are then sorted by size and each of
+        them is put on the first disk with enough free space. A group that
+        does not fit on an empty disk is split into separate files.
+
+        Files on each disk are listed in the order they were added.
+        """
+        order = {}
+        for name in self.files:
+            order.setdefault(name, len(order))
+        sticky_files = [name for name in order if name in self.sticky_files]
+        sticky_files_size = sum(
+            convert_file_size(self.file_sizes[name]) for name in sticky_files
+        )
+
+        disks = []
+
+        def get_size(names):
+            return sum(convert_file_size(self.file_sizes[name]) for name in names)
+
+        def fits(disk, size):
+            return not self.media_size or disk["size"] + size <= self.media_size
+
+        def add_to_disk(disk, names):
+            if disk is None:
+                disk = {"size": sticky_files_size, "files": []}
+                disks.append(disk)
+            disk["files"].extend(names)
+            disk["size"] += get_size(names)
+
+        groups = {}
+        for name in order:
+            if name in self.sticky_files:
+                continue
+            if name not in self.file_groups:
+                size = get_size([name])
+                last_disk = disks[-1] if disks and fits(disks[-1], size) else None
+                add_to_disk(last_disk, [name])
+            else:
+                groups.setdefault(self.file_groups[name], []).append(name)
+
+        items = []
+        for names in groups.values():
+            if fits({"size": sticky_files_size}, get_size(names)):
+                items.append(names)
+            else:
+                items.extend([name] for name in names)
+        # Biggest first; ties are broken by order of files to be deterministic.
+        items.sort(key=lambda names: (-get_size(names), order[names[0]]))
+
+        for names in items:
+            size = get_size(names)
+            add_to_disk(next((d for d in disks if fits(d, size)), None), names)
+
+        for disk in disks:
+            disk["files"] = sticky_files + sorted(disk["files"], key=order.get)
+        return disks
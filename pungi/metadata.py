@@ -21,8 +21,9 @@ import time
 import productmd.composeinfo
 import productmd.treeinfo
 from productmd.common import get_major_version
-from kobo.shortcuts import relative_path, compute_file_checksums
+from kobo.shortcuts import relative_path
 
+from pungi import checksums
 from pungi.compose_metadata.discinfo import write_discinfo as create_discinfo
 from pungi.compose_metadata.discinfo import write_media_repo as create_media_repo
 
@@ -404,8 +405,11 @@ def write_tree_info(compose, arch, variant, timestamp=None, bi=None):
 
     repomd_path = os.path.join(var.paths.repository, "repodata", "repomd.xml")
     createrepo_checksum = compose.conf["createrepo_checksum"]
+    # Files to checksum as (path relative to root, root); the checksums are
+    # computed together at the end.
+    checksum_paths = []
     if os.path.isfile(repomd_path):
-        ti.checksums.add(repomd_path, createrepo_checksum, root_dir=os_tree)
+        checksum_paths.append((repomd_path, os_tree))
 
     for i in variant.get_variants(types=["addon"], arch=arch):
         addon = productmd.treeinfo.Variant(ti)
@@ -443,7 +447,7 @@ def write_tree_info(compose, arch, variant, timestamp=None, bi=None):
 
         repomd_path = os.path.join(addon.paths.repository, "repodata", "repomd.xml")
         if os.path.isfile(repomd_path):
-            ti.checksums.add(repomd_path, createrepo_checksum, root_dir=os_tree)
+            checksum_paths.append((repomd_path, os_tree))
 
     class LoraxProduct(productmd.treeinfo.Release):
         def _validate_short(self):
@@ -477,16 +481,12 @@ def write_tree_info(compose, arch, variant, timestamp=None, bi=None):
             # stage2 - mainimage
             if bi_ti.stage2.mainimage:
                 ti.stage2.mainimage = bi_ti.stage2.mainimage
-                ti.checksums.add(
-                    ti.stage2.mainimage, createrepo_checksum, root_dir=os_tree
-                )
+                checksum_paths.append((ti.stage2.mainimage, os_tree))
 
             # stage2 - instimage
             if bi_ti.stage2.instimage:
                 ti.stage2.instimage = bi_ti.stage2.instimage
-                ti.checksums.add(
-                    ti.stage2.instimage, createrepo_checksum, root_dir=os_tree
-                )
+                checksum_paths.append((ti.stage2.instimage, os_tree))
 
             # images
             for platform in bi_ti.images.images:
@@ -498,7 +498,16 @@ def write_tree_info(compose, arch, variant, timestamp=None, bi=None):
                         # We can't add that.
                         continue
                     ti.images.images[platform][image] = path
-                    ti.checksums.add(path, createrepo_checksum, root_dir=os_tree)
+                    checksum_paths.append((path, os_tree))
+
+    digests = checksums.compute_checksums(
+        [os.path.join(root, path) for path, root in checksum_paths],
+        [createrepo_checksum],
+        cache=compose.get_checksum_cache(),
+    )
+    for path, root in checksum_paths:
+        digest = digests[os.path.join(root, path)][createrepo_checksum]
+        ti.checksums.add(path, createrepo_checksum, digest)
 
     path = os.path.join(
         compose.paths.compose.os_tree(arch=arch, variant=variant), ".treeinfo"
@@ -508,7 +517,14 @@ def write_tree_info(compose, arch, variant, timestamp=None, bi=None):
 
 
 def populate_extra_files_metadata(
-    metadata, variant, arch, topdir, files, checksum_types, relative_root=None
+    metadata,
+    variant,
+    arch,
+    topdir,
+    files,
+    checksum_types,
+    relative_root=None,
+    cache=None,
 ):
     """
     :param metadata: an instance of productmd.extra_files.ExtraFiles to
@@ -520,20 +536,21 @@ def populate_extra_files_metadata(
     :param checksum_types: list of checksums to compute
     :param relative_root: ancestor directory of topdir, this will be removed
                           from paths written to local metadata file
+    :param cache: ChecksumCache to look up and store checksums
     """
-    for copied_file in files:
-        full_path = os.path.join(topdir, copied_file)
-        size = os.path.getsize(full_path)
-        try:
-            checksums = compute_file_checksums(full_path, checksum_types)
-        except IOError as exc:
-            raise RuntimeError(
-                "Failed to calculate checksum for %s: %s" % (full_path, exc)
-            )
+    full_paths = [os.path.join(topdir, copied_file) for copied_file in files]
+    try:
+        digests = checksums.compute_checksums(full_paths, checksum_types, cache=cache)
+    except (IOError, OSError) as exc:
+        raise RuntimeError(
+            "Failed to calculate checksum for %s: %s" % (exc.filename, exc)
+        )
 
+    for copied_file, full_path in zip(files, full_paths):
+        size = os.path.getsize(full_path)
         if relative_root:
             copied_file = os.path.relpath(full_path, relative_root)
-        metadata.add(variant.uid, arch, copied_file, size, checksums)
+        metadata.add(variant.uid, arch, copied_file, size, digests[full_path])
 
     strip_prefix = (
         (os.path.relpath(topdir, relative_root) + "/") if relative_root else ""
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://gnu.org/licenses/>.
+
+"""
+Matching many shell-style globs against many names at once.
+
+The results are the same as calling `fnmatch.fnmatchcase` for each pattern and
+name, but most patterns used for package names are either plain names or a
+literal prefix followed by ``*``. Those are looked up in a set or found by
+bisecting a sorted list of names. Only the remaining patterns are combined
+into a single regular expression that is matched against each name.
+"""
+
+import bisect
+import fnmatch
+import re
+
+GLOB_CHARS = "*?["
+
+
+def is_glob(pattern):
+    """Check if `pattern` contains any characters special to fnmatch."""
+    return any(c in pattern for c in GLOB_CHARS)
+
+
+def split_patterns(patterns):
+    """Split patterns into three groups: a set of exact names, a set of
+    literal prefixes (for patterns like ``foo-*``) and a list of any other
+    patterns.
+    """
+    exact = set()
+    prefixes = set()
+    other = []
+    for pattern in patterns:
+        if not is_glob(pattern):
+            exact.add(pattern)
+        elif pattern.endswith("*") and not is_glob(pattern[:-1]):
+            prefixes.add(pattern[:-1])
+        else:
+            other.append(pattern)
+    return exact, prefixes, other
+
+
+def compile_patterns(patterns):
+    """Compile list of globs into a single regex matching any of them."""
+    return re.compile("|".join("(?:%s)" % fnmatch.translate(p) for p in patterns))
+
+
+class NameIndex(object):
+    """Index of a collection of names that can be queried by globs."""
+
+    def __init__(self, names):
+        self._names = set(names)
+        self._sorted = sorted(self._names)
+
+    def _with_prefix(self, prefix):
+        start = bisect.bisect_left(self._sorted, prefix)
+        for name in self._sorted[start:]:
+            if not name.startswith(prefix):
+                break
+            yield name
+
+    def match(self, patterns):
+        """Return set of names matching any of the patterns."""
+        exact, prefixes, other = split_patterns(patterns)
+        result = exact & self._names
+        for prefix in prefixes:
+            result.update(self._with_prefix(prefix))
+        if other:
+            regex = compile_patterns(other)
+            result.update(
+                name
+                for name in self._sorted
+                if name not in result and regex.match(name)
+            )
+        return result
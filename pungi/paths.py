@@ -21,7 +21,7 @@ import errno
 import os
 
 from kobo.shortcuts import relative_path
-from pungi.util import makedirs, find_old_compose
+from pungi.util import makedirs, OldComposeIndex
 
 
 class Paths(object):
@@ -45,15 +45,29 @@ class Paths(object):
             self.log = LogPaths(compose)
             self.work = WorkPaths(compose)
         # self.metadata ?
+        self._old_compose_index = None
+
+    def get_old_compose_index(self):
+        """
+        Returns index of composes in the old compose directories. It is
+        created on first use and shared by all lookups of old compose paths.
+
+        The index is a snapshot: composes finished while this compose is
+        running are not considered, so all phases reuse data from the same
+        old compose.
+        """
+        if self._old_compose_index is None:
+            self._old_compose_index = OldComposeIndex(self._compose.old_composes)
+        return self._old_compose_index
 
     def get_old_compose_topdir(self, **kwargs):
         """
-        Finds old compose using the `find_old_compose` function and returns
-        the path to it. The `kwargs` are passed to `find_old_compose`.
+        Finds old compose in the old compose index and returns the path to it.
+        The `kwargs` are passed to `OldComposeIndex.find` (same arguments as
+        the `find_old_compose` function accepts).
         """
         is_layered = self._compose.ci_base.release.is_layered
-        return find_old_compose(
-            self._compose.old_composes,
+        return self.get_old_compose_index().find(
             self._compose.ci_base.release.short,
             self._compose.ci_base.release.version,
             self._compose.ci_base.release.type_suffix,
@@ -67,7 +81,7 @@ class Paths(object):
         Translates `path` to the topdir of old compose.
 
         :param str path: Path to translate.
-        :param kwargs: The kwargs passed to `find_old_compose` function.
+        :param kwargs: The kwargs passed to `OldComposeIndex.find`.
         :return: None if old compose cannot be used or if `path` does not exist
             in the old compose topdir. Otherwise path translated to old_compose
             topdir.
@@ -148,6 +162,15 @@ class WorkPaths(object):
         path = os.path.join(self.topdir(arch, create_dir=create_dir), "variants.xml")
         return path
 
+    def checksum_cache(self, create_dir=True):
+        """
+        Examples:
+            work/global/checksum-cache.json
+        """
+        return os.path.join(
+            self.topdir("global", create_dir=create_dir), "checksum-cache.json"
+        )
+
     def comps(self, arch=None, variant=None, create_dir=True):
         """
         Examples:
@@ -241,6 +264,16 @@ class WorkPaths(object):
             makedirs(path)
         return path
 
+    def solv_cache_dir(self, create_dir=True):
+        """
+        Examples:
+            work/global/solv-cache
+        """
+        path = os.path.join(self.topdir(create_dir=create_dir), "solv-cache")
+        if create_dir:
+            makedirs(path)
+        return path
+
     def _repo(self, type, arch=None, variant=None, create_dir=True):
         arch = arch or "global"
         path = os.path.join(self.topdir(arch, create_dir=create_dir), "%s_repo" % type)
@@ -520,6 +553,17 @@ class WorkPaths(object):
         filename = "pkgset_%s_file_cache.pickle" % pkgset_name
         return os.path.join(self.topdir(arch="global"), filename)
 
+    def pkgset_header_index(self, pkgset_name):
+        """
+        Returns the path to the RpmHeaderIndex database with header fields of
+        all packages in PackageSetBase.file_cache.
+
+        Example:
+            work/global/pkgset_f33-compose_header_index.sqlite
+        """
+        filename = "pkgset_%s_header_index.sqlite" % pkgset_name
+        return os.path.join(self.topdir(arch="global"), filename)
+
     def pkgset_reuse_file(self, pkgset_name):
         """
         Example:
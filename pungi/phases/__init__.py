@@ -17,7 +17,7 @@ import sys
 
 # phases in runtime order
 from .init import InitPhase  # noqa
-from .weaver import WeaverPhase  # noqa
+from .weaver import WeaverPhase, GraphWeaverPhase  # noqa
 from .pkgset import PkgsetPhase  # noqa
 from .gather import GatherPhase  # noqa
 from .createrepo import CreaterepoPhase  # noqa
@@ -26,10 +26,13 @@ from kobo.threads import ThreadPool, WorkerThread
 from kobo.shortcuts import run, relative_path
 from six.moves import shlex_quote
 
+from pungi import dedup
 from pungi.wrappers import iso
+from pungi.wrappers import createrepo_lib
 from pungi.wrappers.createrepo import CreaterepoWrapper
 from pungi.wrappers import kojiwrapper
 from pungi.phases.base import PhaseBase, PhaseLoggerMixin
+from pungi.phases.createrepo import get_fragment_cache
 from pungi.util import (
     makedirs,
     get_volid,
@@ -38,6 +41,7 @@ from pungi.util import (
     get_file_size,
     get_mtime,
     read_json_file,
+    copy_file,
 )
 from pungi.media_split import MediaSplitter, convert_media_size
 from pungi.compose_metadata.discinfo import read_discinfo, write_discinfo
@@ -49,10 +53,14 @@ from .. import createiso
 class CreateisoPhase(PhaseLoggerMixin, PhaseBase):
     name = "createiso"
 
-    def __init__(self, compose, buildinstall_phase):
+    def __init__(self, compose, buildinstall_phase, stream=False):
         super(CreateisoPhase, self).__init__(compose)
         self.pool = ThreadPool(logger=self.logger)
         self.bi = buildinstall_phase
+        # In stream mode nothing is queued when the phase starts. Instead
+        # `queue_item` is called for each item from `get_items` (e.g. once
+        # metadata of the tree is written) before the phase is stopped.
+        self.stream = stream
 
     def _find_rpms(self, path):
         """Check if there are some RPMs in the path."""
@@ -237,130 +245,151 @@ class CreateisoPhase(PhaseLoggerMixin, PhaseBase):
             self.compose.traceback("createiso-reuse-%s-%s" % (variant, arch))
             return False
 
-    def run(self):
-        symlink_isos_to = self.compose.conf.get("symlink_isos_to")
-        disc_type = self.compose.conf["disc_types"].get("dvd", "dvd")
-        deliverables = []
-
-        commands = []
+    def get_items(self):
+        """Return list of (variant, arch) tuples ISOs can be created for."""
+        items = []
         for variant in self.compose.get_variants(
             types=["variant", "layered-product", "optional"]
         ):
             if variant.is_empty:
                 continue
             for arch in variant.arches + ["src"]:
-                skip_iso = get_arch_variant_data(
-                    self.compose.conf, "createiso_skip", arch, variant
-                )
-                if skip_iso == [True]:
-                    self.logger.info(
-                        "Skipping createiso for %s.%s due to config option"
-                        % (variant, arch)
-                    )
-                    continue
+                items.append((variant, arch))
+        return items
 
-                volid = get_volid(self.compose, arch, variant, disc_type=disc_type)
-                os_tree = self.compose.paths.compose.os_tree(arch, variant)
+    def _get_commands(self, variant, arch, deliverables):
+        """Prepare ISOs for the variant and arch. Returns list of commands
+        to run, paths of the images are added to `deliverables`.
+        """
+        symlink_isos_to = self.compose.conf.get("symlink_isos_to")
+        disc_type = self.compose.conf["disc_types"].get("dvd", "dvd")
+        commands = []
+        skip_iso = get_arch_variant_data(
+            self.compose.conf, "createiso_skip", arch, variant
+        )
+        if skip_iso == [True]:
+            self.logger.info(
+                "Skipping createiso for %s.%s due to config option" % (variant, arch)
+            )
+            return commands
 
-                iso_dir = self.compose.paths.compose.iso_dir(
-                    arch, variant, symlink_to=symlink_isos_to
-                )
-                if not iso_dir:
-                    continue
+        volid = get_volid(self.compose, arch, variant, disc_type=disc_type)
+        os_tree = self.compose.paths.compose.os_tree(arch, variant)
 
-                if not self._find_rpms(os_tree):
-                    self.logger.warning(
-                        "No RPMs found for %s.%s, skipping ISO" % (variant.uid, arch)
-                    )
-                    continue
+        iso_dir = self.compose.paths.compose.iso_dir(
+            arch, variant, symlink_to=symlink_isos_to
+        )
+        if not iso_dir:
+            return commands
 
-                bootable = self._is_bootable(variant, arch)
+        if not self._find_rpms(os_tree):
+            self.logger.warning(
+                "No RPMs found for %s.%s, skipping ISO" % (variant.uid, arch)
+            )
+            return commands
 
-                if bootable and not self.bi.succeeded(variant, arch):
-                    self.logger.warning(
-                        "ISO should be bootable, but buildinstall failed. "
-                        "Skipping for %s.%s" % (variant, arch)
-                    )
-                    continue
+        bootable = self._is_bootable(variant, arch)
 
-                split_iso_data = split_iso(
-                    self.compose, arch, variant, no_split=bootable, logger=self.logger
+        if bootable and not self.bi.succeeded(variant, arch):
+            self.logger.warning(
+                "ISO should be bootable, but buildinstall failed. "
+                "Skipping for %s.%s" % (variant, arch)
+            )
+            return commands
+
+        split_iso_data = split_iso(
+            self.compose, arch, variant, no_split=bootable, logger=self.logger
+        )
+        disc_count = len(split_iso_data)
+
+        for disc_num, iso_data in enumerate(split_iso_data):
+            disc_num += 1
+
+            filename = self.compose.get_image_name(
+                arch, variant, disc_type=disc_type, disc_num=disc_num
+            )
+            iso_path = self.compose.paths.compose.iso_path(
+                arch, variant, filename, symlink_to=symlink_isos_to
+            )
+            if os.path.isfile(iso_path):
+                self.logger.warning(
+                    "Skipping mkisofs, image already exists: %s", iso_path
                 )
-                disc_count = len(split_iso_data)
+                continue
+            deliverables.append(iso_path)
 
-                for disc_num, iso_data in enumerate(split_iso_data):
-                    disc_num += 1
+            graft_points = prepare_iso(
+                self.compose,
+                arch,
+                variant,
+                disc_num=disc_num,
+                disc_count=disc_count,
+                split_iso_data=iso_data,
+            )
 
-                    filename = self.compose.get_image_name(
-                        arch, variant, disc_type=disc_type, disc_num=disc_num
-                    )
-                    iso_path = self.compose.paths.compose.iso_path(
-                        arch, variant, filename, symlink_to=symlink_isos_to
-                    )
-                    if os.path.isfile(iso_path):
-                        self.logger.warning(
-                            "Skipping mkisofs, image already exists: %s", iso_path
-                        )
-                        continue
-                    deliverables.append(iso_path)
-
-                    graft_points = prepare_iso(
-                        self.compose,
-                        arch,
-                        variant,
-                        disc_num=disc_num,
-                        disc_count=disc_count,
-                        split_iso_data=iso_data,
-                    )
+            cmd = {
+                "iso_path": iso_path,
+                "bootable": bootable,
+                "cmd": [],
+                "label": "",  # currently not used
+                "disc_num": disc_num,
+                "disc_count": disc_count,
+            }
+
+            if os.path.islink(iso_dir):
+                cmd["mount"] = os.path.abspath(
+                    os.path.join(os.path.dirname(iso_dir), os.readlink(iso_dir))
+                )
 
-                    cmd = {
-                        "iso_path": iso_path,
-                        "bootable": bootable,
-                        "cmd": [],
-                        "label": "",  # currently not used
-                        "disc_num": disc_num,
-                        "disc_count": disc_count,
-                    }
-
-                    if os.path.islink(iso_dir):
-                        cmd["mount"] = os.path.abspath(
-                            os.path.join(os.path.dirname(iso_dir), os.readlink(iso_dir))
-                        )
-
-                    opts = createiso.CreateIsoOpts(
-                        output_dir=iso_dir,
-                        iso_name=filename,
-                        volid=volid,
-                        graft_points=graft_points,
-                        arch=arch,
-                        supported=self.compose.supported,
-                        hfs_compat=self.compose.conf["iso_hfs_ppc64le_compatible"],
-                        use_xorrisofs=self.compose.conf.get("createiso_use_xorrisofs"),
-                        iso_level=self.compose.conf.get("iso_level"),
-                    )
+            opts = createiso.CreateIsoOpts(
+                output_dir=iso_dir,
+                iso_name=filename,
+                volid=volid,
+                graft_points=graft_points,
+                arch=arch,
+                supported=self.compose.supported,
+                hfs_compat=self.compose.conf["iso_hfs_ppc64le_compatible"],
+                use_xorrisofs=self.compose.conf.get("createiso_use_xorrisofs"),
+                iso_level=self.compose.conf.get("iso_level"),
+            )
 
-                    if bootable:
-                        opts = opts._replace(
-                            buildinstall_method=self.compose.conf["buildinstall_method"]
-                        )
+            if bootable:
+                opts = opts._replace(
+                    buildinstall_method=self.compose.conf["buildinstall_method"]
+                )
 
-                    if self.compose.conf["create_jigdo"]:
-                        jigdo_dir = self.compose.paths.compose.jigdo_dir(arch, variant)
-                        opts = opts._replace(jigdo_dir=jigdo_dir, os_tree=os_tree)
+            if self.compose.conf["create_jigdo"]:
+                jigdo_dir = self.compose.paths.compose.jigdo_dir(arch, variant)
+                opts = opts._replace(jigdo_dir=jigdo_dir, os_tree=os_tree)
 
-                    # Try to reuse
-                    if self.try_reuse(cmd, variant, arch, opts):
-                        # Reuse was successful, go to next ISO
-                        continue
+            # Try to reuse
+            if self.try_reuse(cmd, variant, arch, opts):
+                # Reuse was successful, go to next ISO
+                continue
 
-                    script_file = os.path.join(
-                        self.compose.paths.work.tmp_dir(arch, variant),
-                        "createiso-%s.sh" % filename,
-                    )
-                    with open(script_file, "w") as f:
-                        createiso.write_script(opts, f)
-                    cmd["cmd"] = ["bash", script_file]
-                    commands.append((cmd, variant, arch))
+            script_file = os.path.join(
+                self.compose.paths.work.tmp_dir(arch, variant),
+                "createiso-%s.sh" % filename,
+            )
+            with open(script_file, "w") as f:
+                createiso.write_script(opts, f)
+            cmd["cmd"] = ["bash", script_file]
+            commands.append((cmd, variant, arch))
+        return commands
+
+    def run(self):
+        if self.stream:
+            # Items are queued later, there is one worker for each of them.
+            # Discs of a split ISO are created one after another.
+            for _ in self.get_items():
+                self.pool.add(CreateIsoThread(self.pool))
+            self.pool.start()
+            return
+
+        deliverables = []
+        commands = []
+        for variant, arch in self.get_items():
+            commands.extend(self._get_commands(variant, arch, deliverables))
 
         if self.compose.notifier:
             self.compose.notifier.send("createiso-targets", deliverables=deliverables)
@@ -371,6 +400,19 @@ class CreateisoPhase(PhaseLoggerMixin, PhaseBase):
 
         self.pool.start()
 
+    def queue_item(self, variant, arch):
+        """Prepare and queue ISOs for a single variant and arch. This is only
+        used in stream mode, after the phase is started.
+        """
+        if self._skipped:
+            return
+        deliverables = []
+        commands = self._get_commands(variant, arch, deliverables)
+        if self.compose.notifier and deliverables:
+            self.compose.notifier.send("createiso-targets", deliverables=deliverables)
+        for cmd, _, _ in commands:
+            self.pool.queue_put((self.compose, cmd, variant, arch))
+
 
 def read_packages(graft_points):
     """Read packages that were listed in given graft points file.
@@ -561,6 +603,20 @@ def run_createiso_command(num, compose, bootable, arch, cmd, mounts, log_file):
     )
 
 
+def _get_srpm_by_path(compose, variant):
+    """Return a dict mapping absolute path of each package of the variant in
+    RPM manifest to N-E:V-R.A of its source package.
+    """
+    topdir = compose.paths.compose.topdir()
+    result = {}
+    arches = compose.get_rpm_manifest().rpms.get(variant.uid, {})
+    for srpms in arches.values():
+        for srpm_nevra, rpms in srpms.items():
+            for rpm in rpms.values():
+                result[os.path.join(topdir, rpm["path"])] = srpm_nevra
+    return result
+
+
 def split_iso(compose, arch, variant, no_split=False, logger=None):
     """
     Split contents of the os/ directory for given tree into chunks fitting on ISO.
@@ -580,6 +636,8 @@ def split_iso(compose, arch, variant, no_split=False, logger=None):
     real_size = None if no_split else split_size
 
     ms = MediaSplitter(real_size, compose, logger=logger)
+    packed = compose.conf["split_iso_method"] == "first-fit-decreasing"
+    srpms = _get_srpm_by_path(compose, variant) if packed else {}
 
     os_tree = compose.paths.compose.os_tree(arch, variant)
     extra_files_dir = compose.paths.work.extra_files_dir(arch, variant)
@@ -624,11 +682,15 @@ def split_iso(compose, arch, variant, no_split=False, logger=None):
             else:
                 all_files.append((path, os.path.getsize(path), sticky))
 
-    for path, size, sticky in all_files + packages:
+    for path, size, sticky in all_files:
         ms.add_file(path, size, sticky)
+    for path, size, sticky in packages:
+        # Packages built from the same source are kept together. Packages
+        # unknown to the manifest can go anywhere.
+        ms.add_file(path, size, sticky, group=srpms.get(path, path))
 
     logger.debug("Splitting media for %s.%s:" % (variant.uid, arch))
-    result = ms.split()
+    result = ms.split_packed() if packed else ms.split()
     if no_split and result[0]["size"] > split_size:
         logger.warning(
             "ISO for %s.%s does not fit on single media! It is %s bytes too big. "
@@ -672,7 +734,14 @@ def prepare_iso(
             rel_path = relative_path(i, tree_dir.rstrip("/") + "/")
             file_list_content.append(rel_path)
 
-        if file_list_content:
+        if file_list_content and _can_write_iso_repo_in_process(compose):
+            _write_iso_repo_in_process(
+                compose, tree_dir, iso_dir, file_list_content, createrepo_checksum
+            )
+            ti.checksums.add(
+                "repodata/repomd.xml", createrepo_checksum, root_dir=iso_dir
+            )
+        elif file_list_content:
             # write modified repodata only if there are packages available
             run("cp -a %s/repodata %s/" % (shlex_quote(tree_dir), shlex_quote(iso_dir)))
             with open(file_list, "w") as f:
@@ -715,18 +784,14 @@ def prepare_iso(
         compose.log_debug(
             "Breaking hardlinks for ISO %s for %s.%s" % (filename, variant, arch)
         )
-        break_hardlinks(
-            data, compose.paths.work.iso_staging_dir(arch, variant, filename)
+        saved = break_hardlinks(
+            data,
+            compose.paths.work.iso_staging_dir(arch, variant, filename),
+            cache=compose.get_checksum_cache(),
         )
-        # Create hardlinks for files with duplicate contents.
         compose.log_debug(
-            "Creating hardlinks for ISO %s for %s.%s" % (filename, variant, arch)
-        )
-        create_hardlinks(
-            compose.paths.work.iso_staging_dir(arch, variant, filename),
-            log_file=compose.paths.log.log_file(
-                arch, "iso-hardlink-%s.log" % variant.uid
-            ),
+            "Hardlinking identical files for ISO %s for %s.%s saved %s bytes"
+            % (filename, variant, arch, saved)
         )
 
     # TODO: /content /graft-points
@@ -735,6 +800,35 @@ def prepare_iso(
     return gp
 
 
+def _can_write_iso_repo_in_process(compose):
+    """The Python bindings can not create the sqlite database, so the
+    executable is still needed for composes that want it.
+    """
+    return (
+        compose.conf["createrepo_in_process"] and not compose.should_create_yum_database
+    )
+
+
+def _write_iso_repo_in_process(compose, tree_dir, iso_dir, rel_paths, checksum):
+    """Create repodata for packages on one disc of a split ISO. Metadata of the
+    packages is taken from the repo in `tree_dir`, the RPMs are only read if
+    they changed since it was created.
+    """
+    cache = createrepo_lib.PackageCache(get_fragment_cache(compose))
+    nevras = cache.get_nevras(tree_dir)
+    items = [
+        (os.path.join(tree_dir, rel_path), rel_path, nevras.get(rel_path))
+        for rel_path in rel_paths
+    ]
+    packages = cache.get_packages(
+        items,
+        checksum,
+        [tree_dir],
+        num_workers=compose.conf["createrepo_num_workers"],
+    )
+    createrepo_lib.write_repo(iso_dir, packages, checksum_type=checksum)
+
+
 def load_and_tweak_treeinfo(ti_path, disc_num=1, disc_count=1):
     """Treeinfo on the media should not contain any reference to boot.iso and
     it should also have a valid [media] section.
@@ -767,28 +861,25 @@ def copy_boot_images(src, dest):
         dst_path = os.path.join(dest, i)
         if os.path.exists(src_path):
             makedirs(os.path.dirname(dst_path))
-            shutil.copy2(src_path, dst_path)
+            copy_file(src_path, dst_path)
 
 
-def break_hardlinks(graft_points, staging_dir):
+def break_hardlinks(graft_points, staging_dir, cache=None):
     """Iterate over graft points and copy any file that has more than 1
     hardlink into the staging directory. Replace the entry in the dict.
+    Files with identical content are only copied once and hardlinked to each
+    other in the staging directory.
+
+    :return: number of bytes saved by hardlinking
     """
+    files = {}
     for f in graft_points:
         info = os.stat(graft_points[f])
         if stat.S_ISREG(info.st_mode) and info.st_nlink > 1:
             dest_path = os.path.join(staging_dir, graft_points[f].lstrip("/"))
-            makedirs(os.path.dirname(dest_path))
-            shutil.copy2(graft_points[f], dest_path)
+            files[dest_path] = graft_points[f]
             graft_points[f] = dest_path
-
-
-def create_hardlinks(staging_dir, log_file):
-    """Create hardlinks within the staging directory.
-    Should happen after break_hardlinks()
-    """
-    cmd = ["/usr/sbin/hardlink", "-c", "-vv", staging_dir]
-    run(cmd, logfile=log_file, show_cmd=True)
+    return dedup.copy_deduplicated(files, cache=cache)
 
 
 class OldFileLinker(object):
@@ -25,8 +25,7 @@ import threading
 import xml.dom.minidom
 
 import productmd.modules
-import productmd.rpms
-from kobo.shortcuts import relative_path, run
+from kobo.shortcuts import force_list, relative_path, run
 from kobo.threads import ThreadPool, WorkerThread
 
 from ..module_util import Modulemd, collect_module_defaults
@@ -36,22 +35,43 @@ from ..util import (
     temp_dir,
 )
 from ..wrappers.createrepo import CreaterepoWrapper
+from ..wrappers import createrepo_lib
 from ..wrappers.scm import get_dir_from_scm
 from .base import PhaseBase
 
 CACHE_TOPDIR = "/var/cache/pungi/createrepo_c/"
 createrepo_lock = threading.Lock()
 createrepo_dirs = set()
+# Package metadata shared by repos created in process. It is created for the
+# first such repo in pkgset phase and released when createrepo phase stops.
+package_cache = None
+fragment_cache_lock = threading.Lock()
+fragment_cache_pruned = False
 
 
 class CreaterepoPhase(PhaseBase):
     name = "createrepo"
 
-    def __init__(self, compose, pkgset_phase=None):
+    def __init__(self, compose, pkgset_phase=None, gather_phase=None):
         PhaseBase.__init__(self, compose)
         self.pool = ThreadPool(logger=self.compose._logger)
         self.modules_metadata = ModulesMetadata(compose)
         self.pkgset_phase = pkgset_phase
+        # If gather phase is given, repos are created as soon as packages for
+        # them are linked instead of waiting for the whole phase to finish.
+        self.gather_phase = gather_phase
+        self._linked_arches = {}
+        self._linked_lock = threading.Lock()
+        # Repo types created for each (variant uid, arch), and variant and
+        # arch combinations with all repos created along with callbacks to
+        # notify about new ones.
+        self._created_types = {}
+        self._created = []
+        self._created_listeners = []
+        self._created_lock = threading.Lock()
+
+    def _stream_from_gather(self):
+        return self.gather_phase is not None and not self.gather_phase.skip()
 
     def validate(self):
         errors = []
@@ -67,9 +87,18 @@ class CreaterepoPhase(PhaseBase):
         reference_pkgset = None
         if self.pkgset_phase and self.pkgset_phase.package_sets:
             reference_pkgset = self.pkgset_phase.package_sets[-1]
+        manifest = None
+        if self._stream_from_gather():
+            manifest = self.gather_phase.manifest
         for i in range(self.compose.conf["createrepo_num_threads"]):
             self.pool.add(
-                CreaterepoThread(self.pool, reference_pkgset, self.modules_metadata)
+                CreaterepoThread(
+                    self.pool,
+                    reference_pkgset,
+                    self.modules_metadata,
+                    manifest,
+                    repo_created=self._repo_created,
+                )
             )
 
         for variant in self.compose.get_variants():
@@ -84,20 +113,78 @@ class CreaterepoPhase(PhaseBase):
                     compose=self.compose,
                 )
 
+            if self._stream_from_gather():
+                continue
+
             self.pool.queue_put((self.compose, None, variant, "srpm"))
             for arch in variant.arches:
                 self.pool.queue_put((self.compose, arch, variant, "rpm"))
                 self.pool.queue_put((self.compose, arch, variant, "debuginfo"))
 
+        if self._stream_from_gather():
+            self.gather_phase.add_linked_listener(self._queue_linked)
+
         self.pool.start()
 
+    def _queue_linked(self, variant, arch):
+        """Queue repos for packages of variant and arch that were just linked
+        by gather phase. The source repo is queued once all arches of the
+        variant are linked.
+        """
+        if variant.is_empty:
+            return
+        self.pool.queue_put((self.compose, arch, variant, "rpm"))
+        self.pool.queue_put((self.compose, arch, variant, "debuginfo"))
+        with self._linked_lock:
+            linked = self._linked_arches.setdefault(variant.uid, set())
+            linked.add(arch)
+            all_linked = linked.issuperset(variant.arches)
+        if all_linked:
+            self.pool.queue_put((self.compose, None, variant, "srpm"))
+
+    def add_repo_listener(self, callback):
+        """Call ``callback(variant, arch)`` every time all repos of a variant
+        and arch are created, i.e. binary and debuginfo repo for a real arch
+        and source repo for ``src``. The callback is called immediately for
+        combinations that were created before it was added.
+        """
+        with self._created_lock:
+            self._created_listeners.append(callback)
+            created = list(self._created)
+        for variant, arch in created:
+            callback(variant, arch)
+
+    def _repo_created(self, variant, arch, pkg_type):
+        arch = arch or "src"
+        expected = set(["srpm"]) if arch == "src" else set(["rpm", "debuginfo"])
+        with self._created_lock:
+            types = self._created_types.setdefault((variant.uid, arch), set())
+            types.add(pkg_type)
+            if types != expected:
+                return
+            self._created.append((variant, arch))
+            listeners = list(self._created_listeners)
+        for callback in listeners:
+            callback(variant, arch)
+
     def stop(self):
-        super(CreaterepoPhase, self).stop()
+        if self._stream_from_gather():
+            # The pool would stop once the queue is empty, but gather may
+            # still add more repos.
+            if not self.gather_phase.wait_until_linked():
+                self.compose.log_warning(
+                    "Gather phase failed, not all repositories were queued"
+                )
+        try:
+            super(CreaterepoPhase, self).stop()
+        finally:
+            # No other repos will be created, the loaded metadata can go.
+            release_package_cache()
         self.modules_metadata.write_modules_metadata()
 
 
 def create_variant_repo(
-    compose, arch, variant, pkg_type, pkgset, modules_metadata=None
+    compose, arch, variant, pkg_type, pkgset, modules_metadata=None, manifest=None
 ):
     types = {
         "rpm": (
@@ -127,7 +214,6 @@ def create_variant_repo(
         return
 
     createrepo_c = compose.conf["createrepo_c"]
-    createrepo_checksum = compose.conf["createrepo_checksum"]
     repo = CreaterepoWrapper(createrepo_c=createrepo_c)
     repo_dir_arch = None
     if pkgset:
@@ -155,25 +241,20 @@ def create_variant_repo(
     # We only want delta RPMs for binary repos.
     with_deltas = pkg_type == "rpm" and _has_deltas(compose, variant, arch)
 
-    rpms = set()
-    rpm_nevras = set()
+    rpms = {}
 
-    # read rpms from metadata rather than guessing it by scanning filesystem
-    manifest_file = compose.paths.compose.metadata("rpms.json")
-    manifest = productmd.rpms.Rpms()
-    manifest.load(manifest_file)
+    if manifest is None:
+        manifest = compose.get_rpm_manifest()
 
-    for rpms_arch, data in manifest.rpms.get(variant.uid, {}).items():
-        if arch is not None and arch != rpms_arch:
-            continue
-        for srpm_data in data.values():
-            for rpm_nevra, rpm_data in srpm_data.items():
-                if types[pkg_type][0] != rpm_data["category"]:
-                    continue
-                path = os.path.join(compose.topdir, "compose", rpm_data["path"])
-                rel_path = relative_path(path, repo_dir.rstrip("/") + "/")
-                rpms.add(rel_path)
-                rpm_nevras.add(str(rpm_nevra))
+    # The manifest may be shared with gather phase, which can still be adding
+    # other arches of this variant. Data for the arches needed here is
+    # complete already.
+    for rpm_nevra, rpm_path in manifest.get_packages(
+        variant.uid, arch, types[pkg_type][0]
+    ):
+        path = os.path.join(compose.topdir, "compose", rpm_path)
+        rel_path = relative_path(path, repo_dir.rstrip("/") + "/")
+        rpms[rel_path] = (path, str(rpm_nevra))
 
     file_list = compose.paths.work.repo_package_list(arch, variant, pkg_type)
     with open(file_list, "w") as f:
@@ -188,10 +269,140 @@ def create_variant_repo(
         # This seems to only affect createrepo_c though.
         repo_dir_arch = None
 
+    old_repo_dir = None
+    if compose.conf["createrepo_incremental"] and not with_deltas:
+        old_repo_dir = _get_old_repo_dir(compose, repo_dir)
+
     comps_path = None
     if compose.has_comps and pkg_type == "rpm":
         comps_path = compose.paths.work.comps(arch=arch, variant=variant)
 
+    product_id_path = None
+    if compose.conf.get("product_id") and pkg_type == "rpm":
+        # add product certificate to base (rpm) repo; skip source and debug
+        product_id_path = compose.paths.work.product_id(arch, variant)
+        if not os.path.isfile(product_id_path):
+            product_id_path = None
+
+    mod_index = None
+    metadata = []
+    if pkg_type == "rpm" and arch in variant.arch_mmds and Modulemd is not None:
+        mod_index, metadata = _get_module_index(
+            compose, variant, arch, modules_metadata
+        )
+
+    in_process = (
+        compose.conf["createrepo_in_process"]
+        and not with_deltas
+        and not compose.conf["createrepo_extra_args"]
+        and not compose.should_create_yum_database
+    )
+    if in_process:
+        _write_repo_in_process(
+            compose,
+            repo_dir,
+            rpms,
+            repo_dir_arch,
+            old_repo_dir,
+            comps_path,
+            product_id_path,
+            mod_index,
+        )
+    else:
+        _run_createrepo(
+            compose,
+            repo,
+            repo_dir,
+            file_list,
+            arch,
+            variant,
+            pkg_type,
+            comps_path,
+            repo_dir_arch,
+            old_repo_dir,
+            with_deltas,
+            old_package_dirs,
+            product_id_path,
+            mod_index,
+        )
+
+    if product_id_path:
+        # productinfo is not supported by modifyrepo in any way
+        # this is a HACK to make CDN happy (dmach: at least I think,
+        # need to confirm with dgregor)
+        shutil.copy2(product_id_path, os.path.join(repo_dir, "repodata", "productid"))
+
+    for module_id, module_rpms in metadata:
+        modulemd_path = os.path.join(
+            types[pkg_type][1](relative=True),
+            find_file_in_repodata(repo_dir, "modules"),
+        )
+        modules_metadata.prepare_module_metadata(
+            variant,
+            arch,
+            module_id,
+            modulemd_path,
+            types[pkg_type][0],
+            list(module_rpms),
+        )
+
+    compose.log_info("[DONE ] %s" % msg)
+
+
+def _get_module_index(compose, variant, arch, modules_metadata):
+    """Build module index for given variant and arch. Returns the index and a
+    list of (module_id, rpms) tuples for modules metadata.
+    """
+    mod_index = Modulemd.ModuleIndex()
+    metadata = []
+
+    for module_id, mmd in variant.arch_mmds.get(arch, {}).items():
+        if modules_metadata:
+            module_rpms = mmd.get_rpm_artifacts()
+            metadata.append((module_id, module_rpms))
+        mod_index.add_module_stream(mmd)
+
+    module_names = set(mod_index.get_module_names())
+    defaults_dir = compose.paths.work.module_defaults_dir()
+    overrides_dir = compose.conf.get("module_defaults_override_dir")
+    collect_module_defaults(
+        defaults_dir, module_names, mod_index, overrides_dir=overrides_dir
+    )
+
+    # Add extra modulemd files
+    if variant.uid in compose.conf.get("createrepo_extra_modulemd", {}):
+        compose.log_debug("Adding extra modulemd for %s.%s", variant.uid, arch)
+        dirname = compose.paths.work.tmp_dir(variant=variant, create_dir=False)
+        for filepath in glob.glob(os.path.join(dirname, arch) + "/*.yaml"):
+            module_stream = read_single_module_stream_from_file(filepath)
+            if not mod_index.add_module_stream(module_stream):
+                raise RuntimeError("Failed parsing modulemd data from %s" % filepath)
+            # Add the module to metadata with dummy tag. We can't leave the
+            # value empty, but we don't know what the correct tag is.
+            nsvc = module_stream.get_nsvc()
+            variant.module_uid_to_koji_tag[nsvc] = "DUMMY"
+            metadata.append((nsvc, []))
+
+    return mod_index, metadata
+
+
+def _run_createrepo(
+    compose,
+    repo,
+    repo_dir,
+    file_list,
+    arch,
+    variant,
+    pkg_type,
+    comps_path,
+    repo_dir_arch,
+    old_repo_dir,
+    with_deltas,
+    old_package_dirs,
+    product_id_path,
+    mod_index,
+):
+    """Create the repository by running createrepo_c and modifyrepo_c."""
     if compose.conf["createrepo_enable_cache"]:
         cachedir = os.path.join(
             CACHE_TOPDIR,
@@ -208,6 +419,11 @@ def create_variant_repo(
                 cachedir = None
     else:
         cachedir = None
+    update_md_path = repo_dir_arch
+    if old_repo_dir:
+        # Metadata of the same repo in old compose is the best match, it is
+        # only missing changed packages.
+        update_md_path = [old_repo_dir] + force_list(repo_dir_arch or [])
     cmd = repo.get_createrepo_cmd(
         repo_dir,
         update=True,
@@ -217,8 +433,8 @@ def create_variant_repo(
         outputdir=repo_dir,
         workers=compose.conf["createrepo_num_workers"],
         groupfile=comps_path,
-        update_md_path=repo_dir_arch,
-        checksum=createrepo_checksum,
+        update_md_path=update_md_path,
+        checksum=compose.conf["createrepo_checksum"],
         deltas=with_deltas,
         oldpackagedirs=old_package_dirs,
         use_xz=compose.conf["createrepo_use_xz"],
@@ -231,75 +447,111 @@ def create_variant_repo(
     run(cmd, logfile=log_file, show_cmd=True)
 
     # call modifyrepo to inject productid
-    product_id = compose.conf.get("product_id")
-    if product_id and pkg_type == "rpm":
-        # add product certificate to base (rpm) repo; skip source and debug
-        product_id_path = compose.paths.work.product_id(arch, variant)
-        if os.path.isfile(product_id_path):
-            cmd = repo.get_modifyrepo_cmd(
-                os.path.join(repo_dir, "repodata"), product_id_path, compress_type="gz"
-            )
-            log_file = compose.paths.log.log_file(arch, "modifyrepo-%s" % variant)
-            run(cmd, logfile=log_file, show_cmd=True)
-            # productinfo is not supported by modifyrepo in any way
-            # this is a HACK to make CDN happy (dmach: at least I think,
-            # need to confirm with dgregor)
-            shutil.copy2(
-                product_id_path, os.path.join(repo_dir, "repodata", "productid")
-            )
-
-    # call modifyrepo to inject modulemd if needed
-    if pkg_type == "rpm" and arch in variant.arch_mmds and Modulemd is not None:
-        mod_index = Modulemd.ModuleIndex()
-        metadata = []
-
-        for module_id, mmd in variant.arch_mmds.get(arch, {}).items():
-            if modules_metadata:
-                module_rpms = mmd.get_rpm_artifacts()
-                metadata.append((module_id, module_rpms))
-            mod_index.add_module_stream(mmd)
-
-        module_names = set(mod_index.get_module_names())
-        defaults_dir = compose.paths.work.module_defaults_dir()
-        overrides_dir = compose.conf.get("module_defaults_override_dir")
-        collect_module_defaults(
-            defaults_dir, module_names, mod_index, overrides_dir=overrides_dir
+    if product_id_path:
+        cmd = repo.get_modifyrepo_cmd(
+            os.path.join(repo_dir, "repodata"), product_id_path, compress_type="gz"
         )
+        log_file = compose.paths.log.log_file(arch, "modifyrepo-%s" % variant)
+        run(cmd, logfile=log_file, show_cmd=True)
 
-        # Add extra modulemd files
-        if variant.uid in compose.conf.get("createrepo_extra_modulemd", {}):
-            compose.log_debug("Adding extra modulemd for %s.%s", variant.uid, arch)
-            dirname = compose.paths.work.tmp_dir(variant=variant, create_dir=False)
-            for filepath in glob.glob(os.path.join(dirname, arch) + "/*.yaml"):
-                module_stream = read_single_module_stream_from_file(filepath)
-                if not mod_index.add_module_stream(module_stream):
-                    raise RuntimeError(
-                        "Failed parsing modulemd data from %s" % filepath
-                    )
-                # Add the module to metadata with dummy tag. We can't leave the
-                # value empty, but we don't know what the correct tag is.
-                nsvc = module_stream.get_nsvc()
-                variant.module_uid_to_koji_tag[nsvc] = "DUMMY"
-                metadata.append((nsvc, []))
-
+    # call modifyrepo to inject modulemd if needed
+    if mod_index:
         log_file = compose.paths.log.log_file(arch, "modifyrepo-modules-%s" % variant)
         add_modular_metadata(repo, repo_dir, mod_index, log_file)
 
-        for module_id, module_rpms in metadata:
-            modulemd_path = os.path.join(
-                types[pkg_type][1](relative=True),
-                find_file_in_repodata(repo_dir, "modules"),
-            )
-            modules_metadata.prepare_module_metadata(
-                variant,
-                arch,
-                module_id,
-                modulemd_path,
-                types[pkg_type][0],
-                list(module_rpms),
+
+def get_package_cache(compose):
+    """Return package cache shared by all repos created in process. Unless
+    disabled by configuration, it is backed by a persistent store of package
+    metadata shared with other composes.
+    """
+    global package_cache
+    with createrepo_lock:
+        if package_cache is None:
+            package_cache = createrepo_lib.PackageCache(get_fragment_cache(compose))
+        return package_cache
+
+
+def get_fragment_cache(compose):
+    """Return the persistent store of package metadata, or None if caching is
+    disabled. Fragments not used for ``createrepo_cache_max_age`` days are
+    removed the first time this is called in the compose.
+    """
+    global fragment_cache_pruned
+    if not compose.conf["createrepo_enable_cache"]:
+        return None
+    cache = createrepo_lib.FragmentCache(
+        os.path.join(CACHE_TOPDIR, "fragments-%s" % os.getuid())
+    )
+    with fragment_cache_lock:
+        max_age = compose.conf["createrepo_cache_max_age"]
+        if max_age and not fragment_cache_pruned:
+            fragment_cache_pruned = True
+            removed = cache.prune(max_age)
+            compose.log_debug(
+                "Removed %d package metadata fragments from %s", removed, cache.path
             )
+    return cache
 
-    compose.log_info("[DONE ] %s" % msg)
+
+def release_package_cache():
+    """Drop the shared package cache along with all repos loaded into it."""
+    global package_cache
+    with createrepo_lock:
+        package_cache = None
+
+
+def _write_repo_in_process(
+    compose,
+    repo_dir,
+    rpms,
+    repo_dir_arch,
+    old_repo_dir,
+    comps_path,
+    product_id_path,
+    mod_index,
+):
+    """Create the repository using createrepo_c Python bindings. Package
+    metadata is reused from the same repo in old compose or from the package
+    set repo where possible.
+    """
+    cache = get_package_cache(compose)
+    checksum = compose.conf["createrepo_checksum"]
+    repo_paths = [path for path in (old_repo_dir, repo_dir_arch) if path]
+    packages = [
+        cache.get_package(path, rel_path, nevra, checksum, repo_paths)
+        for rel_path, (path, nevra) in rpms.items()
+    ]
+
+    if old_repo_dir:
+        old_nevras = set(cache.get_repo(old_repo_dir))
+        new_nevras = set(nevra for _, nevra in rpms.values())
+        compose.log_info(
+            "Updating %s from %s: %d packages added, %d removed",
+            repo_dir,
+            old_repo_dir,
+            len(new_nevras - old_nevras),
+            len(old_nevras - new_nevras),
+        )
+
+    with temp_dir() as tmp_dir:
+        extra_files = []
+        if product_id_path:
+            extra_files.append(("productid", product_id_path))
+        if mod_index and mod_index.get_module_names():
+            modules_path = os.path.join(tmp_dir, "modules.yaml")
+            with open(modules_path, "w") as f:
+                f.write(mod_index.dump_to_string())
+            extra_files.append(("modules", modules_path))
+
+        createrepo_lib.write_repo(
+            repo_dir,
+            packages,
+            checksum_type=checksum,
+            use_xz=compose.conf["createrepo_use_xz"],
+            groupfile=comps_path,
+            extra_files=extra_files,
+        )
 
 
 def add_modular_metadata(repo, repo_path, mod_index, log_file):
@@ -332,10 +584,19 @@ def find_file_in_repodata(repo_path, type_):
 
 
 class CreaterepoThread(WorkerThread):
-    def __init__(self, pool, reference_pkgset, modules_metadata):
+    def __init__(
+        self,
+        pool,
+        reference_pkgset,
+        modules_metadata,
+        manifest=None,
+        repo_created=None,
+    ):
         super(CreaterepoThread, self).__init__(pool)
         self.reference_pkgset = reference_pkgset
         self.modules_metadata = modules_metadata
+        self.manifest = manifest
+        self.repo_created = repo_created
 
     def process(self, item, num):
         compose, arch, variant, pkg_type = item
@@ -346,7 +607,10 @@ class CreaterepoThread(WorkerThread):
             pkg_type=pkg_type,
             pkgset=self.reference_pkgset,
             modules_metadata=self.modules_metadata,
+            manifest=self.manifest,
         )
+        if self.repo_created:
+            self.repo_created(variant, arch, pkg_type)
 
 
 def get_productids_from_scm(compose):
@@ -430,6 +694,17 @@ def _get_old_package_dirs(compose, repo_dir):
     return old_package_dirs
 
 
+def _get_old_repo_dir(compose, repo_dir):
+    """Return path to the same repo in old compose, if it exists."""
+    old_repomd = compose.paths.old_compose_path(
+        os.path.join(repo_dir, "repodata", "repomd.xml")
+    )
+    if not old_repomd:
+        compose.log_debug("No old repo for %s", repo_dir)
+        return None
+    return os.path.dirname(os.path.dirname(old_repomd))
+
+
 def _find_package_dirs(base):
     """Assuming the packages are in directories hashed by first letter, find
     all the buckets in given base.
@@ -47,10 +47,17 @@ from pungi.wrappers.scm import get_dir_from_scm, get_file_from_scm
 class ExtraIsosPhase(PhaseLoggerMixin, ConfigGuardedPhase, PhaseBase):
     name = "extra_isos"
 
-    def __init__(self, compose, buildinstall_phase):
+    def __init__(self, compose, buildinstall_phase, stream=False):
         super(ExtraIsosPhase, self).__init__(compose)
         self.pool = ThreadPool(logger=self.logger)
         self.bi = buildinstall_phase
+        # In stream mode nothing is queued when the phase starts. Instead
+        # `queue_item` is called for each item from `get_items` before the
+        # phase is stopped.
+        self.stream = stream
+        # Content of variants does not change in this phase, and the same
+        # variant can be included in multiple images.
+        self.graft_tree_cache = iso.GraftTreeCache(compose.paths.compose.topdir())
 
     def validate(self):
         for variant in self.compose.get_variants(types=["variant"]):
@@ -62,7 +69,8 @@ class ExtraIsosPhase(PhaseLoggerMixin, ConfigGuardedPhase, PhaseBase):
                         % (variant, ", ".join(sorted(extra_arches)))
                     )
 
-    def run(self):
+    def get_items(self):
+        """Return list of (config, variant, arch) tuples, one for each image."""
         commands = []
 
         for variant in self.compose.get_variants(types=["variant"]):
@@ -74,18 +82,31 @@ class ExtraIsosPhase(PhaseLoggerMixin, ConfigGuardedPhase, PhaseBase):
                     arches.add("src")
                 for arch in sorted(arches):
                     commands.append((config, variant, arch))
+        return commands
+
+    def run(self):
+        commands = self.get_items()
 
         for (config, variant, arch) in commands:
-            self.pool.add(ExtraIsosThread(self.pool, self.bi))
-            self.pool.queue_put((self.compose, config, variant, arch))
+            self.pool.add(ExtraIsosThread(self.pool, self.bi, self.graft_tree_cache))
+            if not self.stream:
+                self.pool.queue_put((self.compose, config, variant, arch))
 
         self.pool.start()
 
+    def queue_item(self, config, variant, arch):
+        """Queue a single image. This is only used in stream mode, after the
+        phase is started.
+        """
+        if not self._skipped:
+            self.pool.queue_put((self.compose, config, variant, arch))
+
 
 class ExtraIsosThread(WorkerThread):
-    def __init__(self, pool, buildinstall_phase):
+    def __init__(self, pool, buildinstall_phase, graft_tree_cache=None):
         super(ExtraIsosThread, self).__init__(pool)
         self.bi = buildinstall_phase
+        self.graft_tree_cache = graft_tree_cache
 
     def process(self, item, num):
         self.num = num
@@ -119,6 +140,7 @@ class ExtraIsosThread(WorkerThread):
             filename,
             bootable=bootable,
             inherit_extra_files=config.get("inherit_extra_files", False),
+            graft_tree_cache=self.graft_tree_cache,
         )
 
         opts = createiso.CreateIsoOpts(
@@ -347,27 +369,42 @@ def get_extra_files(compose, variant, arch, extra_files):
             extra_files_dir,
             filelist,
             compose.conf["media_checksums"],
+            cache=compose.get_checksum_cache(),
         )
 
 
 def get_iso_contents(
-    compose, variant, arch, include_variants, filename, bootable, inherit_extra_files
+    compose,
+    variant,
+    arch,
+    include_variants,
+    filename,
+    bootable,
+    inherit_extra_files,
+    graft_tree_cache=None,
 ):
     """Find all files that should be on the ISO. For bootable image we start
     with the boot configuration. Then for each variant we add packages,
     repodata and extra files. Finally we add top-level extra files.
+
+    Content of variants is taken from `graft_tree_cache` if given, so that
+    a variant included in multiple images is only scanned once.
     """
     iso_dir = compose.paths.work.iso_dir(arch, filename)
+    if graft_tree_cache is None:
+        graft_tree_cache = iso.GraftTreeCache(compose.paths.compose.topdir())
 
-    files = {}
+    files = iso.GraftTree()
     if bootable:
         buildinstall_dir = compose.paths.work.buildinstall_dir(arch, create_dir=False)
         if compose.conf["buildinstall_method"] == "lorax":
             buildinstall_dir = os.path.join(buildinstall_dir, variant.uid)
 
         copy_boot_images(buildinstall_dir, iso_dir)
-        files = iso.get_graft_points(
-            compose.paths.compose.topdir(), [buildinstall_dir, iso_dir]
+        files.update(
+            iso.get_graft_points(
+                compose.paths.compose.topdir(), [buildinstall_dir, iso_dir]
+            )
         )
 
         # We need to point efiboot.img to compose/ tree, because it was
@@ -384,26 +421,19 @@ def get_iso_contents(
 
         # Get packages...
         package_dir = compose.paths.compose.packages(arch, var)
-        for k, v in iso.get_graft_points(
-            compose.paths.compose.topdir(), [package_dir]
-        ).items():
-            files[os.path.join(var.uid, "Packages", k)] = v
+        files.graft(
+            os.path.join(var.uid, "Packages"), graft_tree_cache.get(package_dir)
+        )
 
         # Get repodata...
         tree_dir = compose.paths.compose.repository(arch, var)
         repo_dir = os.path.join(tree_dir, "repodata")
-        for k, v in iso.get_graft_points(
-            compose.paths.compose.topdir(), [repo_dir]
-        ).items():
-            files[os.path.join(var.uid, "repodata", k)] = v
+        files.graft(os.path.join(var.uid, "repodata"), graft_tree_cache.get(repo_dir))
 
         if inherit_extra_files:
             # Get extra files...
             extra_files_dir = compose.paths.work.extra_files_dir(arch, var)
-            for k, v in iso.get_graft_points(
-                compose.paths.compose.topdir(), [extra_files_dir]
-            ).items():
-                files[os.path.join(var.uid, k)] = v
+            files.graft(var.uid, graft_tree_cache.get(extra_files_dir))
 
     extra_files_dir = compose.paths.work.extra_iso_extra_files_dir(arch, variant)
 
@@ -22,7 +22,6 @@ import threading
 
 from kobo.rpmlib import parse_nvra
 from kobo.shortcuts import run
-from productmd.rpms import Rpms
 from six.moves import cPickle as pickle
 
 try:
@@ -35,10 +34,19 @@ from pungi.arch import get_compatible_arches, split_name_arch
 from pungi.compose import get_ordered_variant_uids
 from pungi.module_util import Modulemd, collect_module_defaults
 from pungi.phases.base import PhaseBase
-from pungi.phases.createrepo import add_modular_metadata
-from pungi.util import get_arch_data, get_arch_variant_data, get_variant_data, makedirs
+from pungi.phases.createrepo import add_modular_metadata, get_package_cache
+from pungi.repo_cache import repo_cache
+from pungi.rpm_manifest import RpmManifest
+from pungi.util import (
+    get_arch_data,
+    get_arch_variant_data,
+    get_variant_data,
+    makedirs,
+    temp_dir,
+)
 from pungi.wrappers.scm import get_file_from_scm
 
+from ...wrappers import createrepo_lib
 from ...wrappers.createrepo import CreaterepoWrapper
 from .link import link_files
 
@@ -66,11 +74,18 @@ class GatherPhase(PhaseBase):
         self.pkgset_phase = pkgset_phase
         # Prepare empty manifest
         self.manifest_file = self.compose.paths.compose.metadata("rpms.json")
-        self.manifest = Rpms()
+        self.manifest = RpmManifest()
         self.manifest.compose.id = self.compose.compose_id
         self.manifest.compose.type = self.compose.compose_type
         self.manifest.compose.date = self.compose.compose_date
         self.manifest.compose.respin = self.compose.compose_respin
+        # Variant and arch combinations with packages already linked, and
+        # callbacks to notify about new ones.
+        self._linked = []
+        self._linked_listeners = []
+        self._linked_lock = threading.Lock()
+        self._finished = threading.Event()
+        self.failed = False
 
     def validate(self):
         errors = []
@@ -116,29 +131,73 @@ class GatherPhase(PhaseBase):
         self.compose.log_info("Writing RPM manifest: %s" % self.manifest_file)
         self.manifest.dump(self.manifest_file)
 
+    def add_linked_listener(self, callback):
+        """Call ``callback(variant, arch)`` every time packages for a variant
+        and arch are linked into the compose and added to the manifest. The
+        callback is called immediately for combinations that were linked
+        before it was added.
+
+        Linking only starts after all variants are solved, because trimming
+        of addons, layered products and optional variants can still move
+        packages to other variants.
+        """
+        with self._linked_lock:
+            self._linked_listeners.append(callback)
+            linked = list(self._linked)
+        for variant, arch in linked:
+            callback(variant, arch)
+
+    def _notify_linked(self, variant, arch):
+        with self._linked_lock:
+            self._linked.append((variant, arch))
+            listeners = list(self._linked_listeners)
+        for callback in listeners:
+            callback(variant, arch)
+
+    def wait_until_linked(self):
+        """Block until all packages are linked or the phase fails. Returns
+        True if the phase finished successfully.
+        """
+        self._finished.wait()
+        return not self.failed
+
     def run(self):
-        pkg_map = gather_wrapper(
-            self.compose, self.pkgset_phase.package_sets, self.pkgset_phase.path_prefix
-        )
+        self.compose.rpm_manifest = self.manifest
+        try:
+            pkg_map = gather_wrapper(
+                self.compose,
+                self.pkgset_phase.package_sets,
+                self.pkgset_phase.path_prefix,
+            )
 
-        for variant_uid in get_ordered_variant_uids(self.compose):
-            variant = self.compose.all_variants[variant_uid]
-            if variant.is_empty:
-                continue
-            for arch in variant.arches:
-                link_files(
-                    self.compose,
-                    arch,
-                    variant,
-                    pkg_map[arch][variant.uid],
-                    self.pkgset_phase.package_sets,
-                    manifest=self.manifest,
-                )
+            for variant_uid in get_ordered_variant_uids(self.compose):
+                variant = self.compose.all_variants[variant_uid]
+                if variant.is_empty:
+                    continue
+                for arch in variant.arches:
+                    link_files(
+                        self.compose,
+                        arch,
+                        variant,
+                        pkg_map[arch][variant.uid],
+                        self.pkgset_phase.package_sets,
+                        manifest=self.manifest,
+                    )
+                    self._notify_linked(variant, arch)
 
-        self._write_manifest()
+            self._write_manifest()
+        except Exception:
+            self.failed = True
+            raise
+        finally:
+            self._finished.set()
 
     def stop(self):
-        super(GatherPhase, self).stop()
+        try:
+            super(GatherPhase, self).stop()
+        finally:
+            # Repositories parsed by hybrid solver are not needed anymore.
+            repo_cache.clear()
 
 
 def _mk_pkg_map(rpm=None, srpm=None, debuginfo=None, iterable_class=list):
@@ -664,11 +723,32 @@ def _make_lookaside_repo(compose, variant, arch, pkg_map, package_sets=None):
         for pkg in sorted(package_list):
             f.write("%s\n" % pkg)
 
-    cr = CreaterepoWrapper(compose.conf["createrepo_c"])
     update_metadata = None
     if package_sets:
         pkgset = package_sets[-1]
         update_metadata = compose.paths.work.pkgset_repo(pkgset.name, arch)
+
+    mod_index = None
+    if variant.arch_mmds:
+        mod_index = Modulemd.ModuleIndex()
+        for mmd in variant.arch_mmds[arch].values():
+            mod_index.add_module_stream(mmd)
+
+        module_names = set(mod_index.get_module_names())
+        defaults_dir = compose.paths.work.module_defaults_dir()
+        overrides_dir = compose.conf.get("module_defaults_override_dir")
+        collect_module_defaults(
+            defaults_dir, module_names, mod_index, overrides_dir=overrides_dir
+        )
+
+    if compose.conf["createrepo_in_process"]:
+        _write_lookaside_repo_in_process(
+            compose, repo, path_prefix, package_list, update_metadata, mod_index
+        )
+        compose.log_info("[DONE ] %s", msg)
+        return repo
+
+    cr = CreaterepoWrapper(compose.conf["createrepo_c"])
     cmd = cr.get_createrepo_cmd(
         path_prefix,
         update=True,
@@ -687,18 +767,7 @@ def _make_lookaside_repo(compose, variant, arch, pkg_map, package_sets=None):
     )
 
     # Add modular metadata into the repo
-    if variant.arch_mmds:
-        mod_index = Modulemd.ModuleIndex()
-        for mmd in variant.arch_mmds[arch].values():
-            mod_index.add_module_stream(mmd)
-
-        module_names = set(mod_index.get_module_names())
-        defaults_dir = compose.paths.work.module_defaults_dir()
-        overrides_dir = compose.conf.get("module_defaults_override_dir")
-        collect_module_defaults(
-            defaults_dir, module_names, mod_index, overrides_dir=overrides_dir
-        )
-
+    if mod_index:
         log_file = compose.paths.log.log_file(
             arch, "lookaside_repo_modules_%s" % (variant.uid)
         )
@@ -709,6 +778,44 @@ def _make_lookaside_repo(compose, variant, arch, pkg_map, package_sets=None):
     return repo
 
 
+def _write_lookaside_repo_in_process(
+    compose, repo, path_prefix, package_list, update_metadata, mod_index
+):
+    """Create lookaside repo using createrepo_c Python bindings. Metadata of
+    the packages is taken from the package set repo (and the other caches used
+    by createrepo phase), so the RPMs are generally not read at all.
+
+    No sqlite database is created: lookaside repos are only read by the gather
+    solvers, which use the XML metadata.
+    """
+    cache = get_package_cache(compose)
+    checksum = compose.conf["createrepo_checksum"]
+    repo_paths = [update_metadata] if update_metadata else []
+    nevras = cache.get_nevras(update_metadata) if update_metadata else {}
+    items = [
+        (os.path.join(path_prefix, rel_path), rel_path, nevras.get(rel_path))
+        for rel_path in sorted(package_list)
+    ]
+    packages = cache.get_packages(
+        items,
+        checksum,
+        repo_paths,
+        location_base="file://%s" % path_prefix,
+        num_workers=compose.conf["createrepo_num_workers"],
+    )
+
+    with temp_dir() as tmp_dir:
+        extra_files = []
+        if mod_index and mod_index.get_module_names():
+            modules_path = os.path.join(tmp_dir, "modules.yaml")
+            with open(modules_path, "w") as f:
+                f.write(mod_index.dump_to_string())
+            extra_files.append(("modules", modules_path))
+        createrepo_lib.write_repo(
+            repo, packages, checksum_type=checksum, extra_files=extra_files
+        )
+
+
 def _update_config(compose, variant_uid, arch, repo):
     """
     Add the variant lookaside repository into the configuration.
@@ -226,6 +226,10 @@ def resolve_deps(compose, arch, variant, source_name=None):
         "dnf": pungi_wrapper.get_pungi_cmd_dnf,
     }
     get_cmd = backends[compose.conf["gather_backend"]]
+    kwargs = {}
+    if compose.conf["gather_backend"] == "dnf":
+        # Parsed repositories are shared by all variants and arches.
+        kwargs["solv_cache_dir"] = compose.paths.work.solv_cache_dir()
     cmd = get_cmd(
         pungi_conf,
         destdir=tmp_dir,
@@ -239,6 +243,7 @@ def resolve_deps(compose, arch, variant, source_name=None):
         lookaside_repos=lookaside_repos,
         multilib_methods=multilib_methods,
         profiler=profiler,
+        **kwargs
     )
     # Use temp working directory directory as workaround for
     # https://bugzilla.redhat.com/show_bug.cgi?id=795137
@@ -15,8 +15,8 @@
 
 import gzip
 import os
+import sys
 from collections import defaultdict
-from fnmatch import fnmatch
 
 import createrepo_c as cr
 import kobo.rpmlib
@@ -25,6 +25,8 @@ from kobo.shortcuts import run
 import pungi.phases.gather.method
 from pungi import multilib_dnf
 from pungi.module_util import Modulemd
+from pungi.namematch import NameIndex
+from pungi.repo_cache import get_repomd_checksum, repo_cache
 from pungi.arch import get_valid_arches, tree_arch_to_yum_arch
 from pungi.phases.gather import _mk_pkg_map
 from pungi.util import get_arch_variant_data, pkg_is_debug, temp_dir, as_local_file
@@ -63,6 +65,8 @@ class GatherMethodHybrid(pungi.phases.gather.method.GatherMethodBase):
     def __init__(self, *args, **kwargs):
         super(GatherMethodHybrid, self).__init__(*args, **kwargs)
         self.package_maps = {}
+        # Arch -> (NameIndex, mapping from name to list of package objects)
+        self.name_indexes = {}
         self.packages = {}
         # Mapping from package name to set of langpack packages (stored as
         # names).
@@ -96,12 +100,23 @@ class GatherMethodHybrid(pungi.phases.gather.method.GatherMethodBase):
 
         return self.package_maps[arch]
 
+    def _get_name_index(self, arch):
+        """Create an index of package names in all package sets for given
+        arch. Same as the package map, this is created once per arch.
+        """
+        if arch not in self.name_indexes:
+            packages_by_name = defaultdict(list)
+            for pkgset in self.package_sets:
+                for pkg_arch in pkgset.package_sets[arch].rpms_by_arch:
+                    for pkg in pkgset.package_sets[arch].rpms_by_arch[pkg_arch]:
+                        packages_by_name[pkg.name].append(pkg)
+            self.name_indexes[arch] = (NameIndex(packages_by_name), packages_by_name)
+
+        return self.name_indexes[arch]
+
     def _prepare_packages(self):
         for repo_path in self.get_repos():
-            md = cr.Metadata()
-            md.locate_and_load_xml(repo_path)
-            for key in md.keys():
-                pkg = md.get(key)
+            for pkg in get_repo_metadata(repo_path):
                 if pkg.arch in self.valid_arches:
                     self.packages[_fmt_nevra(pkg, arch=pkg.arch)] = FakePackage(pkg)
 
@@ -129,14 +144,10 @@ class GatherMethodHybrid(pungi.phases.gather.method.GatherMethodBase):
         """Given a list of globs, create a list of package names matching any
         of the pattern.
         """
+        index, packages_by_name = self._get_name_index(self.arch)
         expanded = set()
-        for pkgset in self.package_sets:
-            for pkg_arch in pkgset.package_sets[self.arch].rpms_by_arch:
-                for pkg in pkgset.package_sets[self.arch].rpms_by_arch[pkg_arch]:
-                    for pattern in patterns:
-                        if fnmatch(pkg.name, pattern):
-                            expanded.add(pkg)
-                            break
+        for name in index.match(patterns):
+            expanded.update(packages_by_name[name])
         return expanded
 
     def prepare_modular_packages(self):
@@ -150,21 +161,17 @@ class GatherMethodHybrid(pungi.phases.gather.method.GatherMethodBase):
         comps_file = self.compose.paths.work.comps(arch, variant, create_dir=False)
         comps = CompsWrapper(comps_file)
 
+        index, packages_by_name = self._get_name_index(arch)
         for name, install in comps.get_langpacks().items():
             # Replace %s with * for fnmatch.
             install_match = install % "*"
             self.langpacks[name] = set()
-            for pkgset in self.package_sets:
-                for pkg_arch in pkgset.package_sets[arch].rpms_by_arch:
-                    for pkg in pkgset.package_sets[arch].rpms_by_arch[pkg_arch]:
-                        if not fnmatch(pkg.name, install_match):
-                            # Does not match the pattern, ignore...
-                            continue
-                        if pkg.name.endswith("-devel") or pkg.name.endswith("-static"):
-                            continue
-                        if pkg_is_debug(pkg):
-                            continue
-                        self.langpacks[name].add(pkg.name)
+            for pkg_name in index.match([install_match]):
+                if pkg_name.endswith("-devel") or pkg_name.endswith("-static"):
+                    continue
+                if all(pkg_is_debug(pkg) for pkg in packages_by_name[pkg_name]):
+                    continue
+                self.langpacks[name].add(pkg_name)
 
     def __call__(
         self,
@@ -184,6 +191,8 @@ class GatherMethodHybrid(pungi.phases.gather.method.GatherMethodBase):
         self.valid_arches = get_valid_arches(arch, multilib=True)
         self.package_sets = package_sets
 
+        repo_cache.resize(self.compose.conf["gather_repo_cache_size"])
+
         self.prepare_langpacks(arch, variant)
         self.prepare_modular_packages()
 
@@ -499,25 +508,64 @@ def _make_result(paths):
     return [{"path": path, "flags": []} for path in sorted(paths)]
 
 
-def get_repo_packages(path):
-    """Extract file names of all packages in the given repository."""
+def _get_repomd(path):
+    with as_local_file(os.path.join(path, "repodata/repomd.xml")) as url_:
+        return cr.Repomd(url_)
+
 
+def _get_xml_size(path, mdtypes):
+    """Return uncompressed size of metadata of given types in repo at `path`.
+    It is used as an estimate of memory needed for the parsed metadata.
+    """
+    size = 0
+    for rec in _get_repomd(path).records:
+        if rec.type in mdtypes:
+            size += rec.size_open if rec.size_open > 0 else rec.size
+    return size
+
+
+def _load_repo_metadata(path):
+    md = cr.Metadata()
+    md.locate_and_load_xml(path)
+    packages = [md.get(key) for key in md.keys()]
+    # The metadata object is kept alive together with the packages.
+    size = _get_xml_size(path, ("primary", "filelists", "other"))
+    return (md, packages), size
+
+
+def get_repo_metadata(path):
+    """Return list of packages with full metadata from repository at given
+    path. The parsed metadata is cached.
+    """
+    key = ("metadata", get_repomd_checksum(path))
+    _, packages = repo_cache.get(key, lambda: _load_repo_metadata(path))
+    return packages
+
+
+def _load_repo_packages(path):
     packages = set()
 
     def callback(pkg):
         packages.add(os.path.basename(pkg.location_href))
 
-    repomd = os.path.join(path, "repodata/repomd.xml")
-    with as_local_file(repomd) as url_:
-        repomd = cr.Repomd(url_)
-    for rec in repomd.records:
+    for rec in _get_repomd(path).records:
         if rec.type != "primary":
             continue
         record_url = os.path.join(path, rec.location_href)
         with as_local_file(record_url) as url_:
             cr.xml_parse_primary(url_, pkgcb=callback, do_files=False)
 
-    return packages
+    packages = frozenset(packages)
+    size = sys.getsizeof(packages) + sum(sys.getsizeof(name) for name in packages)
+    return packages, size
+
+
+def get_repo_packages(path):
+    """Extract file names of all packages in the given repository. The result
+    is cached.
+    """
+    key = ("packages", get_repomd_checksum(path))
+    return repo_cache.get(key, lambda: _load_repo_packages(path))
 
 
 def expand_packages(nevra_to_pkg, lookasides, nvrs, filter_packages):
@@ -433,8 +433,7 @@ class CreateImageBuildThread(WorkerThread):
 
         # Make sure packages in variant not change
         rpm_manifest_file = compose.paths.compose.metadata("rpms.json")
-        rpm_manifest = Rpms()
-        rpm_manifest.load(rpm_manifest_file)
+        rpm_manifest = compose.get_rpm_manifest()
 
         old_rpm_manifest_file = compose.paths.old_compose_path(rpm_manifest_file)
         old_rpm_manifest = Rpms()
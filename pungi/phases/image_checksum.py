@@ -1,11 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import os
-from kobo import shortcuts
 from collections import defaultdict
-import threading
 
 from .base import PhaseBase
+from .. import checksums
 from ..util import get_format_substs, get_file_size
 
 
@@ -76,44 +75,31 @@ class ImageChecksumPhase(PhaseBase):
             self.checksums,
             self.one_file,
             self._get_base_filename,
+            cache=self.compose.get_checksum_cache(),
         )
 
 
-def _compute_checksums(
+def _add_checksums(
     results,
-    cache,
+    digests_by_path,
     variant,
     arch,
     path,
     images,
-    checksum_types,
     base_checksum_name_gen,
     one_file,
-    results_lock,
-    cache_lock,
 ):
     for image in images:
         filename = os.path.basename(image.path)
         full_path = os.path.join(path, filename)
-        if not os.path.exists(full_path):
+        if full_path not in digests_by_path:
             continue
 
         filesize = image.size or get_file_size(full_path)
 
-        cache_lock.acquire()
-        if full_path not in cache:
-            cache_lock.release()
-            # Source ISO is listed under each binary architecture. There's no
-            # point in checksumming it twice, so we can just remember the
-            # digest from first run..
-            checksum_value = shortcuts.compute_file_checksums(full_path, checksum_types)
-            with cache_lock:
-                cache[full_path] = checksum_value
-        else:
-            cache_lock.release()
-
-        with cache_lock:
-            digests = cache[full_path]
+        # Source ISO is listed under each binary architecture, but the digest
+        # is computed only once.
+        digests = digests_by_path[full_path]
 
         for checksum, digest in digests.items():
             # Update metadata with the checksum
@@ -123,10 +109,7 @@ def _compute_checksums(
                 checksum_filename = os.path.join(
                     path, "%s.%sSUM" % (filename, checksum.upper())
                 )
-                with results_lock:
-                    results[checksum_filename].add(
-                        (filename, filesize, checksum, digest)
-                    )
+                results[checksum_filename].add((filename, filesize, checksum, digest))
 
             if one_file:
                 dirname = os.path.basename(path)
@@ -139,42 +122,36 @@ def _compute_checksums(
                 checksum_filename = "%s%sSUM" % (base_checksum_name, checksum.upper())
             checksum_path = os.path.join(path, checksum_filename)
 
-            with results_lock:
-                results[checksum_path].add((filename, filesize, checksum, digest))
+            results[checksum_path].add((filename, filesize, checksum, digest))
 
 
-def make_checksums(topdir, im, checksum_types, one_file, base_checksum_name_gen):
+def make_checksums(
+    topdir, im, checksum_types, one_file, base_checksum_name_gen, cache=None
+):
     results = defaultdict(set)
-    cache = {}
-    threads = []
-    results_lock = threading.Lock()  # lock to synchronize access to the results dict.
-    cache_lock = threading.Lock()  # lock to synchronize access to the cache dict.
-
-    # create all worker threads
-    for (variant, arch, path), images in get_images(topdir, im).items():
-        threads.append(
-            threading.Thread(
-                target=_compute_checksums,
-                args=[
-                    results,
-                    cache,
-                    variant,
-                    arch,
-                    path,
-                    images,
-                    checksum_types,
-                    base_checksum_name_gen,
-                    one_file,
-                    results_lock,
-                    cache_lock,
-                ],
-            )
+    images = get_images(topdir, im)
+
+    # Compute checksums of all existing images at once, so that files are
+    # hashed in parallel and each of them only once.
+    paths = set()
+    for (variant, arch, path), image_list in images.items():
+        for image in image_list:
+            full_path = os.path.join(path, os.path.basename(image.path))
+            if os.path.exists(full_path):
+                paths.add(full_path)
+    digests_by_path = checksums.compute_checksums(paths, checksum_types, cache=cache)
+
+    for (variant, arch, path), image_list in images.items():
+        _add_checksums(
+            results,
+            digests_by_path,
+            variant,
+            arch,
+            path,
+            image_list,
+            base_checksum_name_gen,
+            one_file,
         )
-        threads[-1].start()
-
-    # wait for all worker threads to finish
-    for thread in threads:
-        thread.join()
 
     for file in results:
         dump_checksums(file, results[file])
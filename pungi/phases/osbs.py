@@ -6,7 +6,6 @@ import json
 import os
 from kobo.threads import ThreadPool, WorkerThread
 from kobo import shortcuts
-from productmd.rpms import Rpms
 from six.moves import configparser
 
 from .base import ConfigGuardedPhase, PhaseLoggerMixin
@@ -320,9 +319,7 @@ class OSBSThread(WorkerThread):
                 return False
 
         # Make sure rpms installed in image exists in current compose
-        rpm_manifest_file = compose.paths.compose.metadata("rpms.json")
-        rpm_manifest = Rpms()
-        rpm_manifest.load(rpm_manifest_file)
+        rpm_manifest = compose.get_rpm_manifest()
         rpms = set()
         for variant in rpm_manifest.rpms:
             for arch in rpm_manifest.rpms[variant]:
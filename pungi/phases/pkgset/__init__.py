@@ -30,10 +30,14 @@ class PkgsetPhase(PhaseBase):
 
     def run(self):
         from . import sources
+        from .pkgsets import stop_reader_processes
 
         SourceClass = sources.ALL_SOURCES[self.compose.conf["pkgset_source"].lower()]
 
-        self.package_sets, self.path_prefix = SourceClass(self.compose)()
+        try:
+            self.package_sets, self.path_prefix = SourceClass(self.compose)()
+        finally:
+            stop_reader_processes()
 
     def validate(self):
         extra_tasks = self.compose.conf.get("pkgset_koji_scratch_tasks", None)
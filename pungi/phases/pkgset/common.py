@@ -27,9 +27,11 @@ from pungi.util import (
     is_arch_multilib,
     PartialFuncWorkerThread,
     PartialFuncThreadPool,
+    temp_dir,
 )
 from pungi.module_util import Modulemd, collect_module_defaults
-from pungi.phases.createrepo import add_modular_metadata
+from pungi.phases.createrepo import add_modular_metadata, get_package_cache
+from pungi.wrappers import createrepo_lib
 
 
 def populate_arch_pkgsets(compose, path_prefix, global_pkgset):
@@ -135,12 +137,31 @@ def _create_arch_repo(worker_thread, args, task_num):
     msg = "Running createrepo for arch '%s'" % arch
 
     compose.log_info("[BEGIN] %s", msg)
+    pkglist = compose.paths.work.package_list(arch=arch, pkgset=pkgset)
+    mod_index = None
+    # Add modulemd to the repo for all modules in all variants on this architecture.
+    if Modulemd and mmd:
+        names = set(x.get_module_name() for x in mmd)
+        overrides_dir = compose.conf.get("module_defaults_override_dir")
+        mod_index = collect_module_defaults(
+            compose.paths.work.module_defaults_dir(), names, overrides_dir=overrides_dir
+        )
+        for x in mmd:
+            mod_index.add_module_stream(x)
+
+    if compose.conf["createrepo_in_process"]:
+        _write_arch_repo_in_process(
+            compose, repo_dir, repo_dir_global, path_prefix, pkgset, pkglist, mod_index
+        )
+        compose.log_info("[DONE ] %s", msg)
+        return
+
     cmd = repo.get_createrepo_cmd(
         path_prefix,
         update=True,
         database=False,
         skip_stat=True,
-        pkglist=compose.paths.work.package_list(arch=arch, pkgset=pkgset),
+        pkglist=pkglist,
         outputdir=repo_dir,
         baseurl="file://%s" % path_prefix,
         workers=compose.conf["createrepo_num_workers"],
@@ -152,25 +173,62 @@ def _create_arch_repo(worker_thread, args, task_num):
         logfile=compose.paths.log.log_file(arch, "arch_repo.%s" % pkgset.name),
         show_cmd=True,
     )
-    # Add modulemd to the repo for all modules in all variants on this architecture.
-    if Modulemd and mmd:
-        names = set(x.get_module_name() for x in mmd)
-        overrides_dir = compose.conf.get("module_defaults_override_dir")
-        mod_index = collect_module_defaults(
-            compose.paths.work.module_defaults_dir(), names, overrides_dir=overrides_dir
-        )
-        for x in mmd:
-            mod_index.add_module_stream(x)
+    if mod_index:
         add_modular_metadata(
             repo,
             repo_dir,
             mod_index,
             compose.paths.log.log_file(arch, "arch_repo_modulemd.%s" % pkgset.name),
         )
-
     compose.log_info("[DONE ] %s", msg)
 
 
+def _get_nevra(pkgset, path):
+    """Return NEVRA of package at `path`, or None if it is not in the package
+    set.
+    """
+    try:
+        return createrepo_lib.get_nevra(pkgset[path])
+    except KeyError:
+        return None
+
+
+def _write_arch_repo_in_process(
+    compose, repo_dir, repo_dir_global, path_prefix, pkgset, pkglist, mod_index
+):
+    """Create pkgset repo for an arch using createrepo_c Python bindings.
+    Package metadata is taken from the global package set repo, packages
+    missing there are read by multiple processes in parallel.
+    """
+    cache = get_package_cache(compose)
+    checksum = compose.conf["createrepo_checksum"]
+    items = []
+    with open(pkglist) as f:
+        for rel_path in f:
+            rel_path = rel_path.strip()
+            if rel_path:
+                path = os.path.join(path_prefix, rel_path)
+                items.append((path, rel_path, _get_nevra(pkgset, path)))
+    packages = cache.get_packages(
+        items,
+        checksum,
+        [repo_dir_global],
+        location_base="file://%s" % path_prefix,
+        num_workers=compose.conf["createrepo_num_workers"],
+    )
+
+    with temp_dir() as tmp_dir:
+        extra_files = []
+        if mod_index and mod_index.get_module_names():
+            modules_path = os.path.join(tmp_dir, "modules.yaml")
+            with open(modules_path, "w") as f:
+                f.write(mod_index.dump_to_string())
+            extra_files.append(("modules", modules_path))
+        createrepo_lib.write_repo(
+            repo_dir, packages, checksum_type=checksum, extra_files=extra_files
+        )
+
+
 class MaterializedPackageSet(object):
     """A wrapper for PkgsetBase object that represents the package set created
     as repos on the filesystem.
@@ -216,8 +274,8 @@ class MaterializedPackageSet(object):
             compose.paths.work.package_list(arch="global", pkgset=pkgset_global),
             remove_path_prefix=path_prefix,
         )
-        pkgset_global.save_file_cache(
-            compose.paths.work.pkgset_file_cache(pkgset_global.name)
+        pkgset_global.save_header_index(
+            compose.paths.work.pkgset_header_index(pkgset_global.name)
         )
 
         if getattr(pkgset_global, "reuse", None) is None:
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://gnu.org/licenses/>.
+
+
+"""
+On-disk index of RPM header fields used by package sets.
+
+The index replaces the pickled ``kobo.pkgset.FileCache`` that used to be
+loaded as a whole at the start of every compose. It is an SQLite database
+written once per compose, holding one row per RPM with exactly the fields that
+``ExtendedRpmWrapper`` extracts from the header. Rows are only turned into
+wrapper objects when they are looked up, so a compose reading a handful of
+changed packages does not pay for deserializing all the others.
+
+An entry is only considered valid if the path, size and mtime of the file on
+disk still match. Signed copies of RPMs live in a sigkey specific directory,
+so the path covers the sigkey as well.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA_VERSION = 1
+
+# Columns holding scalar header fields, in the order used in the table.
+SCALAR_FIELDS = (
+    "name",
+    "epoch",
+    "version",
+    "release",
+    "arch",
+    "sourcerpm",
+    "signature",
+    "checksum_type",
+    "is_source",
+    "is_system_release",
+)
+
+# Columns holding list header fields. They are stored as JSON arrays.
+LIST_FIELDS = ("excludearch", "exclusivearch", "requires", "provides")
+
+
+def make_index_record(rpm_obj):
+    """Return a dict with all indexed header fields of `rpm_obj`. List fields
+    are sorted so that the record does not depend on set ordering.
+    """
+    record = {}
+    for field in SCALAR_FIELDS:
+        record[field] = getattr(rpm_obj, field, None)
+    for field in LIST_FIELDS:
+        record[field] = sorted(getattr(rpm_obj, field, None) or [])
+    return record
+
+
+class IndexMismatchError(Exception):
+    """The index can not be used, because it is missing, broken or created
+    with a different schema."""
+
+
+class RpmHeaderIndex(object):
+    """Persistent index of RPM headers keyed by path, size and mtime.
+
+    The object implements the read-only part of the ``FileCache`` interface
+    (``__getitem__``, ``__contains__``, ``__iter__``, ``__len__``, ``items``)
+    so that it can be used in places where the old unpickled file cache was
+    used.
+
+    :param str path: path to the database file. It is created if it does not
+        exist yet, unless `readonly` is set.
+    :param class wrapper_class: class to create package objects with. It needs
+        to provide ``from_index_record`` classmethod and the attributes listed
+        in ``SCALAR_FIELDS`` and ``LIST_FIELDS``.
+    :param bool readonly: open an existing index without modifying it, e.g.
+        the one from an old compose that may not be writable. Raises
+        `IndexMismatchError` if it has a different schema.
+    """
+
+    def __init__(self, path, wrapper_class, readonly=False):
+        self.path = path
+        self.wrapper_class = wrapper_class
+        self.readonly = readonly
+        self._lock = threading.Lock()
+        self._conn = None
+        self._open()
+
+    def _open(self):
+        if self.readonly:
+            self._open_readonly()
+            return
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        columns = ", ".join("%s TEXT" % field for field in SCALAR_FIELDS + LIST_FIELDS)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS headers ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, stat TEXT, %s)"
+                % columns
+            )
+            self._conn.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+            self._conn.commit()
+
+    def _open_readonly(self):
+        if not os.path.isfile(self.path):
+            raise IndexMismatchError("Index %s does not exist" % self.path)
+        try:
+            self._conn = sqlite3.connect(
+                "file:%s?mode=ro" % self.path, uri=True, check_same_thread=False
+            )
+        except TypeError:
+            # Python 2 does not support URIs. Nothing is written to the file
+            # as long as only queries are executed.
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            columns = [
+                row[1] for row in self._conn.execute("PRAGMA table_info(headers)")
+            ]
+        except sqlite3.DatabaseError as exc:
+            self.close()
+            raise IndexMismatchError("Can not read index %s: %s" % (self.path, exc))
+        expected = ["path", "size", "mtime", "stat"] + list(SCALAR_FIELDS + LIST_FIELDS)
+        if version != SCHEMA_VERSION or columns != expected:
+            self.close()
+            raise IndexMismatchError(
+                "Index %s has schema version %s, expected %s"
+                % (self.path, version, SCHEMA_VERSION)
+            )
+
+    def __getstate__(self):
+        return {
+            "path": self.path,
+            "wrapper_class": self.wrapper_class,
+            "readonly": self.readonly,
+        }
+
+    def __setstate__(self, data):
+        self.__dict__.update(data)
+        self._lock = threading.Lock()
+        self._open()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def _make_wrapper(self, row):
+        path, _size, _mtime, stat = row[:4]
+        values = row[4:]
+        record = dict(zip(SCALAR_FIELDS + LIST_FIELDS, values))
+        for field in LIST_FIELDS:
+            record[field] = json.loads(record[field])
+        for field in ("is_source", "is_system_release"):
+            record[field] = record[field] == "1"
+        if record["epoch"] is not None:
+            record["epoch"] = int(record["epoch"])
+        stat = os.stat_result(json.loads(stat))
+        return self.wrapper_class.from_index_record(path, stat, record)
+
+    def _select(self, where="", args=()):
+        return self._query(
+            "SELECT path, size, mtime, stat, %s FROM headers %s"
+            % (", ".join(SCALAR_FIELDS + LIST_FIELDS), where),
+            args,
+        )
+
+    def lookup(self, file_path, stat=None):
+        """Return package object for `file_path` if the index has a valid
+        entry for it, or None otherwise. The entry is valid only if size and
+        mtime of the file match. If `stat` is not given, the file is stat-ed.
+        """
+        file_path = os.path.abspath(file_path)
+        rows = self._select("WHERE path = ?", (file_path,))
+        if not rows:
+            return None
+        if stat is None:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                return None
+        row = rows[0]
+        if row[1] != stat.st_size or row[2] != stat.st_mtime:
+            return None
+        return self._make_wrapper(row)
+
+    def add(self, rpm_obj):
+        """Store header fields of `rpm_obj` in the index. Existing entry for
+        the same path is replaced. Changes are written by `commit`.
+        """
+        self.add_many([rpm_obj])
+
+    def add_many(self, rpm_objs):
+        rows = []
+        for rpm_obj in rpm_objs:
+            record = make_index_record(rpm_obj)
+            values = []
+            for field in SCALAR_FIELDS:
+                value = record[field]
+                if isinstance(value, bool):
+                    value = "1" if value else "0"
+                values.append(None if value is None else str(value))
+            for field in LIST_FIELDS:
+                values.append(json.dumps(record[field]))
+            stat = tuple(rpm_obj.stat)[:10]
+            rows.append(
+                [
+                    rpm_obj.file_path,
+                    rpm_obj.stat.st_size,
+                    rpm_obj.stat.st_mtime,
+                    json.dumps(stat),
+                ]
+                + values
+            )
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO headers VALUES (%s)"
+                % ", ".join("?" * (4 + len(SCALAR_FIELDS) + len(LIST_FIELDS))),
+                rows,
+            )
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def __getitem__(self, file_path):
+        rows = self._select("WHERE path = ?", (os.path.abspath(file_path),))
+        if not rows:
+            raise KeyError(file_path)
+        return self._make_wrapper(rows[0])
+
+    def get(self, file_path, default=None):
+        try:
+            return self[file_path]
+        except KeyError:
+            return default
+
+    def __contains__(self, file_path):
+        return bool(
+            self._query(
+                "SELECT 1 FROM headers WHERE path = ?", (os.path.abspath(file_path),)
+            )
+        )
+
+    def __iter__(self):
+        for row in self._query("SELECT path FROM headers ORDER BY path"):
+            yield row[0]
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM headers")[0][0]
+
+    def __bool__(self):
+        # Avoid counting all the rows when only checking for emptiness.
+        return bool(self._query("SELECT 1 FROM headers LIMIT 1"))
+
+    __nonzero__ = __bool__
+
+    def items(self):
+        return [(row[0], self._make_wrapper(row)) for row in self._select()]
+
+    def iteritems(self):
+        for row in self._select():
+            yield row[0], self._make_wrapper(row)
+
+
+def save_header_index(path, file_cache, wrapper_class):
+    """Write all packages from `file_cache` into a new index at `path`."""
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    index = RpmHeaderIndex(tmp_path, wrapper_class)
+    try:
+        index.add_many(obj for _, obj in file_cache.items())
+        index.commit()
+    finally:
+        index.close()
+    os.rename(tmp_path, path)
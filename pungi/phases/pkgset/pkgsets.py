@@ -21,7 +21,10 @@ It automatically finds a signed copies according to *sigkey_ordering*.
 
 import itertools
 import json
+import multiprocessing
+import multiprocessing.pool
 import os
+import threading
 import time
 from six.moves import cPickle as pickle
 
@@ -34,6 +37,19 @@ from kobo.threads import WorkerThread, ThreadPool
 from pungi.util import pkg_is_srpm, copy_all
 from pungi.arch import get_valid_arches, is_excluded
 from pungi.errors import UnsignedPackagesError
+from pungi.phases.pkgset.header_index import (
+    IndexMismatchError,
+    RpmHeaderIndex,
+    make_index_record,
+    save_header_index,
+)
+
+# Default number of threads reading RPM headers.
+READER_THREADS = 10
+# Default number of RPMs sent to a reader process at once. Reading a header
+# is dominated by I/O latency on NFS, so the chunks are kept reasonably small
+# for the work to be spread evenly over the processes.
+READER_CHUNK_SIZE = 32
 
 
 class ExtendedRpmWrapper(kobo.pkgset.SimpleRpmWrapper):
@@ -48,6 +64,22 @@ class ExtendedRpmWrapper(kobo.pkgset.SimpleRpmWrapper):
         self.requires = set(kobo.rpmlib.get_header_field(header, "requires"))
         self.provides = set(kobo.rpmlib.get_header_field(header, "provides"))
 
+    @classmethod
+    def from_index_record(cls, file_path, stat, record):
+        """
+        Creates the wrapper from a record stored in RpmHeaderIndex without
+        reading the RPM header.
+        """
+        obj = cls.__new__(cls)
+        obj._checksums = {}
+        obj.file_path = file_path
+        obj.stat = stat
+        for key, value in record.items():
+            setattr(obj, key, value)
+        obj.requires = set(obj.requires)
+        obj.provides = set(obj.provides)
+        return obj
+
 
 class ReaderPool(ThreadPool):
     def __init__(self, package_set, logger=None):
@@ -69,34 +101,67 @@ class ReaderThread(WorkerThread):
             return
 
         # In case we have old file cache data, try to reuse it.
-        if self.pool.package_set.old_file_cache:
-            # Try to find the RPM in old_file_cache and reuse it instead of
-            # reading its headers again.
-            try:
-                rpm_obj = self.pool.package_set.old_file_cache[rpm_path]
-            except KeyError:
-                rpm_obj = None
-
-            # Also reload rpm_obj if it's not ExtendedRpmWrapper object
-            # to get the requires/provides data into the cache.
-            if rpm_obj and isinstance(rpm_obj, ExtendedRpmWrapper):
-                self.pool.package_set.file_cache[rpm_path] = rpm_obj
-            else:
-                rpm_obj = self.pool.package_set.file_cache.add(rpm_path)
+        rpm_obj = self.pool.package_set.get_old_rpm_obj(rpm_path)
+        if rpm_obj:
+            self.pool.package_set.file_cache[rpm_path] = rpm_obj
         else:
             rpm_obj = self.pool.package_set.file_cache.add(rpm_path)
-        self.pool.package_set.rpms_by_arch.setdefault(rpm_obj.arch, []).append(rpm_obj)
+        self.pool.package_set.add_rpm_obj(rpm_obj)
 
-        if pkg_is_srpm(rpm_obj):
-            self.pool.package_set.srpms_by_name[rpm_obj.file_name] = rpm_obj
-        elif rpm_obj.arch == "noarch":
-            srpm = self.pool.package_set.srpms_by_name.get(rpm_obj.sourcerpm, None)
-            if srpm:
-                # HACK: copy {EXCLUDE,EXCLUSIVE}ARCH from SRPM to noarch RPMs
-                rpm_obj.excludearch = srpm.excludearch
-                rpm_obj.exclusivearch = srpm.exclusivearch
-            else:
-                self.pool.log_warning("Can't find a SRPM for %s" % rpm_obj.file_name)
+
+def _read_rpm_headers(file_paths):
+    """
+    Reads headers of RPMs in `file_paths`. This runs in a worker process of
+    the "processes" reader backend, so it returns only compact records that
+    are cheap to send back instead of the wrapper objects.
+
+    :return: list of (file_path, stat, record) tuples
+    """
+    result = []
+    for file_path in file_paths:
+        rpm_obj = ExtendedRpmWrapper(file_path)
+        result.append((rpm_obj.file_path, rpm_obj.stat, make_index_record(rpm_obj)))
+    return result
+
+
+# Pool of worker processes shared by all package sets.
+_reader_processes = None
+_reader_processes_lock = threading.Lock()
+
+
+def can_read_in_processes():
+    """Worker processes are only used where they can be started without
+    forking, which is not possible on Python 2.
+    """
+    return hasattr(multiprocessing, "get_context")
+
+
+def _create_reader_processes(num_workers):
+    # The compose process runs many threads. A forked child would get copies
+    # of locks held by them at the time (e.g. in logging) and could deadlock.
+    return multiprocessing.get_context("spawn").Pool(num_workers)
+
+
+def get_reader_processes(num_workers):
+    """Return the pool of processes reading RPM headers. It is created on
+    first use with `num_workers` processes and shared by all package sets, so
+    tags read in parallel do not start more processes than that.
+    """
+    global _reader_processes
+    with _reader_processes_lock:
+        if _reader_processes is None:
+            _reader_processes = _create_reader_processes(num_workers)
+        return _reader_processes
+
+
+def stop_reader_processes():
+    """Stop the shared pool of reader processes if it was started."""
+    global _reader_processes
+    with _reader_processes_lock:
+        if _reader_processes is not None:
+            _reader_processes.close()
+            _reader_processes.join()
+            _reader_processes = None
 
 
 class PackageSetBase(kobo.log.LoggingBase):
@@ -107,7 +172,19 @@ class PackageSetBase(kobo.log.LoggingBase):
         arches=None,
         logger=None,
         allow_invalid_sigkeys=False,
+        reader_backend="threads",
+        reader_workers=None,
+        reader_chunk_size=READER_CHUNK_SIZE,
     ):
+        """
+        :param str reader_backend: How to read RPM headers. With "threads" the
+            headers are read in a pool of threads in this process, with
+            "processes" they are read in a pool of worker processes.
+        :param int reader_workers: Number of threads or processes used to read
+            RPM headers. Defaults to 10 threads or one process per CPU.
+        :param int reader_chunk_size: Number of RPMs sent to a worker process
+            at once by the "processes" backend.
+        """
         super(PackageSetBase, self).__init__(logger=logger)
         self.name = name
         self.file_cache = kobo.pkgset.FileCache(ExtendedRpmWrapper)
@@ -119,6 +196,9 @@ class PackageSetBase(kobo.log.LoggingBase):
         # RPMs not found for specified sigkeys
         self._invalid_sigkey_rpms = []
         self._allow_invalid_sigkeys = allow_invalid_sigkeys
+        self.reader_backend = reader_backend
+        self.reader_workers = reader_workers
+        self.reader_chunk_size = reader_chunk_size
 
     @property
     def invalid_sigkey_rpms(self):
@@ -171,7 +251,63 @@ class PackageSetBase(kobo.log.LoggingBase):
             "\n".join(get_error(k, v) for k, v in rpminfos.items())
         )
 
+    def get_old_rpm_obj(self, rpm_path):
+        """
+        Returns the object for `rpm_path` from old file cache if it can be
+        reused instead of reading the RPM headers again, None otherwise.
+        """
+        if not self.old_file_cache:
+            return None
+        if isinstance(self.old_file_cache, RpmHeaderIndex):
+            # The index only returns entries still matching the file on disk.
+            rpm_obj = self.old_file_cache.lookup(rpm_path)
+        else:
+            try:
+                rpm_obj = self.old_file_cache[rpm_path]
+            except KeyError:
+                rpm_obj = None
+        # Also reload rpm_obj if it's not ExtendedRpmWrapper object
+        # to get the requires/provides data into the cache.
+        if rpm_obj and isinstance(rpm_obj, ExtendedRpmWrapper):
+            return rpm_obj
+        return None
+
+    def add_rpm_obj(self, rpm_obj):
+        """Add an already read package to the per-arch lists."""
+        self.rpms_by_arch.setdefault(rpm_obj.arch, []).append(rpm_obj)
+
+        if pkg_is_srpm(rpm_obj):
+            self.srpms_by_name[rpm_obj.file_name] = rpm_obj
+        elif rpm_obj.arch == "noarch":
+            srpm = self.srpms_by_name.get(rpm_obj.sourcerpm, None)
+            if srpm:
+                # HACK: copy {EXCLUDE,EXCLUSIVE}ARCH from SRPM to noarch RPMs
+                rpm_obj.excludearch = srpm.excludearch
+                rpm_obj.exclusivearch = srpm.exclusivearch
+            else:
+                self.log_warning("Can't find a SRPM for %s" % rpm_obj.file_name)
+
     def read_packages(self, rpms, srpms):
+        use_processes = self.reader_backend == "processes"
+        if use_processes and not can_read_in_processes():
+            self.log_warning(
+                "Reading RPM headers in processes is not supported, using threads"
+            )
+            use_processes = False
+        if use_processes:
+            # process SRC and NOSRC packages first (see add_rpm_obj for the
+            # EXCLUDEARCH/EXCLUSIVEARCH hack for noarch packages)
+            self._read_packages_in_processes(srpms, "SRPMs")
+            self._read_packages_in_processes(rpms, "RPMs")
+        else:
+            self._read_packages_in_threads(rpms, srpms)
+
+        if not self._allow_invalid_sigkeys and self._invalid_sigkey_rpms:
+            self.raise_invalid_sigkeys_exception(self._invalid_sigkey_rpms)
+
+        return self.rpms_by_arch
+
+    def _read_packages_in_threads(self, rpms, srpms):
         srpm_pool = ReaderPool(self, self._logger)
         rpm_pool = ReaderPool(self, self._logger)
 
@@ -181,12 +317,12 @@ class PackageSetBase(kobo.log.LoggingBase):
         for i in srpms:
             srpm_pool.queue_put(i)
 
-        thread_count = 10
+        thread_count = self.reader_workers or READER_THREADS
         for i in range(thread_count):
             srpm_pool.add(ReaderThread(srpm_pool))
             rpm_pool.add(ReaderThread(rpm_pool))
 
-        # process SRC and NOSRC packages first (see ReaderTread for the
+        # process SRC and NOSRC packages first (see add_rpm_obj for the
         # EXCLUDEARCH/EXCLUSIVEARCH hack for noarch packages)
         self.log_debug("Package set: spawning %s worker threads (SRPMs)" % thread_count)
         srpm_pool.start()
@@ -198,10 +334,61 @@ class PackageSetBase(kobo.log.LoggingBase):
         rpm_pool.stop()
         self.log_debug("Package set: worker threads stopped (RPMs)")
 
-        if not self._allow_invalid_sigkeys and self._invalid_sigkey_rpms:
-            self.raise_invalid_sigkeys_exception(self._invalid_sigkey_rpms)
+    def _read_packages_in_processes(self, items, kind):
+        # Imported here, pungi.checks imports all phases.
+        from pungi.checks import get_num_cpus
 
-        return self.rpms_by_arch
+        # Looking up the paths only checks for files on disk (and possibly
+        # waits for signed copies to appear), threads are good enough here.
+        path_pool = multiprocessing.pool.ThreadPool(READER_THREADS)
+        try:
+            rpm_paths = path_pool.map(self.get_package_path, items)
+        finally:
+            path_pool.close()
+            path_pool.join()
+
+        to_read = []
+        for rpm_path in rpm_paths:
+            if rpm_path is None:
+                continue
+            rpm_obj = self.get_old_rpm_obj(rpm_path)
+            if rpm_obj:
+                self.file_cache[rpm_path] = rpm_obj
+                self.add_rpm_obj(rpm_obj)
+            elif rpm_path in self.file_cache:
+                self.add_rpm_obj(self.file_cache[rpm_path])
+            else:
+                to_read.append(rpm_path)
+
+        if not to_read:
+            return
+
+        chunk_size = max(1, self.reader_chunk_size)
+        chunks = [
+            to_read[i : i + chunk_size] for i in range(0, len(to_read), chunk_size)
+        ]
+        pool = get_reader_processes(self.reader_workers or get_num_cpus())
+        self.log_debug("Package set: reading %s in worker processes" % kind)
+        processed = 0
+        for records in pool.imap_unordered(_read_rpm_headers, chunks):
+            for rpm_path, stat, record in records:
+                rpm_obj = ExtendedRpmWrapper.from_index_record(rpm_path, stat, record)
+                self.add_rpm_obj(self._add_to_file_cache(rpm_obj))
+            processed += len(records)
+            self.log_debug(
+                "Processed %s out of %s packages" % (processed, len(to_read))
+            )
+        self.log_debug("Package set: worker processes finished (%s)" % kind)
+
+    def _add_to_file_cache(self, rpm_obj):
+        """
+        Add an object created outside of FileCache.add. The same inode
+        reachable under multiple paths is represented by a single object.
+        """
+        cache_key = (rpm_obj.stat.st_dev, rpm_obj.stat.st_ino)
+        rpm_obj = self.file_cache.inode_cache.setdefault(cache_key, rpm_obj)
+        self.file_cache.file_cache[rpm_obj.file_path] = rpm_obj
+        return rpm_obj
 
     def subset(self, primary_arch, arch_list, exclusive_noarch=True):
         """Create a subset of this package set that only includes
@@ -285,16 +472,28 @@ class PackageSetBase(kobo.log.LoggingBase):
         with open(file_path, "rb") as f:
             return pickle.load(f)
 
+    @staticmethod
+    def load_old_header_index(file_path):
+        """
+        Opens the RpmHeaderIndex stored in `file_path` read-only. No package
+        data is loaded until it is looked up. Returns None if the index can
+        not be used.
+        """
+        try:
+            return RpmHeaderIndex(file_path, ExtendedRpmWrapper, readonly=True)
+        except IndexMismatchError:
+            return None
+
     def set_old_file_cache(self, old_file_cache):
         """Set cache of old files."""
         self.old_file_cache = old_file_cache
 
-    def save_file_cache(self, file_path):
+    def save_header_index(self, file_path):
         """
-        Saves the current FileCache using the pickle module to `file_path`.
+        Saves header fields of all packages in the current FileCache into
+        RpmHeaderIndex stored in `file_path`.
         """
-        with open(file_path, "wb") as f:
-            pickle.dump(self.file_cache, f, protocol=pickle.HIGHEST_PROTOCOL)
+        save_header_index(file_path, self.file_cache, ExtendedRpmWrapper)
 
 
 class FilelistPackageSet(PackageSetBase):
@@ -334,6 +533,9 @@ class KojiPackageSet(PackageSetBase):
         extra_tasks=None,
         signed_packages_retries=0,
         signed_packages_wait=30,
+        reader_backend="threads",
+        reader_workers=None,
+        reader_chunk_size=READER_CHUNK_SIZE,
     ):
         """
         Creates new KojiPackageSet.
@@ -369,6 +571,9 @@ class KojiPackageSet(PackageSetBase):
         :param int signed_packages_retries: How many times should a search for
             signed package be repeated.
         :param int signed_packages_wait: How long to wait between search attemts.
+        :param str reader_backend: See PackageSetBase.
+        :param int reader_workers: See PackageSetBase.
+        :param int reader_chunk_size: See PackageSetBase.
         """
         super(KojiPackageSet, self).__init__(
             name,
@@ -376,6 +581,9 @@ class KojiPackageSet(PackageSetBase):
             arches=arches,
             logger=logger,
             allow_invalid_sigkeys=allow_invalid_sigkeys,
+            reader_backend=reader_backend,
+            reader_workers=reader_workers,
+            reader_chunk_size=reader_chunk_size,
         )
         self.koji_wrapper = koji_wrapper
         # Names of packages to look for in the Koji tag.
@@ -757,13 +965,19 @@ class KojiPackageSet(PackageSetBase):
 
             if inherit:
                 inherit_tags = self.koji_proxy.getFullInheritance(tag, koji_event)
-                for t in inherit_tags:
-                    changed = self.koji_proxy.queryHistory(
-                        tables=["tag_listing", "tag_inheritance"],
-                        tag=t["name"],
-                        afterEvent=min(koji_event, old_koji_event),
-                        beforeEvent=max(koji_event, old_koji_event) + 1,
-                    )
+                history = self.koji_wrapper.batched_multicall_map(
+                    "queryHistory",
+                    list_of_kwargs=[
+                        {
+                            "tables": ["tag_listing", "tag_inheritance"],
+                            "tag": t["name"],
+                            "afterEvent": min(koji_event, old_koji_event),
+                            "beforeEvent": max(koji_event, old_koji_event) + 1,
+                        }
+                        for t in inherit_tags
+                    ],
+                )
+                for t, changed in zip(inherit_tags, history):
                     if changed["tag_listing"]:
                         self.log_debug(
                             "Builds under inherited tag %s changed. Can't reuse."
@@ -804,7 +1018,13 @@ class KojiPackageSet(PackageSetBase):
             self.reuse = old_repo_dir
             self.rpms_by_arch = reuse_data["rpms_by_arch"]
             self.srpms_by_name = reuse_data["srpms_by_name"]
-            if self.old_file_cache:
+            if isinstance(self.old_file_cache, RpmHeaderIndex):
+                # The index only creates objects on lookup, file cache needs
+                # the same objects that are in the package lists.
+                for rpms in self.rpms_by_arch.values():
+                    for rpm_obj in rpms:
+                        self._add_to_file_cache(rpm_obj)
+            elif self.old_file_cache:
                 self.file_cache = self.old_file_cache
             return True
         else:
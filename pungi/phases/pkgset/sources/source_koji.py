@@ -33,6 +33,8 @@ from pungi.util import (
     retry,
     get_arch_variant_data,
     get_variant_data,
+    PartialFuncThreadPool,
+    PartialFuncWorkerThread,
     read_single_module_stream_from_file,
     read_single_module_stream_from_string,
 )
@@ -608,12 +610,14 @@ def _get_modules_from_koji_tags(
                 latest_builds += list(nsv_builds)
                 break
 
+        # Get the Builds from Koji to get modulemd and module_tag.
+        latest_builds = koji_wrapper.batched_multicall_map(
+            "getBuild", [build["build_id"] for build in latest_builds]
+        )
+
         # For each latest modular Koji build, add it to variant and
         # variant_tags.
         for build in latest_builds:
-            # Get the Build from Koji to get modulemd and module_tag.
-            build = koji_proxy.getBuild(build["build_id"])
-
             nsvc = _add_module_to_variant(
                 koji_wrapper,
                 variant,
@@ -780,93 +784,37 @@ def populate_global_pkgset(compose, koji_wrapper, path_prefix, event):
     # Add global tag(s) if supplied.
     compose_tags.extend(pkgset_koji_tags)
 
-    inherit = compose.conf["pkgset_koji_inherit"]
-    inherit_modules = compose.conf["pkgset_koji_inherit_modules"]
-
-    pkgsets = []
-
     # Get package set for each compose tag and merge it to global package
     # list. Also prepare per-variant pkgset, because we do not have list
     # of binary RPMs in module definition - there is just list of SRPMs.
-    for compose_tag in compose_tags:
-        compose.log_info("Loading package set for tag %s", compose_tag)
-        if compose_tag in pkgset_koji_tags:
-            extra_builds = force_list(compose.conf.get("pkgset_koji_builds", []))
-            extra_tasks = force_list(compose.conf.get("pkgset_koji_scratch_tasks", []))
-        else:
-            extra_builds = []
-            extra_tasks = []
-
-        pkgset = pungi.phases.pkgset.pkgsets.KojiPackageSet(
-            compose_tag,
-            koji_wrapper,
-            compose.conf["sigkeys"],
-            logger=compose._logger,
-            arches=all_arches,
-            packages=packages_to_gather,
-            allow_invalid_sigkeys=allow_invalid_sigkeys,
-            populate_only_packages=populate_only_packages_to_gather,
-            cache_region=compose.cache_region,
-            extra_builds=extra_builds,
-            extra_tasks=extra_tasks,
-            signed_packages_retries=compose.conf["signed_packages_retries"],
-            signed_packages_wait=compose.conf["signed_packages_wait"],
-        )
-
-        # Check if we have cache for this tag from previous compose. If so, use
-        # it.
-        old_cache_path = compose.paths.old_compose_path(
-            compose.paths.work.pkgset_file_cache(compose_tag)
-        )
-        if old_cache_path:
-            pkgset.set_old_file_cache(
-                pungi.phases.pkgset.pkgsets.KojiPackageSet.load_old_file_cache(
-                    old_cache_path
-                )
+    # The tags are processed in parallel, the results are merged in the order
+    # of `compose_tags` afterwards so that the output does not depend on which
+    # tag finished first.
+    pool = PartialFuncThreadPool(compose._logger)
+    num_threads = min(compose.conf["pkgset_koji_num_threads"], len(compose_tags))
+    for i in range(max(num_threads, 1)):
+        pool.add(PartialFuncWorkerThread(pool))
+    for idx, compose_tag in enumerate(compose_tags):
+        pool.queue_put(
+            functools.partial(
+                _populate_tag_pkgset,
+                compose,
+                koji_wrapper,
+                event,
+                compose_tag,
+                idx,
+                pkgset_koji_tags=pkgset_koji_tags,
+                all_arches=all_arches,
+                packages_to_gather=packages_to_gather,
+                allow_invalid_sigkeys=allow_invalid_sigkeys,
+                populate_only_packages=populate_only_packages_to_gather,
             )
-
-        is_traditional = compose_tag in compose.conf.get("pkgset_koji_tag", [])
-        should_inherit = inherit if is_traditional else inherit_modules
-
-        # If we're processing a modular tag, we have an exact list of
-        # packages that will be used. This is basically a workaround for
-        # tagging working on build level, not rpm level. A module tag may
-        # build a package but not want it included. This should include
-        # only packages that are actually in modules. It's possible two
-        # module builds will use the same tag, particularly a -devel module
-        # is sharing a tag with its regular version.
-        # The ultimate goal of the mapping is to avoid a package built in modular
-        # tag to be used as a dependency of some non-modular package.
-        modular_packages = set()
-        for variant in compose.all_variants.values():
-            for nsvc, modular_tag in variant.module_uid_to_koji_tag.items():
-                if modular_tag != compose_tag:
-                    # Not current tag, skip it
-                    continue
-                for arch_modules in variant.arch_mmds.values():
-                    try:
-                        module = arch_modules[nsvc]
-                    except KeyError:
-                        # The module was filtered out
-                        continue
-                    for rpm_nevra in module.get_rpm_artifacts():
-                        nevra = parse_nvra(rpm_nevra)
-                        modular_packages.add((nevra["name"], nevra["arch"]))
-
-        pkgset.try_to_reuse(
-            compose,
-            compose_tag,
-            inherit=should_inherit,
-            include_packages=modular_packages,
         )
+    pool.start()
+    pool.stop()
 
-        if pkgset.reuse is None:
-            pkgset.populate(
-                compose_tag,
-                event,
-                inherit=should_inherit,
-                include_packages=modular_packages,
-            )
+    pkgsets = []
+    for _, compose_tag, pkgset in sorted(pool.results, key=lambda r: r[0]):
         for variant in compose.all_variants.values():
             if compose_tag in variant_tags[variant]:
 
@@ -881,7 +829,6 @@ def populate_global_pkgset(compose, koji_wrapper, path_prefix, event):
                 # tag - we do not have to merge in this case...
                 variant.pkgsets.add(compose_tag)
 
-        pkgset.write_reuse_file(compose, include_packages=modular_packages)
         pkgsets.append(pkgset)
 
     # Create MaterializedPackageSets.
@@ -899,6 +846,128 @@ def populate_global_pkgset(compose, koji_wrapper, path_prefix, event):
     return MaterializedPackageSet.create_many(partials)
 
 
+def _populate_tag_pkgset(
+    compose,
+    koji_wrapper,
+    event,
+    compose_tag,
+    idx,
+    pkgset_koji_tags,
+    all_arches,
+    packages_to_gather,
+    allow_invalid_sigkeys,
+    populate_only_packages,
+):
+    """
+    Create package set for a single compose tag, either by reusing the old
+    compose or by populating it from Koji.
+
+    This runs in a worker thread. All Koji calls are made through a session
+    from the pool shared by the workers.
+
+    :return: tuple (idx, compose_tag, pkgset)
+    """
+    compose.log_info("Loading package set for tag %s", compose_tag)
+    if compose_tag in pkgset_koji_tags:
+        extra_builds = force_list(compose.conf.get("pkgset_koji_builds", []))
+        extra_tasks = force_list(compose.conf.get("pkgset_koji_scratch_tasks", []))
+    else:
+        extra_builds = []
+        extra_tasks = []
+
+    pkgset = pungi.phases.pkgset.pkgsets.KojiPackageSet(
+        compose_tag,
+        koji_wrapper,
+        compose.conf["sigkeys"],
+        logger=compose._logger,
+        arches=all_arches,
+        packages=packages_to_gather,
+        allow_invalid_sigkeys=allow_invalid_sigkeys,
+        populate_only_packages=populate_only_packages,
+        cache_region=compose.cache_region,
+        extra_builds=extra_builds,
+        extra_tasks=extra_tasks,
+        signed_packages_retries=compose.conf["signed_packages_retries"],
+        signed_packages_wait=compose.conf["signed_packages_wait"],
+        reader_backend=compose.conf["pkgset_reader_backend"],
+        reader_workers=compose.conf.get("pkgset_reader_workers"),
+        reader_chunk_size=compose.conf["pkgset_reader_chunk_size"],
+    )
+
+    # Check if we have cache for this tag from previous compose. If so, use
+    # it.
+    old_index_path = compose.paths.old_compose_path(
+        compose.paths.work.pkgset_header_index(compose_tag)
+    )
+    old_cache_path = compose.paths.old_compose_path(
+        compose.paths.work.pkgset_file_cache(compose_tag)
+    )
+    old_index = None
+    if old_index_path:
+        old_index = pungi.phases.pkgset.pkgsets.KojiPackageSet.load_old_header_index(
+            old_index_path
+        )
+    if old_index is not None:
+        pkgset.set_old_file_cache(old_index)
+    elif old_cache_path:
+        # Old composes created before the header index was introduced.
+        pkgset.set_old_file_cache(
+            pungi.phases.pkgset.pkgsets.KojiPackageSet.load_old_file_cache(
+                old_cache_path
+            )
+        )
+
+    is_traditional = compose_tag in compose.conf.get("pkgset_koji_tag", [])
+    if is_traditional:
+        should_inherit = compose.conf["pkgset_koji_inherit"]
+    else:
+        should_inherit = compose.conf["pkgset_koji_inherit_modules"]
+
+    # If we're processing a modular tag, we have an exact list of
+    # packages that will be used. This is basically a workaround for
+    # tagging working on build level, not rpm level. A module tag may
+    # build a package but not want it included. This should include
+    # only packages that are actually in modules. It's possible two
+    # module builds will use the same tag, particularly a -devel module
+    # is sharing a tag with its regular version.
+    # The ultimate goal of the mapping is to avoid a package built in modular
+    # tag to be used as a dependency of some non-modular package.
+    modular_packages = set()
+    for variant in compose.all_variants.values():
+        for nsvc, modular_tag in variant.module_uid_to_koji_tag.items():
+            if modular_tag != compose_tag:
+                # Not current tag, skip it
+                continue
+            for arch_modules in variant.arch_mmds.values():
+                try:
+                    module = arch_modules[nsvc]
+                except KeyError:
+                    # The module was filtered out
+                    continue
+                for rpm_nevra in module.get_rpm_artifacts():
+                    nevra = parse_nvra(rpm_nevra)
+                    modular_packages.add((nevra["name"], nevra["arch"]))
+
+    with koji_wrapper.pooled_session():
+        pkgset.try_to_reuse(
+            compose,
+            compose_tag,
+            inherit=should_inherit,
+            include_packages=modular_packages,
+        )
+
+        if pkgset.reuse is None:
+            pkgset.populate(
+                compose_tag,
+                event,
+                inherit=should_inherit,
+                include_packages=modular_packages,
+            )
+
+    pkgset.write_reuse_file(compose, include_packages=modular_packages)
+    return idx, compose_tag, pkgset
+
+
 def get_koji_event_info(compose, koji_wrapper):
     event_file = os.path.join(compose.paths.work.topdir(arch="global"), "koji-event")
 
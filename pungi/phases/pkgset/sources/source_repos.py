@@ -141,7 +141,13 @@ def populate_global_pkgset(compose, file_list, path_prefix):
 
     compose.log_info("Populating the global package set from a file list")
     pkgset = pungi.phases.pkgset.pkgsets.FilelistPackageSet(
-        "repos", compose.conf["sigkeys"], logger=compose._logger, arches=ALL_ARCHES
+        "repos",
+        compose.conf["sigkeys"],
+        logger=compose._logger,
+        arches=ALL_ARCHES,
+        reader_backend=compose.conf["pkgset_reader_backend"],
+        reader_workers=compose.conf.get("pkgset_reader_workers"),
+        reader_chunk_size=compose.conf["pkgset_reader_chunk_size"],
     )
     pkgset.populate(file_list)
 
@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import sys
+import threading
+
+import six
 from kobo import shortcuts
 from kobo.threads import ThreadPool, WorkerThread
 
@@ -79,3 +83,244 @@ class PipelineThread(WorkerThread):
             phase.stop()
 
         self.pool.log_info("[DONE ] %s" % (msg,))
+
+
+class GraphWeaverPhase(object):
+    """
+    Special "phase" that runs other phases and tasks as soon as everything
+    they depend on is finished.
+
+    Unlike `WeaverPhase` there is no fixed schema. Each item is added with a
+    name and a list of names of items it requires. An item can be a phase
+    (it is started and stopped) or any callable (e.g. writing metadata for a
+    single variant). Items that are ready at the same time are dispatched in
+    the order of their critical path, i.e. the item with the longest chain of
+    work depending on it goes first. This only matters when the number of
+    concurrently running items is limited by `max_running`.
+
+    Phases can also report progress on their own: a signal item does not run
+    anything, it is finished when `signal` is called with its name (e.g. when
+    a repo for one variant is created), or together with the phase that owns
+    it at the latest. Phases that process variants independently can be
+    driven per item with `add_phase_items`.
+
+    If any item fails, no new items are started, the running ones are allowed
+    to finish and the first exception is re-raised from `stop`.
+
+    :param compose: it is needed for logging
+    :param max_running: maximum number of callables running at the same time,
+        unlimited by default. Phases are not counted, they run their own
+        thread pools.
+    """
+
+    name = "weaver"
+
+    def __init__(self, compose, max_running=None):
+        self.msg = "---------- PHASE: %s ----------" % self.name.upper()
+        self.compose = compose
+        self.max_running = max_running
+        self.finished = False
+        self.exceptions = []
+        self._nodes = []
+        self._requires = {}
+        self._targets = {}
+        self._weights = {}
+        self._limited = {}
+        # Signal item name -> name of item that owns it
+        self._owners = {}
+        self._signalled = set()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def _add_node(self, name, requires, weight):
+        if name in self._requires:
+            raise ValueError("Item '%s' is already added to %s" % (name, self.name))
+        self._nodes.append(name)
+        self._requires[name] = list(requires)
+        self._weights[name] = weight
+
+    def add(self, name, target, requires=(), weight=1, limited=None):
+        """Add an item to the graph. `target` is either a phase or a callable
+        without arguments. `requires` are names of items that need to finish
+        before this one is started. `weight` is the estimated relative cost
+        of the item, used to compute critical paths. `limited` tells whether
+        the item counts towards `max_running`, by default only callables do.
+        """
+        self._add_node(name, requires, weight)
+        self._targets[name] = target
+        if limited is None:
+            limited = not hasattr(target, "start")
+        self._limited[name] = limited
+
+    def add_phase(self, phase, requires=(), weight=1):
+        """Add a phase to the graph, using its name as the item name."""
+        self.add(phase.name, phase, requires=requires, weight=weight)
+
+    def add_signal(self, name, owner):
+        """Add an item that is finished by calling `signal` with its name, or
+        when item `owner` finishes.
+        """
+        self._add_node(name, [], 0)
+        self._owners[name] = owner
+
+    def signal(self, name):
+        """Mark signal item as finished. Unknown names are ignored, so phases
+        can report all their progress without checking what is in the graph.
+        """
+        with self._cond:
+            if name in self._owners:
+                self._signalled.add(name)
+                self._cond.notify_all()
+
+    def add_phase_items(self, phase, items, requires=(), weight=1):
+        """Add a phase that processes each of `items` as soon as the item is
+        ready. Items are ``(name, target, requires)`` tuples, `target` is a
+        callable handing the item over to the phase.
+
+        The phase is started once its own `requires` are finished (as item
+        ``<phase>-start``), and stopped after all items are handed over. The
+        item named after the phase is finished when the phase stops.
+        """
+        start = "%s-start" % phase.name
+        self.add(start, phase.start, requires=requires, limited=False)
+        names = []
+        for name, target, item_requires in items:
+            self.add(name, target, requires=[start] + list(item_requires))
+            names.append(name)
+        self.add(
+            phase.name,
+            phase.stop,
+            requires=[start] + names,
+            weight=weight,
+            limited=False,
+        )
+
+    def _get_priorities(self):
+        """Compute length of the critical path starting at each item and check
+        that the graph is valid.
+        """
+        dependants = dict((name, []) for name in self._nodes)
+        for name in self._nodes:
+            for req in self._requires[name]:
+                if req not in dependants:
+                    raise ValueError(
+                        "Item '%s' requires unknown item '%s'" % (name, req)
+                    )
+                dependants[req].append(name)
+        for name, owner in self._owners.items():
+            if owner not in dependants:
+                raise ValueError(
+                    "Item '%s' is owned by unknown item '%s'" % (name, owner)
+                )
+            # Work waiting for the signal is on the critical path of the owner.
+            dependants[owner].append(name)
+
+        priorities = {}
+        visiting = set()
+
+        def visit(name):
+            if name in priorities:
+                return priorities[name]
+            if name in visiting:
+                raise ValueError("Dependency cycle detected at item '%s'" % name)
+            visiting.add(name)
+            priorities[name] = self._weights[name] + max(
+                [visit(dep) for dep in dependants[name]] or [0]
+            )
+            visiting.remove(name)
+            return priorities[name]
+
+        for name in self._nodes:
+            visit(name)
+        return priorities
+
+    def start(self):
+        if self.finished:
+            msg = (
+                "Phase '%s' has already finished and can not be started twice"
+                % self.name
+            )
+            self.compose.log_error(msg)
+            raise RuntimeError(msg)
+
+        self._priorities = self._get_priorities()
+        self.compose.log_info("[BEGIN] %s" % self.msg)
+        self.run()
+
+    def run(self):
+        self._thread = threading.Thread(target=self._dispatch)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self.finished:
+            return
+        if self._thread:
+            self._thread.join()
+        self.finished = True
+        if self.exceptions:
+            exc_info = self.exceptions[0]
+            six.reraise(exc_info[0], exc_info[1], exc_info[2])
+        self.compose.log_info("[DONE ] %s" % self.msg)
+
+    def _get_ready(self, pending, done):
+        order = dict((name, idx) for idx, name in enumerate(self._nodes))
+        ready = [
+            name for name in pending if all(req in done for req in self._requires[name])
+        ]
+        return sorted(ready, key=lambda name: (-self._priorities[name], order[name]))
+
+    def _dispatch(self):
+        pending = set(name for name in self._nodes if name not in self._owners)
+        done = set()
+        running = set()
+        with self._cond:
+            while True:
+                done.update(self._signalled)
+                if not self.exceptions:
+                    num_limited = len([n for n in running if self._limited[n]])
+                    for name in self._get_ready(pending, done):
+                        if self._limited[name]:
+                            if self.max_running and num_limited >= self.max_running:
+                                continue
+                            num_limited += 1
+                        pending.remove(name)
+                        running.add(name)
+                        thread = threading.Thread(
+                            target=self._run_item, args=(name, running, done)
+                        )
+                        thread.daemon = True
+                        thread.start()
+                if not running:
+                    break
+                self._cond.wait()
+
+    def _run_item(self, name, running, done):
+        target = self._targets[name]
+        msg = "Running %s" % name
+        self.compose.log_debug("[BEGIN] %s" % msg)
+        failed = False
+        try:
+            if hasattr(target, "start"):
+                target.start()
+                target.stop()
+            else:
+                target()
+        except Exception:
+            failed = True
+            with self._cond:
+                self.exceptions.append(sys.exc_info())
+        else:
+            self.compose.log_debug("[DONE ] %s" % msg)
+        finally:
+            with self._cond:
+                running.remove(name)
+                if not failed:
+                    done.add(name)
+                    # Anything the item did not signal is finished now.
+                    done.update(
+                        signal
+                        for signal, owner in self._owners.items()
+                        if owner == name
+                    )
+                self._cond.notify_all()
@@ -31,6 +31,10 @@ or
 with Profiler("label2"):
     ...
 
+or, to only count how many times something happened:
+
+Profiler.count("label3", num)
+
 
 To print profiling data, run:
 Profiler.print_results()
@@ -67,6 +71,12 @@ class Profiler(object):
 
         return decorated
 
+    @classmethod
+    def count(cls, name, num=1):
+        """Add `num` to call count of `name` without measuring any time."""
+        cls._data.setdefault(name, {"time": 0, "calls": 0})
+        cls._data[name]["calls"] += num
+
     @classmethod
     def print_results(cls, stream=sys.stdout):
         print("Profiling results:", file=sys.stdout)
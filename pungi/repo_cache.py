@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://gnu.org/licenses/>.
+
+"""
+In-memory cache of data parsed from repositories.
+
+The same repositories (package set repos, lookaside repos of variants) are
+parsed many times during gather, once for each variant and arch using them.
+Values are keyed by checksum of ``repomd.xml`` of the repo, so a repository
+that is regenerated is not served from the cache.
+
+The cache has an upper bound on its size. Each value is weighted by an
+estimate of memory it takes in bytes, and when the total exceeds the limit,
+least recently used values are dropped. The limit can be changed with the
+``gather_repo_cache_size`` option.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from pungi.util import as_local_file
+
+# Parsed metadata of a few large distribution repos, in bytes.
+DEFAULT_MAX_WEIGHT = 4 * 1024 * 1024 * 1024
+
+
+def get_repomd_checksum(path):
+    """Return SHA256 checksum of repomd.xml of repo at `path`, which can be a
+    local path or a URL.
+    """
+    with as_local_file(os.path.join(path, "repodata/repomd.xml")) as repomd:
+        with open(repomd, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+
+class RepoCache(object):
+    """Thread safe LRU cache. Each value has a weight, and the total weight
+    of cached values is kept under `max_weight`.
+    """
+
+    def __init__(self, max_weight=DEFAULT_MAX_WEIGHT):
+        self.max_weight = max_weight
+        self.weight = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, loader):
+        """Return value for `key`. If it is not cached, `loader` is called to
+        create it. It must return a tuple of value and its weight. Concurrent
+        requests for the same key wait for the first one to load it.
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                with self._lock:
+                    if key in self._values:
+                        value, weight = self._values.pop(key)
+                        self._values[key] = (value, weight)
+                        return value
+                value, weight = loader()
+                with self._lock:
+                    self._add(key, value, weight)
+                return value
+            finally:
+                # Threads already waiting keep their reference, new requests
+                # will find the value in the cache.
+                with self._lock:
+                    if self._key_locks.get(key) is key_lock:
+                        del self._key_locks[key]
+
+    def clear(self):
+        """Drop all cached values."""
+        with self._lock:
+            self._values.clear()
+            self.weight = 0
+
+    def resize(self, max_weight):
+        """Change the limit, dropping values that no longer fit."""
+        with self._lock:
+            self.max_weight = max_weight
+            self._evict(0)
+
+    def _evict(self, weight):
+        while self._values and self.weight + weight > self.max_weight:
+            _, (_, old_weight) = self._values.popitem(last=False)
+            self.weight -= old_weight
+
+    def _add(self, key, value, weight):
+        if weight > self.max_weight:
+            # Caching this would evict everything else.
+            return
+        self._evict(weight)
+        self._values[key] = (value, weight)
+        self.weight += weight
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._values
+
+    def __len__(self):
+        with self._lock:
+            return len(self._values)
+
+
+# Cache shared by all gather threads.
+repo_cache = RepoCache()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://gnu.org/licenses/>.
+
+"""
+RPM manifest of a compose with an index for repository creation.
+
+The manifest is filled by gather phase as packages are linked into the compose
+and then only read. Createrepo needs all packages of one category in a variant
+and arch, which with the plain nested structure of the manifest means walking
+all SRPMs of the variant and arch and checking each RPM.
+"""
+
+import threading
+
+from productmd.rpms import Rpms
+
+
+class RpmManifest(Rpms):
+    """Rpms manifest that also keeps packages indexed by variant UID, arch
+    and category. The index is updated by `add` and when the manifest is
+    loaded from a file. Adding and reading packages is thread safe.
+    """
+
+    def __init__(self):
+        super(RpmManifest, self).__init__()
+        self._index = {}
+        self._index_lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path):
+        manifest = cls()
+        manifest.load(path)
+        return manifest
+
+    def add(self, variant, arch, nevra, path, sigkey, category, srpm_nevra=None):
+        with self._index_lock:
+            super(RpmManifest, self).add(
+                variant, arch, nevra, path, sigkey, category, srpm_nevra=srpm_nevra
+            )
+            nevra, _ = self._check_nevra(nevra)
+            self._add_to_index(variant, arch, category, nevra, path)
+
+    def _add_to_index(self, variant, arch, category, nevra, path):
+        arches = self._index.setdefault(variant, {})
+        arches.setdefault(arch, {}).setdefault(category, []).append((nevra, path))
+
+    def deserialize(self, data):
+        with self._index_lock:
+            super(RpmManifest, self).deserialize(data)
+            self._index = {}
+            for variant, arches in self.rpms.items():
+                for arch, srpms in arches.items():
+                    for rpms in srpms.values():
+                        for nevra, rpm in rpms.items():
+                            self._add_to_index(
+                                variant, arch, rpm["category"], nevra, rpm["path"]
+                            )
+
+    def get_packages(self, variant, arch, category):
+        """Return list of (nevra, path) tuples for packages of given category
+        in variant and arch. If arch is None, packages from all arches are
+        returned.
+        """
+        with self._index_lock:
+            arches = self._index.get(variant, {})
+            if arch is not None:
+                return list(arches.get(arch, {}).get(category, []))
+            result = []
+            for categories in arches.values():
+                result.extend(categories.get(category, []))
+            return result
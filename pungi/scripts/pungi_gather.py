@@ -78,6 +78,11 @@ def get_parser():
         help="path to temp dir (default: /tmp)",
         default="/tmp",
     )
+    group.add_argument(
+        "--solv-cache-dir",
+        metavar="PATH",
+        help="directory with libsolv cache files shared between runs",
+    )
     group.add_argument(
         "--exclude-source",
         action="store_true",
@@ -97,7 +102,7 @@ def main(ns, persistdir, cachedir):
     dnf_conf = Conf(ns.arch)
     dnf_conf.persistdir = persistdir
     dnf_conf.cachedir = cachedir
-    dnf_obj = DnfWrapper(dnf_conf)
+    dnf_obj = DnfWrapper(dnf_conf, solv_cache_dir=ns.solv_cache_dir)
 
     gather_opts = GatherOptions()
 
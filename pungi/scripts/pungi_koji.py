@@ -5,6 +5,7 @@ from __future__ import print_function
 
 import argparse
 import getpass
+import functools
 import glob
 import json
 import locale
@@ -359,6 +360,37 @@ def main():
         raise
 
 
+def _write_tree_metadata(compose, arch, variant, buildinstall_phase):
+    import pungi.metadata
+
+    pungi.metadata.write_tree_info(compose, arch, variant, bi=buildinstall_phase)
+    if variant.type == "addon" or variant.is_empty:
+        return
+    timestamp = pungi.metadata.write_discinfo(compose, arch, variant)
+    pungi.metadata.write_media_repo(compose, arch, variant, timestamp)
+
+
+def _get_item_name(prefix, variant, arch):
+    return "%s-%s.%s" % (prefix, variant.uid, arch)
+
+
+def _get_related_items(prefix, variants, arch):
+    """Return names of items for arch of given variants, their parents and
+    child variants (addons share the tree with their parent).
+    """
+    related = set()
+    for variant in variants:
+        related.add(variant)
+        if variant.parent:
+            related.add(variant.parent)
+        related.update(variant.get_variants(arch=arch))
+    return sorted(
+        _get_item_name(prefix, variant, arch)
+        for variant in related
+        if arch == "src" or arch in variant.arches
+    )
+
+
 def run_compose(
     compose, create_latest_link=True, latest_link_status=None, latest_link_components=-1
 ):
@@ -398,13 +430,20 @@ def run_compose(
     buildinstall_phase = pungi.phases.BuildinstallPhase(compose, pkgset_phase)
     gather_phase = pungi.phases.GatherPhase(compose, pkgset_phase)
     extrafiles_phase = pungi.phases.ExtraFilesPhase(compose, pkgset_phase)
-    createrepo_phase = pungi.phases.CreaterepoPhase(compose, pkgset_phase)
+    createrepo_phase = pungi.phases.CreaterepoPhase(
+        compose, pkgset_phase, gather_phase
+    )
     ostree_installer_phase = pungi.phases.OstreeInstallerPhase(
         compose, buildinstall_phase, pkgset_phase
     )
     ostree_phase = pungi.phases.OSTreePhase(compose, pkgset_phase)
-    createiso_phase = pungi.phases.CreateisoPhase(compose, buildinstall_phase)
-    extra_isos_phase = pungi.phases.ExtraIsosPhase(compose, buildinstall_phase)
+    # ISOs are queued per variant and arch by the weaver below.
+    createiso_phase = pungi.phases.CreateisoPhase(
+        compose, buildinstall_phase, stream=True
+    )
+    extra_isos_phase = pungi.phases.ExtraIsosPhase(
+        compose, buildinstall_phase, stream=True
+    )
     liveimages_phase = pungi.phases.LiveImagesPhase(compose)
     livemedia_phase = pungi.phases.LiveMediaPhase(compose)
     image_build_phase = pungi.phases.ImageBuildPhase(compose, buildinstall_phase)
@@ -499,54 +538,105 @@ def run_compose(
     pkgset_phase.start()
     pkgset_phase.stop()
 
-    # WEAVER phase - launches other phases which can safely run in parallel
-    essentials_schema = (
-        buildinstall_phase,
-        (gather_phase, createrepo_phase),
-        extrafiles_phase,
-        (ostree_phase, ostree_installer_phase),
+    # WEAVER phase - launches other phases as soon as everything they depend
+    # on is finished
+    weaver_phase = pungi.phases.GraphWeaverPhase(
+        compose, max_running=compose.conf["max_parallel_tasks"]
     )
-    essentials_phase = pungi.phases.WeaverPhase(compose, essentials_schema)
-    essentials_phase.start()
-    essentials_phase.stop()
-
-    # write treeinfo before ISOs are created
+    weaver_phase.add_phase(buildinstall_phase)
+    weaver_phase.add_phase(gather_phase)
+    # Repos are created as gather links packages for each variant and arch.
+    weaver_phase.add_phase(createrepo_phase)
+    weaver_phase.add_phase(extrafiles_phase)
+    weaver_phase.add_phase(ostree_phase)
+    weaver_phase.add_phase(ostree_installer_phase, requires=[ostree_phase.name])
+    # Phases that put content into the trees other than packages and repos
+    tree_phases = [
+        buildinstall_phase.name,
+        extrafiles_phase.name,
+        ostree_phase.name,
+        ostree_installer_phase.name,
+    ]
+    essentials = tree_phases + [gather_phase.name, createrepo_phase.name]
+
+    # Createrepo phase reports each variant and arch once all its repos are
+    # created. If some are never created (e.g. the phase is skipped), they
+    # are done when the phase finishes.
     for variant in compose.get_variants():
         for arch in variant.arches + ["src"]:
-            pungi.metadata.write_tree_info(
-                compose, arch, variant, bi=buildinstall_phase
+            weaver_phase.add_signal(
+                _get_item_name("createrepo", variant, arch), createrepo_phase.name
             )
+    createrepo_phase.add_repo_listener(
+        lambda variant, arch: weaver_phase.signal(
+            _get_item_name("createrepo", variant, arch)
+        )
+    )
 
-    # write .discinfo and media.repo before ISOs are created
+    # write treeinfo, .discinfo and media.repo before ISOs are created
+    metadata = []
     for variant in compose.get_variants():
-        if variant.type == "addon" or variant.is_empty:
-            continue
         for arch in variant.arches + ["src"]:
-            timestamp = pungi.metadata.write_discinfo(compose, arch, variant)
-            pungi.metadata.write_media_repo(compose, arch, variant, timestamp)
+            name = _get_item_name("metadata", variant, arch)
+            weaver_phase.add(
+                name,
+                functools.partial(
+                    _write_tree_metadata, compose, arch, variant, buildinstall_phase
+                ),
+                requires=tree_phases
+                + _get_related_items("createrepo", [variant], arch),
+            )
+            metadata.append(name)
 
-    # Run phases for image artifacts in parallel
-    compose_images_schema = (
+    # ISOs for each variant and arch are created as soon as the metadata of
+    # the trees they contain are written.
+    weaver_phase.add_phase_items(
         createiso_phase,
-        extra_isos_phase,
+        [
+            (
+                _get_item_name(createiso_phase.name, variant, arch),
+                functools.partial(createiso_phase.queue_item, variant, arch),
+                _get_related_items("metadata", [variant], arch),
+            )
+            for variant, arch in createiso_phase.get_items()
+        ],
+        requires=tree_phases,
+    )
+    extra_isos = []
+    for idx, (config, variant, arch) in enumerate(extra_isos_phase.get_items()):
+        included = [
+            compose.all_variants[uid]
+            for uid in config["include_variants"]
+            if uid in compose.all_variants
+        ]
+        extra_isos.append(
+            (
+                "%s-%d" % (_get_item_name(extra_isos_phase.name, variant, arch), idx),
+                functools.partial(extra_isos_phase.queue_item, config, variant, arch),
+                _get_related_items("metadata", [variant] + included, arch),
+            )
+        )
+    weaver_phase.add_phase_items(extra_isos_phase, extra_isos, requires=tree_phases)
+
+    # Phases for other image artifacts
+    compose_images = [
         liveimages_phase,
         image_build_phase,
         livemedia_phase,
         osbuild_phase,
-    )
-    post_image_phase = pungi.phases.WeaverPhase(
-        compose, (image_checksum_phase, image_container_phase)
-    )
-    compose_images_phase = pungi.phases.WeaverPhase(compose, compose_images_schema)
-    extra_phase_schema = (
-        (compose_images_phase, post_image_phase),
-        osbs_phase,
-        repoclosure_phase,
-    )
-    extra_phase = pungi.phases.WeaverPhase(compose, extra_phase_schema)
+    ]
+    for phase in compose_images:
+        weaver_phase.add_phase(phase, requires=essentials + metadata)
+    compose_images += [createiso_phase, extra_isos_phase]
+    for phase in (image_checksum_phase, image_container_phase):
+        weaver_phase.add_phase(phase, requires=[p.name for p in compose_images])
+
+    # These only need the repositories
+    weaver_phase.add_phase(osbs_phase, requires=essentials)
+    weaver_phase.add_phase(repoclosure_phase, requires=essentials)
 
-    extra_phase.start()
-    extra_phase.stop()
+    weaver_phase.start()
+    weaver_phase.stop()
 
     pungi.metadata.write_compose_info(compose)
     if not (
@@ -565,6 +655,7 @@ def run_compose(
     test_phase.start()
     test_phase.stop()
 
+    compose.save_checksum_cache()
     compose.write_status("FINISHED")
     osbs_phase.request_push()
     latest_link = False
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://gnu.org/licenses/>.
+
+"""
+Store of libsolv cache files shared by multiple DNF sacks.
+
+When loading a repository, libdnf writes ``<repoid>.solv`` and
+``<repoid>-<ext>.solvx`` files into the sack cache directory and reuses them
+on the next load if the checksum of ``repomd.xml`` they were built from still
+matches. The files are however named after the repo id, which is not unique
+within a compose: each pungi-gather run uses ``pungi-repo-0`` for a different
+repository.
+
+This module keeps the files in a directory keyed by the SHA256 checksum of
+``repomd.xml`` instead. Before a sack is filled, cached files are symlinked
+into the sack cache directory under the name libdnf expects. Files libdnf
+writes (it replaces the symlink if the cache is not usable) are copied back
+into the store afterwards. All writes into the store are atomic renames, so
+the directory can be shared by concurrent processes.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+from pungi.util import makedirs
+
+# Suffixes of files libdnf creates for a single repository.
+SOLV_SUFFIXES = (
+    ".solv",
+    "-filenames.solvx",
+    "-presto.solvx",
+    "-updateinfo.solvx",
+    "-other.solvx",
+)
+
+
+def get_local_path(baseurl):
+    """Return local path for repo `baseurl`, or None if it is a remote URL."""
+    if baseurl.startswith("file://"):
+        return baseurl[len("file://") :]
+    if baseurl.startswith("/"):
+        return baseurl
+    return None
+
+
+class SolvCache(object):
+    def __init__(self, path):
+        self.path = path
+        makedirs(self.path)
+
+    def get_key(self, baseurl):
+        """Return cache key for repository at `baseurl`. Only local
+        repositories can be cached, None is returned for any other.
+        """
+        path = get_local_path(baseurl)
+        if not path:
+            return None
+        try:
+            with open(os.path.join(path, "repodata", "repomd.xml"), "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except (IOError, OSError):
+            return None
+
+    def link_into(self, cachedir, repoid, key):
+        """Make cached files for `key` available in `cachedir` as files of
+        repository `repoid`. Returns number of linked files.
+        """
+        makedirs(cachedir)
+        count = 0
+        for suffix in SOLV_SUFFIXES:
+            src = os.path.join(self.path, key + suffix)
+            if not os.path.exists(src):
+                continue
+            dest = os.path.join(cachedir, repoid + suffix)
+            if os.path.lexists(dest):
+                os.remove(dest)
+            os.symlink(src, dest)
+            count += 1
+        return count
+
+    def store_from(self, cachedir, repoid, key):
+        """Copy files written by libdnf for `repoid` in `cachedir` into the
+        store under `key`. Files that are still links to the store are
+        skipped. Returns number of stored files.
+        """
+        count = 0
+        for suffix in SOLV_SUFFIXES:
+            src = os.path.join(cachedir, repoid + suffix)
+            if os.path.islink(src) or not os.path.isfile(src):
+                continue
+            fd, tmp = tempfile.mkstemp(prefix=key + suffix + ".", dir=self.path)
+            os.close(fd)
+            try:
+                shutil.copyfile(src, tmp)
+                os.chmod(tmp, 0o644)
+                os.rename(tmp, os.path.join(self.path, key + suffix))
+            except Exception:
+                os.remove(tmp)
+                raise
+            count += 1
+        return count
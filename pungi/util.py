@@ -26,8 +26,10 @@ import re
 import contextlib
 import traceback
 import tempfile
+import threading
 import time
 import functools
+import fcntl
 from six.moves import urllib, range, shlex_quote
 
 import kobo.conf
@@ -498,40 +500,108 @@ def get_file_size(path):
     return os.path.getsize(path)
 
 
-def find_old_compose(
-    old_compose_dirs,
-    release_short,
-    release_version,
-    release_type_suffix,
-    base_product_short=None,
-    base_product_version=None,
-    allowed_statuses=None,
-):
-    allowed_statuses = allowed_statuses or ("FINISHED", "FINISHED_INCOMPLETE", "DOOMED")
-    composes = []
+def _sortable_compose_id(compose_id):
+    """Convert ID to tuple where respin is an integer for proper sorting."""
+    try:
+        prefix, respin = compose_id.rsplit(".", 1)
+        return (prefix, int(respin))
+    except Exception:
+        return compose_id
 
-    def _sortable(compose_id):
-        """Convert ID to tuple where respin is an integer for proper sorting."""
-        try:
-            prefix, respin = compose_id.rsplit(".", 1)
-            return (prefix, int(respin))
-        except Exception:
-            return compose_id
 
-    for compose_dir in force_list(old_compose_dirs):
-        if not os.path.isdir(compose_dir):
-            continue
+class OldComposeIndex(object):
+    """Index of composes in old compose directories. The directories are
+    listed and each STATUS file is read at most once, and results of lookups
+    are remembered. Changes on the disk are only seen after `refresh` is
+    called.
+    """
 
-        # get all finished composes
-        for i in os.listdir(compose_dir):
+    def __init__(self, old_compose_dirs):
+        self.old_compose_dirs = force_list(old_compose_dirs)
+        self._lock = threading.Lock()
+        self._entries = None
+        self._statuses = {}
+        self._found = {}
+
+    def refresh(self):
+        """Forget everything, next lookup will scan the directories again."""
+        with self._lock:
+            self._entries = None
+            self._statuses = {}
+            self._found = {}
+
+    def _get_entries(self):
+        if self._entries is None:
+            self._entries = []
+            for compose_dir in self.old_compose_dirs:
+                if not os.path.isdir(compose_dir):
+                    continue
+                for i in os.listdir(compose_dir):
+                    self._entries.append((i, os.path.join(compose_dir, i)))
+        return self._entries
+
+    def _get_status(self, path):
+        if path not in self._statuses:
+            status = None
+            status_path = os.path.join(path, "STATUS")
+            if os.path.isdir(path) and os.path.isfile(status_path):
+                try:
+                    with open(status_path, "r") as f:
+                        status = f.read().strip()
+                except Exception:
+                    pass
+            self._statuses[path] = status
+        return self._statuses[path]
+
+    def find(
+        self,
+        release_short,
+        release_version,
+        release_type_suffix,
+        base_product_short=None,
+        base_product_version=None,
+        allowed_statuses=None,
+    ):
+        """Find path to the latest compose of given release with one of the
+        allowed statuses, or None if there is no such compose.
+
+        :param allowed_statuses: a status or a list of statuses
+        """
+        if allowed_statuses:
+            allowed_statuses = force_list(allowed_statuses)
+        else:
+            allowed_statuses = ("FINISHED", "FINISHED_INCOMPLETE", "DOOMED")
+        key = (
+            release_short,
+            release_version,
+            release_type_suffix,
+            base_product_short,
+            base_product_version,
+            tuple(allowed_statuses),
+        )
+        with self._lock:
+            if key not in self._found:
+                self._found[key] = self._find(*key)
+            return self._found[key]
+
+    def _find(
+        self,
+        release_short,
+        release_version,
+        release_type_suffix,
+        base_product_short,
+        base_product_version,
+        allowed_statuses,
+    ):
+        pattern = "%s-%s%s" % (release_short, release_version, release_type_suffix)
+        if base_product_short:
+            pattern += "-%s" % base_product_short
+        if base_product_version:
+            pattern += "-%s" % base_product_version
+
+        composes = []
+        for i, path in self._get_entries():
             # TODO: read .composeinfo
-
-            pattern = "%s-%s%s" % (release_short, release_version, release_type_suffix)
-            if base_product_short:
-                pattern += "-%s" % base_product_short
-            if base_product_version:
-                pattern += "-%s" % base_product_version
-
             if not i.startswith(pattern):
                 continue
 
@@ -541,25 +611,32 @@ def find_old_compose(
                 # is an updates-testing as well.
                 continue
 
-            path = os.path.join(compose_dir, i)
-            if not os.path.isdir(path):
-                continue
+            if self._get_status(path) in allowed_statuses:
+                composes.append((_sortable_compose_id(i), os.path.abspath(path)))
 
-            status_path = os.path.join(path, "STATUS")
-            if not os.path.isfile(status_path):
-                continue
+        if not composes:
+            return None
 
-            try:
-                with open(status_path, "r") as f:
-                    if f.read().strip() in allowed_statuses:
-                        composes.append((_sortable(i), os.path.abspath(path)))
-            except Exception:
-                continue
+        return sorted(composes)[-1][1]
 
-    if not composes:
-        return None
 
-    return sorted(composes)[-1][1]
+def find_old_compose(
+    old_compose_dirs,
+    release_short,
+    release_version,
+    release_type_suffix,
+    base_product_short=None,
+    base_product_version=None,
+    allowed_statuses=None,
+):
+    return OldComposeIndex(old_compose_dirs).find(
+        release_short,
+        release_version,
+        release_type_suffix,
+        base_product_short,
+        base_product_version,
+        allowed_statuses,
+    )
 
 
 def process_args(fmt, args):
@@ -634,6 +711,135 @@ def get_format_substs(compose, **kwargs):
     return substs
 
 
+# ioctl to make a file share data blocks with another one (from linux/fs.h)
+FICLONE = 0x40049409
+
+# Errors meaning that data can not be shared or copied in kernel between the
+# two files. Anything else is a real failure.
+CLONE_UNSUPPORTED_ERRNOS = (
+    errno.EXDEV,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EINVAL,
+    errno.ENOSYS,
+)
+
+# Results of previous attempts to clone data: {(src_dev, dst_dev): bool}
+_reflink_support = {}
+_copy_file_range_support = {}
+
+
+def _get_device_pair(src, dst):
+    dst_dir = os.path.dirname(os.path.abspath(dst))
+    return os.stat(src).st_dev, os.stat(dst_dir).st_dev
+
+
+def _ficlone(src_fd, dst_fd, size):
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+
+
+def _copy_file_range(src_fd, dst_fd, size):
+    copied = 0
+    while copied < size:
+        num = os.copy_file_range(src_fd, dst_fd, size - copied)
+        if not num:
+            break
+        copied += num
+
+
+def _clone_data(src, dst, func, support):
+    """Fill existing empty file `dst` with data from `src` using given
+    function. Whether it works for the pair of devices is remembered in
+    `support`, and once it fails, it will not be tried again for the same
+    pair.
+
+    :return: True on success, False if it is not supported
+    """
+    devices = _get_device_pair(src, dst)
+    if support.get(devices) is False:
+        return False
+    with open(src, "rb") as f:
+        fd = os.open(dst, os.O_WRONLY | os.O_TRUNC)
+        try:
+            func(f.fileno(), fd, os.fstat(f.fileno()).st_size)
+        except (IOError, OSError) as exc:
+            if exc.errno not in CLONE_UNSUPPORTED_ERRNOS:
+                raise
+            support[devices] = False
+            return False
+        finally:
+            os.close(fd)
+    support[devices] = True
+    return True
+
+
+# Python 2 has no dedicated exception for this.
+SameFileError = getattr(shutil, "SameFileError", shutil.Error)
+
+
+def _replace_file(src, dst, fill):
+    """Call ``fill(tmp)`` to write a temporary file next to `dst`, and if it
+    returns True, rename the file over `dst`. An existing `dst` is thus
+    replaced rather than truncated, which would destroy data shared with
+    hardlinks of it.
+
+    :raises SameFileError: if `dst` is `src` or a hardlink or symlink to it
+    :return: value returned by `fill`
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise SameFileError("%s and %s are the same file" % (src, dst))
+    fd, tmp = tempfile.mkstemp(
+        prefix=".%s." % os.path.basename(dst),
+        dir=os.path.dirname(os.path.abspath(dst)),
+    )
+    os.close(fd)
+    try:
+        os.chmod(tmp, 0o644)
+        if fill(tmp):
+            os.rename(tmp, dst)
+            return True
+        return False
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def reflink_file(src, dst):
+    """Create `dst` as a copy of `src` that shares data blocks with it. This
+    only works on some filesystems (e.g. XFS or Btrfs) and within a single
+    filesystem. Existing destination is replaced. Metadata is not copied.
+
+    :return: True if the file was created, False if reflinks are not supported
+    """
+    return _replace_file(
+        src, dst, lambda tmp: _clone_data(src, tmp, _ficlone, _reflink_support)
+    )
+
+
+def copy_file(src, dst, reflink=True):
+    """Copy file data and metadata, same as ``shutil.copy2``. The data is
+    copied in kernel if possible, and with ``reflink`` set the copy will share
+    data blocks with the original on filesystems that support it. Existing
+    destination is replaced, copying a file onto itself raises
+    `SameFileError`.
+    """
+
+    def fill(tmp):
+        if reflink and _clone_data(src, tmp, _ficlone, _reflink_support):
+            pass
+        elif hasattr(os, "copy_file_range") and _clone_data(
+            src, tmp, _copy_file_range, _copy_file_range_support
+        ):
+            pass
+        else:
+            shutil.copyfile(src, tmp)
+        shutil.copystat(src, tmp)
+        return True
+
+    _replace_file(src, dst, fill)
+    return dst
+
+
 def copy_all(src, dest):
     """
     Copy all files and directories within ``src`` to the ``dest`` directory.
@@ -661,13 +867,16 @@ def copy_all(src, dest):
         source = os.path.join(src, item)
         destination = os.path.join(dest, item)
         if os.path.isdir(source):
-            shutil.copytree(source, destination)
+            if sys.version_info[0] == 3:
+                shutil.copytree(source, destination, copy_function=copy_file)
+            else:
+                shutil.copytree(source, destination)
         else:
             if os.path.islink(source):
                 # It's a symlink, we should preserve it instead of resolving.
                 os.symlink(os.readlink(source), destination)
             else:
-                shutil.copy2(source, destination)
+                copy_file(source, destination)
 
     return recursive_file_list(src)
 
@@ -1132,6 +1341,28 @@ class PartialFuncThreadPool(ThreadPool):
         return self._results
 
 
+class Worklist(object):
+    """Remember which items were already handed to named steps of an iterative
+    algorithm, so that each step only processes items it has not seen yet.
+    """
+
+    def __init__(self):
+        self._seen = {}  # {step: set(items)}
+
+    def get(self, step, items):
+        """Return a set of items from `items` that were not yet returned for
+        `step`, and mark them as seen.
+        """
+        seen = self._seen.setdefault(step, set())
+        new = set(items) - seen
+        seen.update(new)
+        return new
+
+    def retry(self, step, item):
+        """Make `item` returned for `step` again next time it is passed in."""
+        self._seen.get(step, set()).discard(item)
+
+
 def read_json_file(file_path):
     """A helper function to read a JSON file."""
     with open(file_path) as f:
@@ -87,8 +87,8 @@ class CreaterepoWrapper(object):
         if update:
             cmd.append("--update")
 
-        if update_md_path:
-            cmd.append("--update-md-path=%s" % update_md_path)
+        for i in force_list(update_md_path or []):
+            cmd.append("--update-md-path=%s" % i)
 
         if skip_stat:
             cmd.append("--skip-stat")
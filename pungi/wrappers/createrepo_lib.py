@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 2 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Library General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://gnu.org/licenses/>.
+
+"""
+Repository creation using Python bindings of createrepo_c.
+
+Instead of running createrepo_c for every repository (which reads headers of
+all packages again, or at least loads the old metadata for --update), package
+metadata is taken from repositories that already exist (the package set repos
+created in pkgset phase). The loaded repos are kept in a `PackageCache`
+shared by all repositories created by the compose, so each is only parsed
+once.
+
+Packages not found there are looked up in a `FragmentCache`, which persists
+the XML snippets of every package read so far across composes. Only packages
+never seen before are read from the RPM file.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+import createrepo_c as cr
+
+from pungi.util import makedirs
+
+# Same default as createrepo_c command line tool.
+CHANGELOG_LIMIT = 10
+
+RPM_LEAD_SIZE = 96
+RPM_HEADER_MAGIC = b"\x8e\xad\xe8\x01"
+
+
+def get_nevra(pkg):
+    """Return NEVRA of a createrepo_c package in the format used by the RPM
+    manifest, i.e. always including epoch.
+    """
+    return "%s-%s:%s-%s.%s" % (
+        pkg.name,
+        pkg.epoch or 0,
+        pkg.version,
+        pkg.release,
+        pkg.arch,
+    )
+
+
+def read_signature(path):
+    """Return lead and signature header of RPM at `path` as bytes.
+
+    The signature header contains digests of the main header and payload
+    along with the size of the package, so it identifies the content of the
+    file without reading more than a few kilobytes.
+    """
+    with open(path, "rb") as f:
+        data = f.read(RPM_LEAD_SIZE + 16)
+        intro = data[RPM_LEAD_SIZE:]
+        if len(intro) != 16 or intro[:4] != RPM_HEADER_MAGIC:
+            raise ValueError("%s is not an RPM file" % path)
+        count, size = struct.unpack(">II", intro[8:])
+        # The index entries and data store follow the intro, the whole
+        # signature is padded to a multiple of 8 bytes.
+        length = 16 * count + size
+        length += (8 - (length + 16) % 8) % 8
+        data += f.read(length)
+    return data
+
+
+def package_from_fragments(primary, filelists, other):
+    """Create package object from XML snippets as returned by
+    ``createrepo_c.xml_dump``. Returns None if there is no package in the
+    snippets.
+    """
+    packages = []
+
+    def _new_pkg(pkgId, name, arch):
+        return packages[0] if packages else None
+
+    def _add_pkg(pkg):
+        if not packages:
+            packages.append(pkg)
+        return True
+
+    cr.xml_parse_primary_snippet(primary, None, _add_pkg, None, False)
+    cr.xml_parse_filelists_snippet(filelists, _new_pkg, _add_pkg, None)
+    cr.xml_parse_other_snippet(other, _new_pkg, _add_pkg, None)
+    return packages[0] if packages else None
+
+
+def _read_fragments(args):
+    """Read RPM and return its metadata as XML snippets. This runs in a
+    separate process, the package object itself can not be pickled.
+    """
+    path, checksum_type, location_href, location_base = args
+    pkg = cr.package_from_rpm(
+        path,
+        cr.checksum_type(checksum_type),
+        location_href,
+        location_base,
+        CHANGELOG_LIMIT,
+    )
+    return cr.xml_dump(pkg)
+
+
+class FragmentCache(object):
+    """Store of primary, filelists and other XML snippets of packages, keyed
+    by content of the RPM signature header. Location and mtime of the file
+    are not part of the key, they are updated when a package is retrieved.
+
+    Writes are atomic renames, so the directory can be shared by concurrent
+    processes. The mtime of a fragment file is refreshed (at most once a day)
+    when it is used, `prune` removes the ones not used for a given time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def get_key(self, path, checksum_type):
+        try:
+            signature = read_signature(path)
+        except (IOError, OSError, ValueError):
+            return None
+        key = hashlib.sha256(signature)
+        key.update(checksum_type.encode("utf-8"))
+        return key.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.path, key[:2], key + ".json")
+
+    def get(self, key, location_href, location_base=None):
+        """Return package for `key`, or None if it is not cached."""
+        path = self._get_path(key)
+        try:
+            with open(path) as f:
+                fragments = json.load(f)
+            if os.stat(path).st_mtime < time.time() - 24 * 3600:
+                os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+
+        pkg = package_from_fragments(
+            fragments["primary"], fragments["filelists"], fragments["other"]
+        )
+        if pkg is None:
+            return None
+        pkg.location_href = location_href
+        pkg.location_base = location_base
+        return pkg
+
+    def store(self, key, pkg):
+        self.store_fragments(key, cr.xml_dump(pkg))
+
+    def store_fragments(self, key, fragments):
+        """Store XML snippets as returned by ``createrepo_c.xml_dump``."""
+        primary, filelists, other = fragments
+        dest = self._get_path(key)
+        makedirs(os.path.dirname(dest))
+        fd, tmp = tempfile.mkstemp(prefix=key + ".", dir=os.path.dirname(dest))
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(
+                    {"primary": primary, "filelists": filelists, "other": other}, f
+                )
+            os.chmod(tmp, 0o644)
+            os.rename(tmp, dest)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+    def prune(self, max_age):
+        """Remove fragments not used in last `max_age` days, along with any
+        temporary files left behind by interrupted writes. Returns number of
+        removed files.
+        """
+        threshold = time.time() - max_age * 24 * 3600
+        removed = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for fn in filenames:
+                path = os.path.join(dirpath, fn)
+                try:
+                    if os.stat(path).st_mtime < threshold:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    # Removed or refreshed by another process in the meantime.
+                    pass
+        return removed
+
+
+class PackageCache(object):
+    """Package metadata from existing repositories, indexed by NEVRA.
+
+    Repositories are loaded on first use and kept for the lifetime of the
+    object. All methods are thread safe.
+    """
+
+    def __init__(self, fragment_cache=None):
+        self.fragment_cache = fragment_cache
+        self._repos = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get_repo(self, repo_path):
+        """Return a dict mapping NEVRA to package for repo at `repo_path`. If
+        the repo can not be loaded, the dict is empty.
+        """
+        with self._lock:
+            lock = self._locks.setdefault(repo_path, threading.Lock())
+        with lock:
+            if repo_path not in self._repos:
+                self._repos[repo_path] = self._load(repo_path)
+            return self._repos[repo_path][1]
+
+    def get_nevras(self, repo_path):
+        """Return a dict mapping location_href of packages in repo at
+        `repo_path` to their NEVRA.
+        """
+        packages = self.get_repo(repo_path)
+        return {pkg.location_href: nevra for nevra, pkg in packages.items()}
+
+    def _load(self, repo_path):
+        packages = {}
+        md = cr.Metadata()
+        try:
+            md.locate_and_load_xml(repo_path)
+        except Exception:
+            return md, packages
+        for key in md.keys():
+            pkg = md.get(key)
+            packages[get_nevra(pkg)] = pkg
+        # The metadata object is kept as well, the packages point into it.
+        return md, packages
+
+    def _is_valid(self, pkg, path, checksum_type):
+        if pkg.checksum_type != checksum_type:
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return pkg.size_package == st.st_size and pkg.time_file == int(st.st_mtime)
+
+    def _get_cached(
+        self, path, location_href, nevra, checksum_type, repo_paths, location_base
+    ):
+        """Return a tuple of package (or None if it has to be read from the
+        RPM) and fragment cache key.
+        """
+        for repo_path in repo_paths if nevra else []:
+            pkg = self.get_repo(repo_path).get(nevra)
+            if pkg is not None and self._is_valid(pkg, path, checksum_type):
+                pkg = pkg.copy()
+                pkg.location_href = location_href
+                pkg.location_base = location_base
+                return pkg, None
+
+        key = None
+        if self.fragment_cache:
+            key = self.fragment_cache.get_key(path, checksum_type)
+        if key:
+            pkg = self.fragment_cache.get(key, location_href, location_base)
+            if pkg is not None:
+                pkg.time_file = int(os.stat(path).st_mtime)
+                return pkg, key
+        return None, key
+
+    def get_package(
+        self,
+        path,
+        location_href,
+        nevra,
+        checksum_type,
+        repo_paths=(),
+        location_base=None,
+    ):
+        """Return package object for RPM at `path`.
+
+        If any of the repos in `repo_paths` contains package with the same
+        NEVRA, size and mtime, its metadata is used. Otherwise the fragment
+        cache is checked, and only if the package is not there either, the RPM
+        is read.
+
+        :param str location_href: location of the package in the new repo
+        :param str checksum_type: name of checksum type, e.g. ``sha256``
+        :param list repo_paths: existing repos to take metadata from, e.g. the
+            package set repo or the same repo in previous compose
+        """
+        pkg, key = self._get_cached(
+            path, location_href, nevra, checksum_type, repo_paths, location_base
+        )
+        if pkg is not None:
+            return pkg
+        return self._read(path, location_href, checksum_type, location_base, key)
+
+    def _read(self, path, location_href, checksum_type, location_base, key):
+        pkg = cr.package_from_rpm(
+            path,
+            cr.checksum_type(checksum_type),
+            location_href,
+            location_base,
+            CHANGELOG_LIMIT,
+        )
+        if key:
+            self.fragment_cache.store(key, pkg)
+        return pkg
+
+    def get_packages(
+        self,
+        items,
+        checksum_type,
+        repo_paths=(),
+        location_base=None,
+        num_workers=1,
+    ):
+        """Return list of package objects for `items`, which is a list of
+        ``(path, location_href, nevra)`` tuples.
+
+        Packages are looked up the same way as by `get_package`. The RPMs that
+        have to be read are processed by `num_workers` processes in parallel
+        (createrepo_c does not release GIL, so threads would not help). On
+        Python 2 they are read sequentially.
+        """
+        packages = []
+        missing = []
+        for path, location_href, nevra in items:
+            pkg, key = self._get_cached(
+                path, location_href, nevra, checksum_type, repo_paths, location_base
+            )
+            if pkg is None:
+                missing.append((len(packages), key))
+            packages.append(pkg)
+
+        can_spawn = hasattr(multiprocessing, "get_context")
+        if not can_spawn or num_workers < 2 or len(missing) < 2:
+            for idx, key in missing:
+                path, location_href, _ = items[idx]
+                packages[idx] = self._read(
+                    path, location_href, checksum_type, location_base, key
+                )
+            return packages
+
+        args = [
+            (items[idx][0], checksum_type, items[idx][1], location_base)
+            for idx, _ in missing
+        ]
+        # Spawn the processes, forking from a process with threads running is
+        # not safe.
+        context = multiprocessing.get_context("spawn")
+        pool = context.Pool(min(num_workers, len(missing)))
+        try:
+            results = pool.map(_read_fragments, args)
+        finally:
+            pool.close()
+            pool.join()
+
+        for (idx, key), fragments in zip(missing, results):
+            pkg = package_from_fragments(*fragments)
+            pkg.location_href = items[idx][1]
+            pkg.location_base = location_base
+            if key:
+                self.fragment_cache.store_fragments(key, fragments)
+            packages[idx] = pkg
+        return packages
+
+
+def _add_record(repomd, repodata, mdtype, path, checksum, keep_uncompressed=False):
+    """Add a gzip compressed copy of file at `path` into `repodata` and
+    `repomd` as `mdtype`. If `keep_uncompressed` is set, the plain copy is
+    added as well and the compressed record is named ``<mdtype>_gz``, the same
+    way createrepo_c handles comps file.
+    """
+    dest = os.path.join(repodata, os.path.basename(path))
+    shutil.copy2(path, dest)
+    rec = cr.RepomdRecord(mdtype, dest)
+    gz_rec = rec.compress_and_fill(checksum, cr.GZ)
+    if keep_uncompressed:
+        gz_rec.type = mdtype + "_gz"
+        rec.rename_file()
+        repomd.set_record(rec)
+    else:
+        os.remove(dest)
+    gz_rec.rename_file()
+    repomd.set_record(gz_rec)
+
+
+def write_repo(
+    repo_dir,
+    packages,
+    checksum_type="sha256",
+    use_xz=False,
+    groupfile=None,
+    extra_files=None,
+):
+    """Write repodata for `packages` into `repo_dir`.
+
+    The new metadata is written into a temporary directory next to the final
+    one, and moved into place once complete.
+
+    :param list packages: createrepo_c packages with correct location_href
+    :param str groupfile: path to comps file
+    :param list extra_files: list of (mdtype, path) tuples of files to add to
+        repomd.xml in compressed form (modules, productid)
+    """
+    checksum = cr.checksum_type(checksum_type)
+    compression = cr.XZ if use_xz else cr.GZ
+    suffix = cr.compression_suffix(compression)
+    repodata = os.path.join(repo_dir, "repodata")
+    tmp_repodata = os.path.join(repo_dir, ".repodata")
+    if os.path.exists(tmp_repodata):
+        shutil.rmtree(tmp_repodata)
+    makedirs(tmp_repodata)
+
+    files = {}
+    for mdtype, cls in (
+        ("primary", cr.PrimaryXmlFile),
+        ("filelists", cr.FilelistsXmlFile),
+        ("other", cr.OtherXmlFile),
+    ):
+        path = os.path.join(tmp_repodata, "%s.xml%s" % (mdtype, suffix))
+        files[mdtype] = (path, cls(path, compression))
+        files[mdtype][1].set_num_of_pkgs(len(packages))
+
+    for pkg in sorted(packages, key=lambda pkg: pkg.location_href):
+        for _, xml_file in files.values():
+            xml_file.add_pkg(pkg)
+
+    repomd = cr.Repomd()
+    for mdtype in ("primary", "filelists", "other"):
+        path, xml_file = files[mdtype]
+        xml_file.close()
+        rec = cr.RepomdRecord(mdtype, path)
+        rec.fill(checksum)
+        rec.rename_file()
+        repomd.set_record(rec)
+
+    if groupfile:
+        _add_record(repomd, tmp_repodata, "group", groupfile, checksum, True)
+
+    for mdtype, path in extra_files or []:
+        _add_record(repomd, tmp_repodata, mdtype, path, checksum)
+
+    repomd.sort_records()
+    with open(os.path.join(tmp_repodata, "repomd.xml"), "w") as f:
+        f.write(repomd.xml_dump())
+
+    if os.path.exists(repodata):
+        shutil.rmtree(repodata)
+    os.rename(tmp_repodata, repodata)
@@ -15,11 +15,14 @@
 
 
 import os
-from fnmatch import fnmatch
+import fnmatch
 import contextlib
+import re
+import threading
 from six.moves import shlex_quote
+from six.moves.collections_abc import MutableMapping
 
-from kobo.shortcuts import force_list, relative_path, run
+from kobo.shortcuts import force_list, run
 from pungi import util
 
 
@@ -294,36 +297,37 @@ def get_graft_points(compose_top_dir, paths, exclusive_paths=None, exclude=None)
     # paths merge according to priority
     # exclusive paths override whole dirs
 
-    result = {}
+    result = GraftTree()
     exclude = exclude or []
     exclusive_paths = exclusive_paths or []
 
     for i in paths:
         if isinstance(i, dict):
-            tree = i
+            tree = GraftTree(i)
         else:
-            tree = _scan_tree(i)
-        result = _merge_trees(result, tree)
+            tree = GraftTree.scan(i)
+        result.merge(tree)
 
     for i in exclusive_paths:
-        tree = _scan_tree(i)
-        result = _merge_trees(result, tree, exclusive=True)
+        result.merge(GraftTree.scan(i), exclusive=True)
 
     # Resolve possible symlinks pointing outside of the compose top dir.
     # This fixes an issue if link_type is set to "symlink" and therefore
     # the RPM packages are symbolic links to /mnt/koji filesystem.
     # Without this, the symbolic links would be simply copied into the ISO
     # without the real RPMs.
-    for key in result.keys():
-        path = result[key]
-        if os.path.islink(path):
-            real_path = os.readlink(path)
-            abspath = os.path.normpath(os.path.join(os.path.dirname(path), real_path))
-            if not abspath.startswith(compose_top_dir):
-                result[key] = abspath
+    for _, node in result.iter_dirs():
+        for name, path in node.files.items():
+            if os.path.islink(path):
+                real_path = os.readlink(path)
+                abspath = os.path.normpath(
+                    os.path.join(os.path.dirname(path), real_path)
+                )
+                if not abspath.startswith(compose_top_dir):
+                    node.files[name] = abspath
 
     # TODO: exclude
-    return result
+    return dict(result.iter_items())
 
 
 def _paths_from_list(root, paths):
@@ -336,83 +340,238 @@ def _paths_from_list(root, paths):
     return result
 
 
-def _scan_tree(path):
-    path = os.path.abspath(path)
-    result = {}
-    for root, dirs, files in os.walk(path):
-        for f in files:
-            abspath = os.path.join(root, f)
-            relpath = relative_path(abspath, path.rstrip("/") + "/")
-            result[relpath] = abspath
-
-        # include empty dirs
-        if root != path:
-            abspath = os.path.join(root, "")
-            relpath = relative_path(abspath, path.rstrip("/") + "/")
-            result[relpath] = abspath
+def _get_exclude_matcher(patterns):
+    """Return a function checking if a path matches any of the shell-style
+    patterns. Patterns like ``*/NAME`` are the most common, and they only
+    need to look up last component of the path in a set. The other ones are
+    merged into a single regular expression.
+    """
+    names = set()
+    regexes = []
+    for pattern in patterns:
+        name = pattern[2:]
+        if pattern.startswith("*/") and not re.search(r"[*?\[/]", name):
+            names.add(name)
+        else:
+            regexes.append(fnmatch.translate(pattern))
+    regex = re.compile("|".join(regexes)) if regexes else None
 
-    return result
+    def is_excluded(path):
+        head, sep, tail = path.rpartition("/")
+        if sep and tail in names:
+            return True
+        return bool(regex and regex.match(path))
 
+    return is_excluded
+
+
+class _Node(object):
+    """Directory in a `GraftTree`. Files map names to source paths, `path` is
+    the source of the directory itself if it was listed explicitly.
+    """
+
+    __slots__ = ("files", "dirs", "path")
+
+    def __init__(self):
+        self.files = {}
+        self.dirs = {}
+        self.path = None
+
+    def copy(self):
+        node = _Node()
+        node.files = self.files.copy()
+        node.dirs = dict((name, d.copy()) for name, d in self.dirs.items())
+        node.path = self.path
+        return node
+
+    def has_entries(self):
+        return bool(self.files) or self.path is not None
 
-def _merge_trees(tree1, tree2, exclusive=False):
-    # tree2 has higher priority
-    result = tree2.copy()
-    all_dirs = set(
-        [os.path.dirname(i).rstrip("/") for i in result if os.path.dirname(i) != ""]
-    )
 
-    for i in tree1:
-        dn = os.path.dirname(i)
-        if exclusive:
-            match = False
-            for a in all_dirs:
-                if dn == a or dn.startswith("%s/" % a):
-                    match = True
+class GraftTree(MutableMapping):
+    """Trie of paths on the ISO, mapping each path to a source on the disk.
+    Keys are the same as in dicts returned by `get_graft_points`: paths
+    relative to the ISO root, with directories ending with a slash.
+
+    Merging trees, dropping directories that are not empty and excluding files
+    is done in a single traversal of the trie instead of comparing each path
+    with all directories.
+    """
+
+    def __init__(self, data=None):
+        self.root = _Node()
+        if data:
+            self.update(data)
+
+    @classmethod
+    def scan(cls, path):
+        """Create a tree with all files and subdirectories of a directory."""
+        tree = cls()
+        path = os.path.abspath(path)
+        prefix_len = len(path.rstrip("/")) + 1
+        for root, dirs, files in os.walk(path):
+            node = tree.root
+            if root != path:
+                # include empty dirs
+                node = tree._get_dir(root[prefix_len:].split("/"), create=True)
+                node.path = os.path.join(root, "")
+            for f in files:
+                node.files[f] = os.path.join(root, f)
+        return tree
+
+    def _get_dir(self, parts, create=False):
+        node = self.root
+        for part in parts:
+            if create:
+                node = node.dirs.setdefault(part, _Node())
+            else:
+                node = node.dirs.get(part)
+                if node is None:
                     break
-            if match:
-                continue
+        return node
+
+    def _lookup(self, key, create=False):
+        """Find directory node for the key and name of the file in it. The
+        name is empty if the key is a directory.
+        """
+        parts = key.split("/")
+        return self._get_dir(parts[:-1], create=create), parts[-1]
+
+    def __getitem__(self, key):
+        node, name = self._lookup(key)
+        if node is not None:
+            if name in node.files:
+                return node.files[name]
+            if not name and node.path is not None:
+                return node.path
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        node, name = self._lookup(key, create=True)
+        if name:
+            node.files[name] = value
+        else:
+            node.path = value
+
+    def __delitem__(self, key):
+        node, name = self._lookup(key)
+        if node is not None:
+            if name in node.files:
+                del node.files[name]
+                return
+            if not name and node.path is not None:
+                node.path = None
+                return
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key, _ in self.iter_items():
+            yield key
+
+    def __len__(self):
+        return sum(
+            len(node.files) + (node.path is not None) for _, node in self.iter_dirs()
+        )
+
+    def iter_dirs(self):
+        """Yield tuples (prefix, node) for all directories in the tree. The
+        prefix is empty for the root, and ends with a slash otherwise.
+        """
+        stack = [("", self.root)]
+        while stack:
+            prefix, node = stack.pop()
+            yield prefix, node
+            for name, child in node.dirs.items():
+                stack.append(("%s%s/" % (prefix, name), child))
+
+    def iter_items(self):
+        for prefix, node in self.iter_dirs():
+            if node.path is not None:
+                yield prefix, node.path
+            for name, path in node.files.items():
+                yield prefix + name, path
+
+    def merge(self, other, exclusive=False):
+        """Add content of `other` tree to this one. Paths from `other` take
+        precedence. With `exclusive`, each directory that directly contains
+        anything in `other` replaces the whole directory in this tree. Nodes
+        of `other` are reused, so it should not be modified afterwards.
+        """
+        stack = [(self.root, other.root)]
+        while stack:
+            node, new = stack.pop()
+            node.files.update(new.files)
+            if new.path is not None:
+                node.path = new.path
+            for name, new_child in new.dirs.items():
+                child = node.dirs.get(name)
+                if child is None or (exclusive and new_child.has_entries()):
+                    node.dirs[name] = new_child
+                else:
+                    stack.append((child, new_child))
+
+    def graft(self, prefix, other):
+        """Merge a copy of `other` tree into directory `prefix` of this one.
+        The other tree is not modified, so it can be grafted many times.
+        """
+        tree = GraftTree()
+        parts = [part for part in prefix.split("/") if part]
+        if parts:
+            parent = tree._get_dir(parts[:-1], create=True)
+            parent.dirs[parts[-1]] = other.root.copy()
+        else:
+            tree.root = other.root.copy()
+        self.merge(tree)
+
+    def iter_graft_points(self, exclude=None):
+        """Yield tuples (key, source path) that should be written to graft
+        points file. Directories are only listed explicitly if they are empty,
+        otherwise they are created for their content. Paths matching any of
+        `exclude` patterns are skipped.
+        """
+        is_excluded = _get_exclude_matcher(exclude or [])
+        for prefix, node in self.iter_dirs():
+            if node.path is not None and not node.files and not node.dirs:
+                if not is_excluded(prefix):
+                    yield prefix, node.path
+            for name, path in node.files.items():
+                key = prefix + name
+                if not is_excluded(key):
+                    yield key, path
+
+
+class GraftTreeCache(object):
+    """Thread safe cache of trees for directories in the compose. The
+    directories must not change while the cache is in use.
+    """
 
-        if i in result:
-            continue
+    def __init__(self, compose_top_dir):
+        self.compose_top_dir = compose_top_dir
+        self._trees = {}
+        self._lock = threading.Lock()
 
-        result[i] = tree1[i]
-    return result
+    def get(self, path):
+        with self._lock:
+            tree = self._trees.get(path)
+        if tree is None:
+            tree = GraftTree(get_graft_points(self.compose_top_dir, [path]))
+            with self._lock:
+                tree = self._trees.setdefault(path, tree)
+        return tree
 
 
 def write_graft_points(file_name, h, exclude=None):
-    exclude = exclude or []
-    result = {}
-    seen_dirs = set()
-    for i in sorted(h, reverse=True):
-        dn = os.path.dirname(i)
-
-        if not i.endswith("/"):
-            result[i] = h[i]
-            seen_dirs.add(dn)
-            continue
-
-        found = False
-        for j in seen_dirs:
-            if j.startswith(dn):
-                found = True
-                break
-        if not found:
-            result[i] = h[i]
-        seen_dirs.add(dn)
-
-    f = open(file_name, "w")
-    for i in sorted(result, key=graft_point_sort_key):
+    if not isinstance(h, GraftTree):
+        h = GraftTree(h)
+    graft_points = sorted(
+        h.iter_graft_points(exclude), key=lambda x: graft_point_sort_key(x[0])
+    )
+
+    with open(file_name, "w") as f:
         # make sure all files required for boot come first,
         # otherwise there may be problems with booting (large LBA address, etc.)
-        found = False
-        for excl in exclude:
-            if fnmatch(i, excl):
-                found = True
-                break
-        if found:
-            continue
-        f.write("%s=%s\n" % (i, h[i]))
-    f.close()
+        for key, path in graft_points:
+            f.write("%s=%s\n" % (key, path))
 
 
 def _is_rpm(path):
@@ -19,6 +19,7 @@ import re
 import time
 import threading
 import contextlib
+import multiprocessing.pool
 
 import koji
 from kobo.shortcuts import run, force_list
@@ -32,6 +33,11 @@ from ..arch_utils import getBaseArch
 
 KOJI_BUILD_DELETED = koji.BUILD_STATES["DELETED"]
 
+# Number of calls sent to the hub in a single multicall request, and number of
+# requests sent concurrently by `batched_multicall_map`.
+MULTICALL_BATCH_SIZE = 100
+MULTICALL_NUM_THREADS = 4
+
 
 class KojiWrapper(object):
     lock = threading.Lock()
@@ -42,6 +48,9 @@ class KojiWrapper(object):
             self.profile = self.compose.conf["koji_profile"]
         except KeyError:
             raise RuntimeError("Koji profile must be configured")
+        self._local = threading.local()
+        # Idle sessions available for `pooled_session`.
+        self._session_pool = []
         with self.lock:
             self.koji_module = koji.get_profile_module(self.profile)
             session_opts = {}
@@ -61,9 +70,46 @@ class KojiWrapper(object):
                 value = getattr(self.koji_module.config, key, None)
                 if value is not None:
                     session_opts[key] = value
-            self.koji_proxy = koji.ClientSession(
-                self.koji_module.config.server, session_opts
-            )
+            self.session_opts = session_opts
+            self.koji_proxy = self._create_session()
+
+    def _create_session(self):
+        return koji.ClientSession(self.koji_module.config.server, self.session_opts)
+
+    @property
+    def koji_proxy(self):
+        """
+        The Koji session. In a thread running inside `pooled_session` block
+        this is the pooled session of that thread, otherwise the main one.
+        """
+        return getattr(self._local, "session", None) or self._koji_proxy
+
+    @koji_proxy.setter
+    def koji_proxy(self, value):
+        self._koji_proxy = value
+
+    @contextlib.contextmanager
+    def pooled_session(self):
+        """
+        Route all calls made through `koji_proxy` from the current thread to
+        a session taken from a shared pool until the block is left.
+
+        ClientSession is not thread safe (for example the multicall state is
+        kept in the session), so threads talking to Koji concurrently must not
+        share it. The pool only grows up to the number of threads using it at
+        the same time and the sessions are reused by later blocks. Pooled
+        sessions are not logged in.
+        """
+        try:
+            session = self._session_pool.pop()
+        except IndexError:
+            session = self._create_session()
+        self._local.session = session
+        try:
+            yield session
+        finally:
+            self._local.session = None
+            self._session_pool.append(session)
 
     def login(self):
         """Authenticate to the hub."""
@@ -490,10 +536,17 @@ class KojiWrapper(object):
         """Check if output indicates server offline."""
         return re.search("koji: ServerOffline:", output)
 
+    @property
+    def watch_tasks_in_process(self):
+        return bool(self.compose.conf.get("koji_watch_tasks_in_process"))
+
     def _wait_for_task(self, task_id, logfile=None, max_retries=None):
         """Tries to wait for a task to finish. On connection error it will
         retry with `watch-task` command.
         """
+        if self.watch_tasks_in_process:
+            return self._wait_for_task_in_process(task_id, logfile, max_retries)
+
         cmd = self._get_cmd("watch-task", str(task_id))
         attempt = 0
 
@@ -518,12 +571,33 @@ class KojiWrapper(object):
             "Failed to wait for task %s. Too many connection errors." % task_id
         )
 
+    def _wait_for_task_in_process(self, task_id, logfile=None, max_retries=None):
+        """Wait for a task to finish using the compose-wide KojiTaskWatcher.
+        Returns the same tuple as `_wait_for_task`.
+        """
+        state = get_task_watcher(self.compose).wait(task_id, max_retries=max_retries)
+        output = "Task %d: %s\n" % (task_id, koji.TASK_STATES[state])
+        if logfile:
+            with open(logfile, "a") as f:
+                f.write(output)
+        return 0 if state == koji.TASK_STATES["CLOSED"] else 1, output
+
     def run_blocking_cmd(self, command, log_file=None, max_retries=None):
         """
         Run a blocking koji command. Returns a dict with output of the command,
         its exit code and parsed task id. This method will block until the
         command finishes.
+
+        When the in-process task watcher is enabled, the command is run with
+        ``--nowait`` and the task is waited for by the watcher instead of the
+        koji client.
         """
+        nowait = False
+        if self.watch_tasks_in_process and isinstance(command, list):
+            nowait = True
+            if "--nowait" not in command:
+                command = command + ["--nowait"]
+
         with self.get_koji_cmd_env() as env:
             retcode, output = run(
                 command,
@@ -545,8 +619,9 @@ class KojiWrapper(object):
 
         self.save_task_id(task_id)
 
-        if retcode != 0 and (
-            self._has_connection_error(output) or self._has_offline_error(output)
+        if (nowait and retcode == 0) or (
+            retcode != 0
+            and (self._has_connection_error(output) or self._has_offline_error(output))
         ):
             retcode, output = self._wait_for_task(
                 task_id, logfile=log_file, max_retries=max_retries
@@ -843,6 +918,62 @@ class KojiWrapper(object):
         """
         return self.multicall_map(*args, **kwargs)
 
+    def batched_multicall_map(
+        self,
+        method,
+        list_of_args=None,
+        list_of_kwargs=None,
+        batch_size=MULTICALL_BATCH_SIZE,
+        num_threads=MULTICALL_NUM_THREADS,
+    ):
+        """
+        Call Koji `method` (given by name) for each item in `list_of_args` and
+        `list_of_kwargs` and return list of results in the same order.
+
+        The calls are split into multicall requests of `batch_size` calls
+        each, retried the same way as in `retrying_multicall_map`. If there
+        is more than one request, up to `num_threads` of them are sent
+        concurrently, each using its own pooled session.
+        """
+        if list_of_args is None and list_of_kwargs is None:
+            raise ValueError("One of list_of_args or list_of_kwargs must be set.")
+        count = len(list_of_args if list_of_args is not None else list_of_kwargs)
+
+        def _slice(items, start):
+            return items[start : start + batch_size] if items is not None else None
+
+        def _call(start):
+            session = self.koji_proxy
+            return (
+                self.retrying_multicall_map(
+                    session,
+                    getattr(session, method),
+                    list_of_args=_slice(list_of_args, start),
+                    list_of_kwargs=_slice(list_of_kwargs, start),
+                )
+                or []
+            )
+
+        def _pooled_call(start):
+            with self.pooled_session():
+                return _call(start)
+
+        starts = list(range(0, count, batch_size))
+        if len(starts) <= 1 or num_threads <= 1:
+            batches = [_call(start) for start in starts]
+        else:
+            pool = multiprocessing.pool.ThreadPool(min(num_threads, len(starts)))
+            try:
+                batches = pool.map(_pooled_call, starts)
+            finally:
+                pool.close()
+                pool.join()
+
+        results = []
+        for batch in batches:
+            results.extend(batch)
+        return results
+
     def save_task_id(self, task_id):
         """Save task id by creating a file using task_id as file name
 
@@ -853,6 +984,174 @@ class KojiWrapper(object):
             pass
 
 
+class TaskWaiter(object):
+    """
+    Handle returned by KojiTaskWatcher.watch(). The watcher thread sets either
+    the final task state or an exception, and the thread waiting for the task
+    blocks in `result()`.
+    """
+
+    def __init__(self, task_id, max_retries=None):
+        self.task_id = task_id
+        self.max_retries = max_retries
+        self._event = threading.Event()
+        self._state = None
+        self._exception = None
+
+    def done(self):
+        return self._event.is_set()
+
+    def set_result(self, state):
+        self._state = state
+        self._event.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._event.set()
+
+    def result(self, timeout=None):
+        """Wait for the task and return its final state (a value from
+        koji.TASK_STATES).
+        """
+        if not self._event.wait(timeout):
+            raise RuntimeError("Timed out waiting for task %s" % self.task_id)
+        if self._exception:
+            raise self._exception
+        return self._state
+
+
+class KojiTaskWatcher(object):
+    """
+    Wait for many Koji tasks from a single thread.
+
+    Instead of running ``koji watch-task`` for every task, the tasks are
+    registered with `watch()` and a background thread queries state of all of
+    them using a single multicall of ``getTaskInfo`` per polling interval. The
+    interval starts at `min_interval` and grows up to `max_interval` while no
+    task finishes. It drops back to the minimum as soon as some task does.
+
+    The thread only runs while there are tasks to watch. It uses the session
+    of `koji_wrapper`, which must not be used by anything else.
+    """
+
+    FINISHED_STATES = ("CLOSED", "CANCELED", "FAILED")
+
+    def __init__(self, koji_wrapper, min_interval=5, max_interval=60, logger=None):
+        self.koji_wrapper = koji_wrapper
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.logger = logger
+        self.finished_states = set(koji.TASK_STATES[s] for s in self.FINISHED_STATES)
+        self._lock = threading.RLock()
+        self._waiters = {}
+        self._thread = None
+        # Number of multicalls made, useful for checking the batching works.
+        self.polls = 0
+
+    def watch(self, task_id, max_retries=None):
+        """Register `task_id` and return a TaskWaiter for it.
+
+        :param int max_retries: fail the waiter with RuntimeError after this
+            many consecutive failed queries. No limit by default.
+        """
+        waiter = TaskWaiter(task_id, max_retries)
+        with self._lock:
+            self._waiters.setdefault(task_id, []).append(waiter)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="koji-task-watcher"
+                )
+                self._thread.daemon = True
+                self._thread.start()
+        return waiter
+
+    def wait(self, task_id, max_retries=None):
+        """Block until task `task_id` finishes and return its state."""
+        return self.watch(task_id, max_retries=max_retries).result()
+
+    def _run(self):
+        interval = self.min_interval
+        errors = 0
+        while True:
+            with self._lock:
+                task_ids = sorted(self._waiters)
+                if not task_ids:
+                    self._thread = None
+                    return
+
+            try:
+                infos = self.poll(task_ids)
+            except Exception as exc:
+                errors += 1
+                if self.logger:
+                    self.logger.warning("Failed to query Koji tasks: %s", exc)
+                self._fail_waiters(errors, task_ids)
+                interval = min(errors * 10, self.max_interval)
+            else:
+                errors = 0
+                if self._finish_waiters(task_ids, infos):
+                    interval = self.min_interval
+                else:
+                    interval = min(interval * 1.5, self.max_interval)
+
+            time.sleep(interval)
+
+    def poll(self, task_ids):
+        """Query info about all `task_ids` with a single multicall."""
+        self.polls += 1
+        proxy = self.koji_wrapper.koji_proxy
+        return self.koji_wrapper.multicall_map(
+            proxy, proxy.getTaskInfo, list_of_args=task_ids
+        )
+
+    def _finish_waiters(self, task_ids, infos):
+        finished = False
+        for task_id, info in zip(task_ids, infos):
+            if not info:
+                state = koji.TASK_STATES["FAILED"]
+            elif info["state"] in self.finished_states:
+                state = info["state"]
+            else:
+                continue
+            finished = True
+            with self._lock:
+                waiters = self._waiters.pop(task_id, [])
+            for waiter in waiters:
+                waiter.set_result(state)
+        return finished
+
+    def _fail_waiters(self, errors, task_ids):
+        with self._lock:
+            for task_id in task_ids:
+                waiters = self._waiters.get(task_id, [])
+                failed = [
+                    w for w in waiters if w.max_retries and errors >= w.max_retries
+                ]
+                for waiter in failed:
+                    waiter.set_exception(
+                        RuntimeError(
+                            "Failed to wait for task %s. Too many connection errors."
+                            % task_id
+                        )
+                    )
+                    waiters.remove(waiter)
+                if not waiters:
+                    self._waiters.pop(task_id, None)
+
+
+_task_watcher_lock = threading.Lock()
+
+
+def get_task_watcher(compose):
+    """Return the task watcher of `compose`, creating it on first use."""
+    with _task_watcher_lock:
+        watcher = getattr(compose, "koji_task_watcher", None)
+        if watcher is None:
+            watcher = KojiTaskWatcher(KojiWrapper(compose), logger=compose._logger)
+            compose.koji_task_watcher = watcher
+        return watcher
+
+
 def get_buildroot_rpms(compose, task_id):
     """Get build root RPMs - either from runroot or local"""
     result = []
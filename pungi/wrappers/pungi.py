@@ -202,6 +202,7 @@ class PungiWrapper(object):
         lookaside_repos=None,
         multilib_methods=None,
         profiler=False,
+        solv_cache_dir=None,
     ):
         cmd = ["pungi-gather"]
 
@@ -239,6 +240,9 @@ class PungiWrapper(object):
         if profiler:
             cmd.append("--profiler")
 
+        if solv_cache_dir:
+            cmd.append("--solv-cache-dir=%s" % solv_cache_dir)
+
         return cmd
 
     def parse_log(self, f):
@@ -233,12 +233,7 @@ def copy_part(global_config, linker, part):
 
 
 def hardlink_dir(linker, srcdir, dstdir):
-    for root, dirs, files in os.walk(srcdir):
-        root = os.path.relpath(root, srcdir)
-        for f in files:
-            src = os.path.normpath(os.path.join(srcdir, root, f))
-            dst = os.path.normpath(os.path.join(dstdir, root, f))
-            linker.queue_put((src, dst))
+    linker.queue_tree(srcdir, dstdir, skip_dir_symlinks=True)
 
 
 def update_metadata(global_config, part):
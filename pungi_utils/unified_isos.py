@@ -80,6 +80,7 @@ class UnifiedISO(object):
 
         self.treeinfo = {}  # {arch/src: TreeInfo}
         self.repos = {}  # {arch/src: {variant: new_path}
+        self.old_repos = {}  # {arch/src: {variant: [old_path]}
         self.comps = {}  # {arch/src: {variant: old_path}
         self.productid = {}  # {arch/stc: {variant: old_path}
         self.conf = self.read_config()
@@ -126,6 +127,13 @@ class UnifiedISO(object):
         ]
         blacklist_dirs = ["repodata"]
 
+        # The original repo is used by createrepo to avoid reading the RPMs
+        # again. Source RPMs can come from multiple trees.
+        if os.path.exists(os.path.join(dir, "repodata", "repomd.xml")):
+            old_repos = self.old_repos.setdefault(arch, {}).setdefault(variant.uid, [])
+            if dir not in old_repos:
+                old_repos.append(dir)
+
         for root, dirs, files in os.walk(dir):
             for i in blacklist_dirs:
                 if i in dirs:
@@ -272,6 +280,11 @@ class UnifiedISO(object):
                     del ti.checksums.checksums[i]
 
         # write new per-variant repodata
+        # The Python bindings used by compose (pungi.wrappers.createrepo_lib)
+        # are not used here: this runs outside of a compose, so there is no
+        # configuration, and the repos need the sqlite database. Metadata of
+        # the original repos is passed to createrepo instead, so the linked
+        # RPMs are not read again.
         cr = pungi.wrappers.createrepo.CreaterepoWrapper(createrepo_c=True)
         for arch in self.repos:
             ti = self.treeinfo[arch]
@@ -280,8 +293,12 @@ class UnifiedISO(object):
                 tree_dir = os.path.join(self.temp_dir, "trees", arch)
                 repo_path = self.repos[arch][variant]
                 comps_path = self.comps.get(arch, {}).get(variant, None)
+                old_repos = self.old_repos.get(arch, {}).get(variant, [])
                 cmd = cr.get_createrepo_cmd(
-                    repo_path, groupfile=comps_path, update=True
+                    repo_path,
+                    groupfile=comps_path,
+                    update=True,
+                    update_md_path=old_repos,
                 )
                 run(cmd, show_cmd=True)
 
@@ -19,6 +19,7 @@ except ImportError:
 from pungi.util import get_arch_variant_data
 from pungi import paths, checks
 from pungi.module_util import Modulemd
+from pungi.rpm_manifest import RpmManifest
 
 
 class BaseTestCase(unittest.TestCase):
@@ -230,6 +231,8 @@ class DummyCompose(object):
         self.should_create_yum_database = True
         self.cache_region = None
         self.containers_metadata = {}
+        self.rpm_manifest = None
+        self.checksum_cache = None
         self.load_old_compose_config = mock.Mock(return_value=None)
 
     def setup_optional(self):
@@ -270,6 +273,16 @@ class DummyCompose(object):
     def mkdtemp(self, suffix="", prefix="tmp"):
         return tempfile.mkdtemp(suffix=suffix, prefix=prefix, dir=self.topdir)
 
+    def get_rpm_manifest(self):
+        if self.rpm_manifest is None:
+            self.rpm_manifest = RpmManifest.from_file(
+                self.paths.compose.metadata("rpms.json")
+            )
+        return self.rpm_manifest
+
+    def get_checksum_cache(self):
+        return self.checksum_cache
+
 
 def touch(path, content=None):
     """Helper utility that creates an dummy file in given location. Directories
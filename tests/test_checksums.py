@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+
+import mock
+
+from pungi import checksums
+from tests import helpers
+
+
+class TestComputeChecksums(helpers.PungiTestCase):
+    def setUp(self):
+        super(TestComputeChecksums, self).setUp()
+        self.data = {}
+        for name, size in [("small", 10), ("big", 3 * 1000 + 7)]:
+            content = (name * size)[:size]
+            path = os.path.join(self.topdir, name)
+            helpers.touch(path, content)
+            with open(path, "rb") as f:
+                self.data[path] = f.read()
+
+    def expected(self, path, checksum_type):
+        return hashlib.new(checksum_type, self.data[path]).hexdigest()
+
+    @mock.patch("pungi.checksums.CHUNK_SIZE", new=1000)
+    def test_multiple_digests_in_one_pass(self):
+        path = os.path.join(self.topdir, "big")
+
+        with mock.patch("pungi.checksums.open", create=True, wraps=open) as o:
+            result = checksums.compute_file_checksums(path, ["md5", "sha256"])
+
+        self.assertEqual(
+            result,
+            {
+                "md5": self.expected(path, "md5"),
+                "sha256": self.expected(path, "sha256"),
+            },
+        )
+        self.assertEqual(len(o.call_args_list), 1)
+
+    def test_unknown_checksum(self):
+        with self.assertRaises(ValueError):
+            checksums.compute_file_checksums(list(self.data)[0], ["foo"])
+
+    def test_compute_in_parallel(self):
+        paths = list(self.data.keys())
+
+        result = checksums.compute_checksums(paths + paths, "sha1", num_workers=2)
+
+        self.assertEqual(
+            result,
+            dict((p, {"sha1": self.expected(p, "sha1")}) for p in paths),
+        )
+
+    def test_missing_file(self):
+        with self.assertRaises(IOError):
+            checksums.compute_checksums(
+                [os.path.join(self.topdir, "missing")] + list(self.data.keys()),
+                ["md5"],
+            )
+
+
+class TestChecksumCache(helpers.PungiTestCase):
+    def setUp(self):
+        super(TestChecksumCache, self).setUp()
+        self.path = os.path.join(self.topdir, "file")
+        helpers.touch(self.path, "hello")
+        self.cache = checksums.ChecksumCache(os.path.join(self.topdir, "cache.json"))
+
+    def compute(self, checksum_types):
+        with mock.patch(
+            "pungi.checksums.compute_file_checksums",
+            wraps=checksums.compute_file_checksums,
+        ) as cfc:
+            result = checksums.compute_checksums(
+                [self.path], checksum_types, cache=self.cache
+            )
+        return result[self.path], cfc.call_args_list
+
+    def test_cached_digest_is_not_computed_again(self):
+        first, calls = self.compute(["md5"])
+        self.assertEqual(calls, [mock.call(self.path, ["md5"])])
+
+        second, calls = self.compute(["md5"])
+        self.assertEqual(calls, [])
+        self.assertEqual(first, second)
+
+    def test_only_missing_types_are_computed(self):
+        self.compute(["md5"])
+
+        result, calls = self.compute(["md5", "sha256"])
+
+        self.assertEqual(calls, [mock.call(self.path, ["sha256"])])
+        self.assertEqual(sorted(result), ["md5", "sha256"])
+
+    def test_modified_file_is_computed_again(self):
+        first, _ = self.compute(["md5"])
+        helpers.touch(self.path, "world!")
+
+        second, calls = self.compute(["md5"])
+
+        self.assertEqual(calls, [mock.call(self.path, ["md5"])])
+        self.assertNotEqual(first, second)
+
+    def test_compute_does_not_save(self):
+        self.compute(["md5"])
+
+        self.assertFalse(os.path.exists(self.cache.path))
+
+    def test_save_and_load(self):
+        digests, _ = self.compute(["md5"])
+        self.cache.save()
+
+        cache = checksums.ChecksumCache()
+        cache.load(self.cache.path)
+
+        self.assertEqual(cache.get(os.stat(self.path), ["md5"]), digests)
+
+    def test_save_only_used_entries(self):
+        other = os.path.join(self.topdir, "other")
+        helpers.touch(other, "world")
+        old = checksums.ChecksumCache(os.path.join(self.topdir, "old.json"))
+        checksums.compute_checksums([self.path, other], ["md5"], cache=old)
+        old.save()
+
+        self.cache.load(old.path)
+        digests, calls = self.compute(["md5"])
+        self.cache.save()
+
+        self.assertEqual(calls, [])
+        cache = checksums.ChecksumCache()
+        cache.load(self.cache.path)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(os.stat(self.path), ["md5"]), digests)
+
+    def test_load_broken_file(self):
+        helpers.touch(self.cache.path, "{")
+
+        self.cache.load(self.cache.path)
+
+        self.assertEqual(len(self.cache), 0)
@@ -371,6 +371,24 @@ class ComposeTestCase(unittest.TestCase):
 
         self.assertEqual(compose.image_version, "25")
 
+    @mock.patch("pungi.compose.ComposeInfo")
+    def test_save_checksum_cache(self, ci):
+        compose = Compose({}, self.tmp_dir)
+        path = os.path.join(self.tmp_dir, "file")
+        with open(path, "w") as f:
+            f.write("hello")
+
+        compose.save_checksum_cache()
+        cache_path = compose.paths.work.checksum_cache()
+        self.assertFalse(os.path.exists(cache_path))
+
+        cache = compose.get_checksum_cache()
+        cache.update(os.stat(path), {"md5": "abc"})
+        compose.save_checksum_cache()
+
+        with open(cache_path) as f:
+            self.assertEqual(len(json.load(f)["checksums"]), 1)
+
     @mock.patch("pungi.compose.ComposeInfo")
     def test_get_variant_arches_without_filter(self, ci):
         ci.return_value.compose.id = "composeid"
@@ -3,6 +3,7 @@
 
 import logging
 import mock
+import createrepo_c as cr
 import six
 
 import os
@@ -10,6 +11,8 @@ import os
 from tests import helpers
 from pungi.createiso import CreateIsoOpts
 from pungi.phases import createiso
+from pungi.wrappers import createrepo_lib
+from pungi.rpm_manifest import RpmManifest
 
 
 class CreateisoPhaseTest(helpers.PungiTestCase):
@@ -58,6 +61,46 @@ class CreateisoPhaseTest(helpers.PungiTestCase):
             ],
         )
 
+    @mock.patch("pungi.createiso.write_script")
+    @mock.patch("pungi.phases.createiso.prepare_iso")
+    @mock.patch("pungi.phases.createiso.split_iso")
+    @mock.patch("pungi.phases.createiso.ThreadPool")
+    def test_stream(self, ThreadPool, split_iso, prepare_iso, write_script):
+        compose = helpers.DummyCompose(
+            self.topdir,
+            {"release_short": "test", "release_version": "1.0", "createiso_skip": []},
+        )
+        server = compose.variants["Server"]
+        helpers.touch(
+            os.path.join(compose.paths.compose.os_tree("x86_64", server), "dummy.rpm")
+        )
+        compose.notifier = mock.Mock()
+        split_iso.return_value = [mock.Mock()]
+        prepare_iso.return_value = "dummy-graft-points"
+        pool = ThreadPool.return_value
+
+        phase = createiso.CreateisoPhase(compose, mock.Mock(), stream=True)
+        phase.logger = mock.Mock()
+        phase.run()
+
+        items = phase.get_items()
+        self.assertIn((server, "x86_64"), items)
+        self.assertEqual(len(pool.add.call_args_list), len(items))
+        self.assertEqual(pool.queue_put.call_args_list, [])
+        self.assertEqual(compose.notifier.send.call_args_list, [])
+
+        phase.queue_item(server, "x86_64")
+
+        iso_path = "%s/compose/Server/x86_64/iso/image-name" % self.topdir
+        self.assertEqual(
+            [call[0][0][1]["iso_path"] for call in pool.queue_put.call_args_list],
+            [iso_path],
+        )
+        self.assertEqual(
+            compose.notifier.send.call_args_list,
+            [mock.call("createiso-targets", deliverables=[iso_path])],
+        )
+
     @mock.patch("pungi.createiso.write_script")
     @mock.patch("pungi.phases.createiso.prepare_iso")
     @mock.patch("pungi.phases.createiso.split_iso")
@@ -1274,6 +1317,64 @@ class SplitIsoTest(helpers.PungiTestCase):
 
         self.assertEqual(len(data), 1)
 
+    def test_packed_split_keeps_source_together(self):
+        compose = helpers.DummyCompose(
+            self.topdir, {"split_iso_method": "first-fit-decreasing"}
+        )
+        compose.rpm_manifest = RpmManifest()
+        helpers.touch(
+            os.path.join(self.topdir, "compose/Server/x86_64/os/.treeinfo"), TREEINFO
+        )
+        pkgs = {
+            "bash": "bash-0:5.0-1.src",
+            "bash-doc": "bash-0:5.0-1.src",
+            "big": "big-0:1.0-1.src",
+            "small": "small-0:1.0-1.src",
+        }
+        for name, srpm in sorted(pkgs.items()):
+            rel_path = "Server/x86_64/os/Packages/%s/%s.rpm" % (name[0], name)
+            helpers.touch(os.path.join(self.topdir, "compose", rel_path))
+            compose.rpm_manifest.add(
+                "Server",
+                "x86_64",
+                "%s-0:1.0-1.x86_64" % name,
+                rel_path,
+                None,
+                "binary",
+                srpm_nevra=srpm,
+            )
+
+        G = 1024**3
+
+        with mock.patch(
+            "os.path.getsize",
+            DummySize({"bash-doc": 1 * G, "bash": 1 * G, "big": 3 * G, "small": G}),
+        ):
+            data = createiso.split_iso(compose, "x86_64", compose.variants["Server"])
+
+        base_path = os.path.join(self.topdir, "compose/Server/x86_64/os")
+        # The biggest source goes first, then bash with both packages does not
+        # fit next to it. Order of packages on each disc depends on order of
+        # directory listing.
+        self.assertEqual(len(data), 2)
+        self.assertEqual(data[0]["files"][0], os.path.join(base_path, ".treeinfo"))
+        six.assertCountEqual(
+            self,
+            data[0]["files"][1:],
+            [
+                os.path.join(base_path, "Packages/b/big.rpm"),
+                os.path.join(base_path, "Packages/s/small.rpm"),
+            ],
+        )
+        six.assertCountEqual(
+            self,
+            data[1]["files"],
+            [
+                os.path.join(base_path, "Packages/b/bash-doc.rpm"),
+                os.path.join(base_path, "Packages/b/bash.rpm"),
+            ],
+        )
+
 
 class BreakHardlinksTest(helpers.PungiTestCase):
     def setUp(self):
@@ -1311,6 +1412,24 @@ class BreakHardlinksTest(helpers.PungiTestCase):
         self.assertEqual(d, {"f": expected})
         self.assertTrue(os.path.exists(expected))
 
+    def test_link_identical_copies(self):
+        d = {}
+        for name in ("a", "b"):
+            f = os.path.join(self.src, name)
+            helpers.touch(f, "same content")
+            os.link(f, os.path.join(self.topdir, name))
+            d[name] = f
+
+        saved = createiso.break_hardlinks(d, self.stage)
+
+        self.assertEqual(saved, len("same content"))
+        expected = {
+            "a": self.stage + os.path.join(self.src, "a"),
+            "b": self.stage + os.path.join(self.src, "b"),
+        }
+        self.assertEqual(d, expected)
+        self.assertEqual(os.stat(expected["a"]).st_ino, os.stat(expected["b"]).st_ino)
+
 
 class TweakTreeinfo(helpers.PungiTestCase):
     def test_tweaking(self):
@@ -1324,6 +1443,57 @@ class TweakTreeinfo(helpers.PungiTestCase):
         self.assertFilesEqual(output, expected)
 
 
+class WriteIsoRepoInProcessTest(helpers.PungiTestCase):
+    def setUp(self):
+        super(WriteIsoRepoInProcessTest, self).setUp()
+        self.compose = helpers.DummyCompose(
+            self.topdir, {"createrepo_enable_cache": False}
+        )
+        self.tree_dir = os.path.join(self.topdir, "tree")
+        self.iso_dir = os.path.join(self.topdir, "iso")
+        self.rpms = []
+        packages = []
+        for name in ("foo", "bar"):
+            rel_path = "Packages/%s-1.0-1.x86_64.rpm" % name
+            self.rpms.append(rel_path)
+            helpers.touch(os.path.join(self.tree_dir, rel_path), name)
+            packages.append(self._make_package(name, rel_path))
+        createrepo_lib.write_repo(self.tree_dir, packages)
+
+    def _make_package(self, name, rel_path):
+        st = os.stat(os.path.join(self.tree_dir, rel_path))
+        pkg = cr.Package()
+        pkg.name = name
+        pkg.epoch = "0"
+        pkg.version = "1.0"
+        pkg.release = "1"
+        pkg.arch = "x86_64"
+        pkg.pkgId = "abcdef" + name
+        pkg.checksum_type = "sha256"
+        pkg.location_href = rel_path
+        pkg.size_package = st.st_size
+        pkg.time_file = int(st.st_mtime)
+        return pkg
+
+    def test_can_write_in_process(self):
+        self.compose.should_create_yum_database = False
+        self.assertFalse(createiso._can_write_iso_repo_in_process(self.compose))
+        self.compose.conf["createrepo_in_process"] = True
+        self.assertTrue(createiso._can_write_iso_repo_in_process(self.compose))
+        self.compose.should_create_yum_database = True
+        self.assertFalse(createiso._can_write_iso_repo_in_process(self.compose))
+
+    def test_reuses_metadata_from_tree(self):
+        with mock.patch("createrepo_c.package_from_rpm") as package_from_rpm:
+            createiso._write_iso_repo_in_process(
+                self.compose, self.tree_dir, self.iso_dir, self.rpms[:1], "sha256"
+            )
+
+        self.assertEqual(package_from_rpm.mock_calls, [])
+        repo = createrepo_lib.PackageCache().get_nevras(self.iso_dir)
+        self.assertEqual(repo, {self.rpms[0]: "foo-0:1.0-1.x86_64"})
+
+
 class CreateisoTryReusePhaseTest(helpers.PungiTestCase):
     def setUp(self):
         super(CreateisoTryReusePhaseTest, self).setUp()
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import os
+import struct
+import time
+
+import createrepo_c as cr
+import mock
+
+from pungi.wrappers import createrepo_lib
+from tests import helpers
+
+
+def make_package(name, location_href, path=None):
+    pkg = cr.Package()
+    pkg.name = name
+    pkg.epoch = "0"
+    pkg.version = "1.0"
+    pkg.release = "1"
+    pkg.arch = "x86_64"
+    pkg.pkgId = "abcdef" + name
+    pkg.checksum_type = "sha256"
+    pkg.location_href = location_href
+    pkg.summary = pkg.description = name
+    if path:
+        st = os.stat(path)
+        pkg.size_package = st.st_size
+        pkg.time_file = int(st.st_mtime)
+    return pkg
+
+
+def make_rpm(path, signature=b"sig"):
+    """Write a file with RPM lead and signature header, followed by some data
+    that should not affect the cache key.
+    """
+    data = b"\0" * 8 + signature
+    # Pad to 8 bytes as RPM does.
+    padding = b"\0" * ((8 - (len(data) + 16) % 8) % 8)
+    header = b"\x8e\xad\xe8\x01\0\0\0\0" + struct.pack(">II", 0, len(data))
+    helpers.touch(path)
+    with open(path, "wb") as f:
+        f.write(b"\xed\xab\xee\xdb" + b"\0" * 92 + header + data + padding)
+        f.write(b"header and payload")
+    return len(header + data + padding) + 96
+
+
+class TestReadSignature(helpers.PungiTestCase):
+    def test_read_signature(self):
+        path = os.path.join(self.topdir, "foo.rpm")
+        length = make_rpm(path, b"signature")
+
+        self.assertEqual(len(createrepo_lib.read_signature(path)), length)
+
+    def test_not_rpm(self):
+        path = os.path.join(self.topdir, "foo.rpm")
+        helpers.touch(path, "foo")
+
+        with self.assertRaises(ValueError):
+            createrepo_lib.read_signature(path)
+
+
+class TestFragmentCache(helpers.PungiTestCase):
+    def setUp(self):
+        super(TestFragmentCache, self).setUp()
+        self.cache = createrepo_lib.FragmentCache(os.path.join(self.topdir, "cache"))
+        self.rpm = os.path.join(self.topdir, "foo.rpm")
+        make_rpm(self.rpm)
+
+    def test_key_depends_on_signature_and_checksum(self):
+        other = os.path.join(self.topdir, "other.rpm")
+        make_rpm(other)
+        key = self.cache.get_key(self.rpm, "sha256")
+
+        self.assertEqual(self.cache.get_key(other, "sha256"), key)
+        self.assertNotEqual(self.cache.get_key(other, "sha512"), key)
+        make_rpm(other, b"resigned")
+        self.assertNotEqual(self.cache.get_key(other, "sha256"), key)
+
+    def test_key_for_broken_file(self):
+        self.assertIsNone(
+            self.cache.get_key(os.path.join(self.topdir, "missing.rpm"), "sha256")
+        )
+
+    def test_store_and_get(self):
+        pkg = make_package("foo", "old/foo.rpm")
+        pkg.files = [(None, "/usr/bin/", "foo")]
+        pkg.changelogs = [("Joe <joe@example.com> - 1.0-1", 1, "- Initial")]
+        self.cache.store("abcdef", pkg)
+
+        cached = self.cache.get("abcdef", "Packages/foo.rpm", "file:///prefix")
+
+        self.assertEqual(createrepo_lib.get_nevra(cached), "foo-0:1.0-1.x86_64")
+        self.assertEqual(cached.pkgId, pkg.pkgId)
+        self.assertEqual(cached.location_href, "Packages/foo.rpm")
+        self.assertEqual(cached.location_base, "file:///prefix")
+        self.assertEqual(cached.files, pkg.files)
+        self.assertEqual(cached.changelogs, pkg.changelogs)
+
+    def test_get_missing(self):
+        self.assertIsNone(self.cache.get("abcdef", "foo.rpm"))
+
+    def test_get_refreshes_old_fragment(self):
+        self.cache.store("abcdef", make_package("foo", "foo.rpm"))
+        path = os.path.join(self.topdir, "cache", "ab", "abcdef.json")
+        os.utime(path, (0, 0))
+
+        self.assertIsNotNone(self.cache.get("abcdef", "foo.rpm"))
+        self.assertGreater(os.stat(path).st_mtime, time.time() - 3600)
+
+    def test_prune(self):
+        self.cache.store("abcdef", make_package("foo", "foo.rpm"))
+        self.cache.store("fedcba", make_package("bar", "bar.rpm"))
+        old = os.path.join(self.topdir, "cache", "fe", "fedcba.json")
+        os.utime(old, (0, time.time() - 11 * 24 * 3600))
+
+        self.assertEqual(self.cache.prune(10), 1)
+
+        self.assertFalse(os.path.exists(old))
+        self.assertIsNotNone(self.cache.get("abcdef", "foo.rpm"))
+
+
+class TestGetNevra(helpers.PungiTestCase):
+    def test_without_epoch(self):
+        pkg = make_package("foo", "foo.rpm")
+        pkg.epoch = None
+        self.assertEqual(createrepo_lib.get_nevra(pkg), "foo-0:1.0-1.x86_64")
+
+
+class TestPackageCache(helpers.PungiTestCase):
+    def setUp(self):
+        super(TestPackageCache, self).setUp()
+        self.rpm = os.path.join(self.topdir, "compose/Packages/foo-1.0-1.x86_64.rpm")
+        helpers.touch(self.rpm, "rpm")
+        self.pkgset_repo = os.path.join(self.topdir, "pkgset")
+        self.cache = createrepo_lib.PackageCache()
+
+    def _write_pkgset_repo(self, pkg):
+        createrepo_lib.write_repo(self.pkgset_repo, [pkg])
+
+    def test_reuses_package_from_pkgset_repo(self):
+        self._write_pkgset_repo(make_package("foo", "/mnt/koji/foo.rpm", self.rpm))
+
+        with mock.patch("createrepo_c.package_from_rpm") as package_from_rpm:
+            pkg = self.cache.get_package(
+                self.rpm,
+                "Packages/foo-1.0-1.x86_64.rpm",
+                "foo-0:1.0-1.x86_64",
+                "sha256",
+                [self.pkgset_repo],
+            )
+
+        self.assertEqual(package_from_rpm.mock_calls, [])
+        self.assertEqual(pkg.name, "foo")
+        self.assertEqual(pkg.location_href, "Packages/foo-1.0-1.x86_64.rpm")
+
+    def test_reads_changed_package(self):
+        pkg = make_package("foo", "foo.rpm", self.rpm)
+        pkg.size_package += 1
+        self._write_pkgset_repo(pkg)
+
+        with mock.patch("createrepo_c.package_from_rpm") as package_from_rpm:
+            pkg = self.cache.get_package(
+                self.rpm, "foo.rpm", "foo-0:1.0-1.x86_64", "sha256", [self.pkgset_repo]
+            )
+
+        self.assertEqual(
+            package_from_rpm.mock_calls,
+            [mock.call(self.rpm, cr.SHA256, "foo.rpm", None, 10)],
+        )
+        self.assertIs(pkg, package_from_rpm.return_value)
+
+    def test_reads_package_with_different_checksum(self):
+        self._write_pkgset_repo(make_package("foo", "foo.rpm", self.rpm))
+
+        with mock.patch("createrepo_c.package_from_rpm") as package_from_rpm:
+            self.cache.get_package(
+                self.rpm, "foo.rpm", "foo-0:1.0-1.x86_64", "sha512", [self.pkgset_repo]
+            )
+
+        self.assertEqual(len(package_from_rpm.mock_calls), 1)
+
+    def test_uses_first_matching_repo(self):
+        old_repo = os.path.join(self.topdir, "old")
+        createrepo_lib.write_repo(old_repo, [make_package("foo", "old.rpm")])
+        self._write_pkgset_repo(make_package("foo", "pkgset.rpm", self.rpm))
+
+        with mock.patch("createrepo_c.package_from_rpm") as package_from_rpm:
+            pkg = self.cache.get_package(
+                self.rpm,
+                "foo.rpm",
+                "foo-0:1.0-1.x86_64",
+                "sha256",
+                [os.path.join(self.topdir, "missing"), old_repo, self.pkgset_repo],
+            )
+
+        self.assertEqual(package_from_rpm.mock_calls, [])
+        self.assertEqual(pkg.location_href, "foo.rpm")
+        self.assertEqual(pkg.time_file, int(os.stat(self.rpm).st_mtime))
+
+    def test_uses_fragment_cache(self):
+        make_rpm(self.rpm)
+        self.cache.fragment_cache = createrepo_lib.FragmentCache(
+            os.path.join(self.topdir, "cache")
+        )
+        pkg = make_package("foo", "foo.rpm")
+
+        with mock.patch("createrepo_c.package_from_rpm") as package_from_rpm:
+            package_from_rpm.return_value = pkg
+            self.cache.get_package(self.rpm, "foo.rpm", None, "sha256")
+            cached = self.cache.get_package(self.rpm, "bar.rpm", None, "sha256")
+
+        self.assertEqual(len(package_from_rpm.mock_calls), 1)
+        self.assertEqual(cached.pkgId, pkg.pkgId)
+        self.assertEqual(cached.location_href, "bar.rpm")
+        self.assertEqual(cached.time_file, int(os.stat(self.rpm).st_mtime))
+
+    def test_missing_repo(self):
+        self.assertEqual(self.cache.get_repo(os.path.join(self.topdir, "missing")), {})
+
+    def test_loads_repo_once(self):
+        self._write_pkgset_repo(make_package("foo", "foo.rpm", self.rpm))
+
+        with mock.patch.object(self.cache, "_load", wraps=self.cache._load) as load:
+            self.cache.get_repo(self.pkgset_repo)
+            repo = self.cache.get_repo(self.pkgset_repo)
+
+        self.assertEqual(list(repo), ["foo-0:1.0-1.x86_64"])
+        self.assertEqual(load.mock_calls, [mock.call(self.pkgset_repo)])
+
+    def test_get_nevras(self):
+        self._write_pkgset_repo(make_package("foo", "Packages/foo.rpm", self.rpm))
+
+        self.assertEqual(
+            self.cache.get_nevras(self.pkgset_repo),
+            {"Packages/foo.rpm": "foo-0:1.0-1.x86_64"},
+        )
+
+    def test_get_packages_reads_missing(self):
+        self._write_pkgset_repo(make_package("foo", "foo.rpm", self.rpm))
+        bar = os.path.join(self.topdir, "compose/Packages/bar.rpm")
+        helpers.touch(bar)
+
+        with mock.patch("createrepo_c.package_from_rpm") as package_from_rpm:
+            packages = self.cache.get_packages(
+                [
+                    (self.rpm, "foo.rpm", "foo-0:1.0-1.x86_64"),
+                    (bar, "bar.rpm", None),
+                ],
+                "sha256",
+                [self.pkgset_repo],
+            )
+
+        self.assertEqual(
+            package_from_rpm.mock_calls,
+            [mock.call(bar, cr.SHA256, "bar.rpm", None, 10)],
+        )
+        self.assertEqual(packages[0].name, "foo")
+        self.assertIs(packages[1], package_from_rpm.return_value)
+
+    def test_get_packages_reads_in_processes(self):
+        self.cache.fragment_cache = createrepo_lib.FragmentCache(
+            os.path.join(self.topdir, "cache")
+        )
+        paths = []
+        for name in ("bar", "baz"):
+            paths.append(os.path.join(self.topdir, "compose/Packages/%s.rpm" % name))
+            make_rpm(paths[-1], signature=name.encode("utf-8"))
+        pool = mock.Mock()
+        pool.map.side_effect = lambda func, args: [func(arg) for arg in args]
+        context = mock.Mock()
+        context.Pool.return_value = pool
+
+        with mock.patch("createrepo_c.package_from_rpm") as package_from_rpm:
+            package_from_rpm.side_effect = lambda path, *args: make_package(
+                os.path.basename(path)[:3], "x.rpm"
+            )
+            with mock.patch(
+                "pungi.wrappers.createrepo_lib.multiprocessing.get_context",
+                create=True,
+                return_value=context,
+            ) as get_context:
+                packages = self.cache.get_packages(
+                    [
+                        (path, "Packages/" + os.path.basename(path), None)
+                        for path in paths
+                    ],
+                    "sha256",
+                    location_base="file:///prefix",
+                    num_workers=4,
+                )
+            cached = self.cache.get_package(paths[1], "baz.rpm", None, "sha256")
+
+        get_context.assert_called_once_with("spawn")
+        context.Pool.assert_called_once_with(2)
+        self.assertEqual(len(package_from_rpm.mock_calls), 2)
+        self.assertEqual([pkg.name for pkg in packages], ["bar", "baz"])
+        self.assertEqual(
+            [pkg.location_href for pkg in packages],
+            ["Packages/bar.rpm", "Packages/baz.rpm"],
+        )
+        self.assertEqual(packages[0].location_base, "file:///prefix")
+        self.assertEqual(cached.name, "baz")
+
+
+class TestWriteRepo(helpers.PungiTestCase):
+    def test_write_repo(self):
+        repo_dir = os.path.join(self.topdir, "repo")
+        comps = os.path.join(self.topdir, "comps.xml")
+        helpers.touch(comps, "<comps/>")
+        modules = os.path.join(self.topdir, "modules.yaml")
+        helpers.touch(modules, "---\n")
+
+        createrepo_lib.write_repo(
+            repo_dir,
+            [make_package("foo", "Packages/foo.rpm")],
+            groupfile=comps,
+            extra_files=[("modules", modules)],
+        )
+
+        repomd = cr.Repomd(os.path.join(repo_dir, "repodata", "repomd.xml"))
+        records = dict((rec.type, rec.location_href) for rec in repomd.records)
+        self.assertEqual(
+            sorted(records),
+            ["filelists", "group", "group_gz", "modules", "other", "primary"],
+        )
+        for href in records.values():
+            self.assertTrue(os.path.isfile(os.path.join(repo_dir, href)))
+        self.assertTrue(records["modules"].endswith("-modules.yaml.gz"))
+        with gzip.open(os.path.join(repo_dir, records["modules"])) as f:
+            self.assertEqual(f.read(), b"---\n")
+        self.assertEqual(
+            len(os.listdir(os.path.join(repo_dir, "repodata"))), len(records) + 1
+        )
+        self.assertFalse(os.path.exists(os.path.join(repo_dir, ".repodata")))
+        with gzip.open(os.path.join(repo_dir, records["primary"])) as f:
+            self.assertIn(b'<location href="Packages/foo.rpm"/>', f.read())
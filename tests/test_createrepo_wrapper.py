@@ -87,6 +87,17 @@ class CreateRepoWrapperTest(unittest.TestCase):
             ],
         )
 
+    def test_get_createrepo_c_cmd_multiple_update_md_paths(self):
+        repo = CreaterepoWrapper()
+        cmd = repo.get_createrepo_cmd(
+            "/test/dir", update_md_path=["/old/repo", "/pkgset/repo"]
+        )
+
+        self.assertEqual(
+            [x for x in cmd if x.startswith("--update-md-path")],
+            ["--update-md-path=/old/repo", "--update-md-path=/pkgset/repo"],
+        )
+
     def test_get_createrepo_cmd_minimal(self):
         repo = CreaterepoWrapper(False)
         cmd = repo.get_createrepo_cmd("/test/dir")
@@ -12,8 +12,10 @@ import mock
 import six
 
 from pungi.module_util import Modulemd
+from pungi.phases import createrepo
 from pungi.phases.createrepo import (
     CreaterepoPhase,
+    CreaterepoThread,
     ModulesMetadata,
     create_variant_repo,
     get_productids_from_scm,
@@ -128,6 +130,122 @@ class TestCreaterepoPhase(PungiTestCase):
             ],
         )
 
+    @mock.patch("pungi.checks.get_num_cpus")
+    @mock.patch("pungi.phases.createrepo.ThreadPool")
+    def test_streams_from_gather(self, ThreadPoolCls, get_num_cpus):
+        get_num_cpus.return_value = 5
+        compose = DummyCompose(self.topdir, {})
+        compose.notifier = mock.Mock()
+        gather_phase = mock.Mock()
+        gather_phase.skip.return_value = False
+        listeners = []
+        gather_phase.add_linked_listener.side_effect = listeners.append
+
+        pool = ThreadPoolCls.return_value
+
+        phase = CreaterepoPhase(compose, gather_phase=gather_phase)
+        phase.run()
+
+        self.assertEqual(pool.queue_put.mock_calls, [])
+        self.assertEqual(len(listeners), 1)
+
+        server = compose.variants["Server"]
+        listeners[0](server, "x86_64")
+        self.assertEqual(
+            pool.queue_put.mock_calls,
+            [
+                mock.call((compose, "x86_64", server, "rpm")),
+                mock.call((compose, "x86_64", server, "debuginfo")),
+            ],
+        )
+
+        listeners[0](server, "amd64")
+        self.assertEqual(
+            pool.queue_put.mock_calls[2:],
+            [
+                mock.call((compose, "amd64", server, "rpm")),
+                mock.call((compose, "amd64", server, "debuginfo")),
+                mock.call((compose, None, server, "srpm")),
+            ],
+        )
+
+        with mock.patch.object(phase.modules_metadata, "write_modules_metadata"):
+            phase.stop()
+        gather_phase.wait_until_linked.assert_called_once_with()
+        pool.stop.assert_called_once_with()
+        self.assertEqual(
+            [call[0][0].manifest for call in pool.add.call_args_list],
+            [gather_phase.manifest] * 5,
+        )
+
+    @mock.patch("pungi.phases.createrepo.fragment_cache_pruned", new=True)
+    @mock.patch("pungi.phases.createrepo.package_cache", new=None)
+    @mock.patch("pungi.phases.createrepo.ThreadPool")
+    def test_stop_releases_package_cache(self, ThreadPoolCls):
+        compose = DummyCompose(self.topdir, {})
+        compose.notifier = mock.Mock()
+        cache = createrepo.get_package_cache(compose)
+        self.assertIs(createrepo.get_package_cache(compose), cache)
+
+        phase = CreaterepoPhase(compose)
+        with mock.patch.object(phase.modules_metadata, "write_modules_metadata"):
+            phase.stop()
+
+        self.assertIsNone(createrepo.package_cache)
+        self.assertIsNot(createrepo.get_package_cache(compose), cache)
+
+    def test_repo_listener(self):
+        compose = DummyCompose(self.topdir, {})
+        phase = CreaterepoPhase(compose)
+        server = compose.variants["Server"]
+        calls = []
+        phase.add_repo_listener(lambda variant, arch: calls.append((variant, arch)))
+
+        phase._repo_created(server, "x86_64", "rpm")
+        self.assertEqual(calls, [])
+        phase._repo_created(server, "x86_64", "debuginfo")
+        phase._repo_created(server, None, "srpm")
+        self.assertEqual(calls, [(server, "x86_64"), (server, "src")])
+
+        late_calls = []
+        phase.add_repo_listener(
+            lambda variant, arch: late_calls.append((variant, arch))
+        )
+        self.assertEqual(late_calls, calls)
+
+    @mock.patch("pungi.phases.createrepo.create_variant_repo")
+    def test_thread_reports_created_repo(self, create_variant_repo):
+        compose = DummyCompose(self.topdir, {})
+        repo_created = mock.Mock()
+        thread = CreaterepoThread(mock.Mock(), None, None, repo_created=repo_created)
+
+        thread.process((compose, "x86_64", compose.variants["Server"], "rpm"), 1)
+
+        self.assertEqual(
+            repo_created.call_args_list,
+            [mock.call(compose.variants["Server"], "x86_64", "rpm")],
+        )
+
+    @mock.patch("pungi.phases.createrepo.fragment_cache_pruned", new=False)
+    def test_fragment_cache_is_pruned_once(self):
+        compose = DummyCompose(self.topdir, {"createrepo_cache_max_age": 7})
+        with mock.patch("pungi.phases.createrepo.CACHE_TOPDIR", new=self.topdir):
+            with mock.patch(
+                "pungi.wrappers.createrepo_lib.FragmentCache.prune", return_value=0
+            ) as prune:
+                cache = createrepo.get_fragment_cache(compose)
+                createrepo.get_fragment_cache(compose)
+
+        self.assertEqual(
+            cache.path, os.path.join(self.topdir, "fragments-%s" % os.getuid())
+        )
+        self.assertEqual(prune.call_args_list, [mock.call(7)])
+
+    @mock.patch("pungi.phases.createrepo.fragment_cache_pruned", new=False)
+    def test_fragment_cache_disabled(self):
+        compose = DummyCompose(self.topdir, {"createrepo_enable_cache": False})
+        self.assertIsNone(createrepo.get_fragment_cache(compose))
+
     @mock.patch("pungi.phases.createrepo.get_dir_from_scm")
     @mock.patch("pungi.phases.createrepo.ThreadPool")
     def test_clones_extra_modulemd(self, ThreadPoolCls, get_dir_from_scm):
@@ -1336,6 +1454,161 @@ class TestCreateVariantRepo(PungiTestCase):
             ["mymodule:master:1:cafe"],
         )
 
+    @mock.patch("pungi.phases.createrepo.package_cache", new=None)
+    @mock.patch("pungi.phases.createrepo.createrepo_lib")
+    @mock.patch("pungi.phases.createrepo.run")
+    @mock.patch("pungi.phases.createrepo.CreaterepoWrapper")
+    def test_variant_repo_rpms_in_process(
+        self, CreaterepoWrapperCls, run, createrepo_lib
+    ):
+        compose = DummyCompose(
+            self.topdir,
+            {
+                "createrepo_checksum": "sha256",
+                "createrepo_in_process": True,
+                "product_id": "yes",  # Truthy value is enough for this test
+            },
+        )
+        compose.has_comps = False
+        compose.should_create_yum_database = False
+        product_id = compose.paths.work.product_id("x86_64", compose.variants["Server"])
+        repo_dir = compose.paths.compose.os_tree("x86_64", compose.variants["Server"])
+        touch(product_id)
+        os.makedirs(os.path.join(repo_dir, "repodata"))
+
+        copy_fixture("server-rpms.json", compose.paths.compose.metadata("rpms.json"))
+
+        create_variant_repo(
+            compose, "x86_64", compose.variants["Server"], "rpm", self.pkgset
+        )
+
+        self.assertEqual(run.mock_calls, [])
+        cache = createrepo_lib.PackageCache.return_value
+        self.assertEqual(
+            cache.get_package.mock_calls,
+            [
+                mock.call(
+                    repo_dir + "/Packages/b/bash-4.3.30-2.fc21.x86_64.rpm",
+                    "Packages/b/bash-4.3.30-2.fc21.x86_64.rpm",
+                    "bash-0:4.3.30-2.fc21.x86_64",
+                    "sha256",
+                    ["/repo/x86_64"],
+                )
+            ],
+        )
+        self.assertEqual(
+            createrepo_lib.write_repo.mock_calls,
+            [
+                mock.call(
+                    repo_dir,
+                    [cache.get_package.return_value],
+                    checksum_type="sha256",
+                    use_xz=False,
+                    groupfile=None,
+                    extra_files=[("productid", product_id)],
+                )
+            ],
+        )
+        self.assertTrue(os.path.isfile(os.path.join(repo_dir, "repodata", "productid")))
+
+    @mock.patch("pungi.phases.createrepo.run")
+    @mock.patch("pungi.phases.createrepo.CreaterepoWrapper")
+    def test_variant_repo_incremental(self, CreaterepoWrapperCls, run):
+        compose = DummyCompose(self.topdir, {"createrepo_incremental": True})
+        compose.has_comps = False
+        old_repo = os.path.join(self.topdir, "old/compose/Server/x86_64/os")
+        compose.paths.old_compose_path = mock.Mock(
+            return_value=os.path.join(old_repo, "repodata/repomd.xml")
+        )
+        copy_fixture("server-rpms.json", compose.paths.compose.metadata("rpms.json"))
+
+        create_variant_repo(
+            compose, "x86_64", compose.variants["Server"], "rpm", self.pkgset
+        )
+
+        repo = CreaterepoWrapperCls.return_value
+        self.assertEqual(
+            repo.get_createrepo_cmd.call_args[1]["update_md_path"],
+            [old_repo, "/repo/x86_64"],
+        )
+        compose.paths.old_compose_path.assert_called_once_with(
+            self.topdir + "/compose/Server/x86_64/os/repodata/repomd.xml"
+        )
+
+    @mock.patch("pungi.phases.createrepo.run")
+    @mock.patch("pungi.phases.createrepo.CreaterepoWrapper")
+    def test_variant_repo_incremental_without_old_repo(self, CreaterepoWrapperCls, run):
+        compose = DummyCompose(self.topdir, {"createrepo_incremental": True})
+        compose.has_comps = False
+        compose.paths.old_compose_path = mock.Mock(return_value=None)
+        copy_fixture("server-rpms.json", compose.paths.compose.metadata("rpms.json"))
+
+        create_variant_repo(
+            compose, "x86_64", compose.variants["Server"], "rpm", self.pkgset
+        )
+
+        repo = CreaterepoWrapperCls.return_value
+        self.assertEqual(
+            repo.get_createrepo_cmd.call_args[1]["update_md_path"], "/repo/x86_64"
+        )
+
+    @mock.patch("pungi.phases.createrepo.package_cache", new=None)
+    @mock.patch("pungi.phases.createrepo.createrepo_lib")
+    @mock.patch("pungi.phases.createrepo.run")
+    @mock.patch("pungi.phases.createrepo.CreaterepoWrapper")
+    def test_variant_repo_incremental_in_process(
+        self, CreaterepoWrapperCls, run, createrepo_lib
+    ):
+        compose = DummyCompose(
+            self.topdir,
+            {"createrepo_in_process": True, "createrepo_incremental": True},
+        )
+        compose.has_comps = False
+        compose.should_create_yum_database = False
+        old_repo = os.path.join(self.topdir, "old/compose/Server/x86_64/os")
+        compose.paths.old_compose_path = mock.Mock(
+            return_value=os.path.join(old_repo, "repodata/repomd.xml")
+        )
+        cache = createrepo_lib.PackageCache.return_value
+        cache.get_repo.return_value = {"bash-0:4.3.29-1.fc21.x86_64": mock.Mock()}
+        copy_fixture("server-rpms.json", compose.paths.compose.metadata("rpms.json"))
+
+        create_variant_repo(
+            compose, "x86_64", compose.variants["Server"], "rpm", self.pkgset
+        )
+
+        self.assertEqual(cache.get_package.call_args[0][4], [old_repo, "/repo/x86_64"])
+        compose.log_info.assert_any_call(
+            "Updating %s from %s: %d packages added, %d removed",
+            self.topdir + "/compose/Server/x86_64/os",
+            old_repo,
+            1,
+            1,
+        )
+
+    @mock.patch("pungi.phases.createrepo.createrepo_lib")
+    @mock.patch("pungi.phases.createrepo.run")
+    @mock.patch("pungi.phases.createrepo.CreaterepoWrapper")
+    def test_variant_repo_in_process_falls_back_for_extra_args(
+        self, CreaterepoWrapperCls, run, createrepo_lib
+    ):
+        compose = DummyCompose(
+            self.topdir,
+            {
+                "createrepo_in_process": True,
+                "createrepo_extra_args": ["--zck"],
+            },
+        )
+        compose.has_comps = False
+        copy_fixture("server-rpms.json", compose.paths.compose.metadata("rpms.json"))
+
+        create_variant_repo(
+            compose, "x86_64", compose.variants["Server"], "rpm", self.pkgset
+        )
+
+        self.assertEqual(createrepo_lib.write_repo.mock_calls, [])
+        self.assertEqual(len(run.mock_calls), 1)
+
 
 class TestGetProductIds(PungiTestCase):
     def mock_get(self, filenames):
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import mock
+
+from pungi import checksums, dedup
+from tests import helpers
+
+
+class TestGroupIdentical(helpers.PungiTestCase):
+    def touch(self, name, content):
+        return helpers.touch(os.path.join(self.topdir, name), content)
+
+    @mock.patch(
+        "pungi.checksums.compute_file_checksums", wraps=checksums.compute_file_checksums
+    )
+    def test_only_hash_files_with_same_size(self, cfc):
+        a = self.touch("a", "same")
+        b = self.touch("b", "same")
+        c = self.touch("c", "diff")
+        d = self.touch("d", "unique size")
+
+        self.assertEqual(dedup.group_identical([d, c, b, a]), [[a, b], [c], [d]])
+        self.assertEqual(sorted(call[0][0] for call in cfc.call_args_list), [a, b, c])
+
+    @mock.patch("pungi.checksums.compute_file_checksums")
+    def test_hardlinks_are_not_hashed(self, cfc):
+        a = self.touch("a", "same")
+        b = os.path.join(self.topdir, "b")
+        os.link(a, b)
+
+        self.assertEqual(dedup.group_identical([a, b]), [[a, b]])
+        self.assertEqual(cfc.call_args_list, [])
+
+    @mock.patch("pungi.checksums.compute_file_checksums")
+    def test_use_cached_checksums(self, cfc):
+        a = self.touch("a", "same")
+        b = self.touch("b", "same")
+        cache = checksums.ChecksumCache()
+        cache.update(os.stat(a), {"sha256": "abc"})
+        cache.update(os.stat(b), {"sha256": "abc"})
+
+        self.assertEqual(dedup.group_identical([a, b], cache=cache), [[a, b]])
+        self.assertEqual(cfc.call_args_list, [])
+
+    def test_skip_directories(self):
+        a = self.touch("dir/a", "a")
+
+        self.assertEqual(
+            dedup.group_identical([a, os.path.join(self.topdir, "dir")]), [[a]]
+        )
+
+
+class TestCopyDeduplicated(helpers.PungiTestCase):
+    def test_copy_and_link(self):
+        src = os.path.join(self.topdir, "src")
+        dst = os.path.join(self.topdir, "dst")
+        a = helpers.touch(os.path.join(src, "a"), "same")
+        b = helpers.touch(os.path.join(src, "b"), "same")
+        c = helpers.touch(os.path.join(src, "c"), "other")
+        files = {
+            os.path.join(dst, "x/a"): a,
+            os.path.join(dst, "y/b"): b,
+            os.path.join(dst, "c"): c,
+        }
+
+        saved = dedup.copy_deduplicated(files)
+
+        self.assertEqual(saved, 4)
+        st_a = os.stat(os.path.join(dst, "x/a"))
+        st_b = os.stat(os.path.join(dst, "y/b"))
+        st_c = os.stat(os.path.join(dst, "c"))
+        self.assertEqual((st_a.st_ino, st_a.st_nlink), (st_b.st_ino, 2))
+        self.assertEqual(st_c.st_nlink, 1)
+        for dest, source in files.items():
+            with open(dest) as f1:
+                with open(source) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+        # Sources are not modified.
+        self.assertEqual(os.stat(a).st_nlink, 1)
+
+    def test_replace_existing_destination(self):
+        a = helpers.touch(os.path.join(self.topdir, "src/a"), "same")
+        b = helpers.touch(os.path.join(self.topdir, "src/b"), "same")
+        dst_b = helpers.touch(os.path.join(self.topdir, "dst/b"), "stale")
+
+        dedup.copy_deduplicated({os.path.join(self.topdir, "dst/a"): a, dst_b: b})
+
+        with open(dst_b) as f:
+            self.assertEqual(f.read(), "same")
@@ -85,6 +85,33 @@ class ExtraIsosPhaseTest(helpers.PungiTestCase):
             ],
         )
 
+    def test_stream(self, ThreadPool):
+        cfg = {
+            "include_variants": ["Client"],
+            "arches": ["x86_64"],
+        }
+        compose = helpers.DummyCompose(self.topdir, {"extra_isos": {"^Server$": [cfg]}})
+
+        phase = extra_isos.ExtraIsosPhase(compose, mock.Mock(), stream=True)
+        phase.run()
+
+        self.assertEqual(len(ThreadPool.return_value.add.call_args_list), 2)
+        self.assertEqual(ThreadPool.return_value.queue_put.call_args_list, [])
+        self.assertEqual(
+            phase.get_items(),
+            [
+                (cfg, compose.variants["Server"], "src"),
+                (cfg, compose.variants["Server"], "x86_64"),
+            ],
+        )
+
+        phase.queue_item(cfg, compose.variants["Server"], "x86_64")
+
+        self.assertEqual(
+            ThreadPool.return_value.queue_put.call_args_list,
+            [mock.call((compose, cfg, compose.variants["Server"], "x86_64"))],
+        )
+
 
 @mock.patch("pungi.phases.extra_isos.prepare_media_metadata")
 @mock.patch("pungi.phases.extra_isos.get_volume_id")
@@ -127,6 +154,7 @@ class ExtraIsosThreadTest(helpers.PungiTestCase):
                     "my.iso",
                     bootable=True,
                     inherit_extra_files=False,
+                    graft_tree_cache=None,
                 ),
             ],
         )
@@ -202,6 +230,7 @@ class ExtraIsosThreadTest(helpers.PungiTestCase):
                     "my.iso",
                     bootable=True,
                     inherit_extra_files=False,
+                    graft_tree_cache=None,
                 ),
             ],
         )
@@ -275,6 +304,7 @@ class ExtraIsosThreadTest(helpers.PungiTestCase):
                     "my.iso",
                     bootable=True,
                     inherit_extra_files=False,
+                    graft_tree_cache=None,
                 ),
             ],
         )
@@ -350,6 +380,7 @@ class ExtraIsosThreadTest(helpers.PungiTestCase):
                     "my.iso",
                     bootable=False,
                     inherit_extra_files=False,
+                    graft_tree_cache=None,
                 ),
             ],
         )
@@ -420,6 +451,7 @@ class ExtraIsosThreadTest(helpers.PungiTestCase):
                     "my.iso",
                     bootable=False,
                     inherit_extra_files=False,
+                    graft_tree_cache=None,
                 ),
             ],
         )
@@ -543,6 +575,7 @@ class GetExtraFilesTest(helpers.PungiTestCase):
                     self.dir,
                     ["legalese/GPL"],
                     self.compose.conf["media_checksums"],
+                    cache=self.compose.get_checksum_cache(),
                 )
             ],
         )
@@ -572,6 +605,7 @@ class GetExtraFilesTest(helpers.PungiTestCase):
                     self.dir,
                     ["foo/a", "foo/b"],
                     self.compose.conf["media_checksums"],
+                    cache=self.compose.get_checksum_cache(),
                 ),
             ],
         )
@@ -609,6 +643,7 @@ class GetExtraFilesTest(helpers.PungiTestCase):
                     self.dir,
                     ["legalese/GPL", "setup.py"],
                     self.compose.conf["media_checksums"],
+                    cache=self.compose.get_checksum_cache(),
                 ),
             ],
         )
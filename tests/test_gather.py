@@ -19,7 +19,7 @@ from pungi.wrappers.pungi import PungiWrapper
 
 try:
     from pungi.dnf_wrapper import DnfWrapper, Conf
-    from pungi.gather_dnf import Gather, GatherOptions, PkgFlag
+    from pungi.gather_dnf import Gather, GatherOptions, PkgFlag, ProvidesIndex
 
     HAS_DNF = True
 except ImportError:
@@ -2624,3 +2624,35 @@ class DNFDepsolvingTestCase(DepsolvingBase, unittest.TestCase):
             pkg_map["debuginfo"],
             ["dummy-bash-debuginfo-4.2.37-6.x86_64.rpm"],
         )
+
+
+@unittest.skipUnless(HAS_DNF, "Dependencies are not available")
+class ProvidesIndexTestCase(unittest.TestCase):
+    class Pkg(object):
+        def __init__(self, provides, files=()):
+            self.provides = provides
+            self.files = list(files)
+
+    def _pkg(self, provides, files=()):
+        return self.Pkg(provides, files)
+
+    def test_candidates_by_name(self):
+        foo = self._pkg(["foo = 1.0-1", "libfoo.so.1()(64bit)"])
+        bar = self._pkg(["bar = 2.0-1", "foo"])
+        index = ProvidesIndex([foo, bar])
+
+        self.assertEqual(index.get_candidates("foo >= 1.0"), set([foo, bar]))
+        self.assertEqual(index.get_candidates("libfoo.so.1()(64bit)"), set([foo]))
+        self.assertEqual(index.get_candidates("baz"), set())
+
+    def test_candidates_by_file(self):
+        foo = self._pkg(["foo = 1.0-1"], ["/usr/bin/foo", "/usr/share/foo"])
+        index = ProvidesIndex([foo], file_requires=set(["/usr/bin/foo"]))
+
+        self.assertEqual(index.get_candidates("/usr/bin/foo"), set([foo]))
+        self.assertEqual(index.get_candidates("/usr/share/foo"), set())
+
+    def test_rich_dependency_is_not_indexed(self):
+        index = ProvidesIndex([self._pkg(["foo"])])
+
+        self.assertIsNone(index.get_candidates("(foo if bar)"))
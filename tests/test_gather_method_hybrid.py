@@ -2,6 +2,7 @@
 
 from collections import namedtuple
 import copy
+import createrepo_c as cr
 import mock
 import os
 
@@ -9,6 +10,8 @@ import six
 
 from pungi.phases.gather.methods import method_hybrid as hybrid
 from pungi.phases.pkgset.common import MaterializedPackageSet as PkgSet
+from pungi.repo_cache import RepoCache
+from pungi.wrappers import createrepo_lib
 from tests import helpers
 
 
@@ -708,8 +711,8 @@ class TestRunSolver(HelperMixin, helpers.PungiTestCase):
             ],
         )
 
-    @mock.patch("pungi.phases.gather.methods.method_hybrid.cr")
-    def test_multilib_runtime(self, cr, run, gc, po, wc):
+    @mock.patch("pungi.phases.gather.methods.method_hybrid.get_repo_metadata")
+    def test_multilib_runtime(self, get_repo_metadata, run, gc, po, wc):
         packages = {
             "abc": NamedMock(
                 name="foo",
@@ -736,8 +739,7 @@ class TestRunSolver(HelperMixin, helpers.PungiTestCase):
                 provides=[],
             ),
         }
-        cr.Metadata.return_value.keys.return_value = packages.keys()
-        cr.Metadata.return_value.get.side_effect = lambda key: packages[key]
+        get_repo_metadata.return_value = list(packages.values())
 
         self.phase.multilib_methods = ["runtime"]
         self.phase.multilib = mock.Mock()
@@ -978,3 +980,51 @@ class TestFilterModules(helpers.PungiTestCase):
         hybrid.filter_modules(self.variant, "x86_64", ["mod:1"])
 
         self.assertEqual(list(self.variant.arch_mmds["x86_64"].keys()), ["mod:1"])
+
+
+@mock.patch(
+    "pungi.phases.gather.methods.method_hybrid.repo_cache", new_callable=RepoCache
+)
+class TestGetRepoPackages(helpers.PungiTestCase):
+    def setUp(self):
+        super(TestGetRepoPackages, self).setUp()
+        self.repo = os.path.join(self.topdir, "repo")
+        pkg = cr.Package()
+        pkg.name, pkg.epoch, pkg.version, pkg.release = "pkg", "0", "1", "1"
+        pkg.arch = "x86_64"
+        pkg.pkgId = "abcdef"
+        pkg.checksum_type = "sha256"
+        pkg.location_href = "Packages/p/pkg-1-1.x86_64.rpm"
+        createrepo_lib.write_repo(self.repo, [pkg])
+
+    def test_parses_repo_once(self, repo_cache):
+        with mock.patch(
+            "createrepo_c.xml_parse_primary", wraps=cr.xml_parse_primary
+        ) as parse:
+            self.assertEqual(
+                hybrid.get_repo_packages(self.repo),
+                set(["pkg-1-1.x86_64.rpm"]),
+            )
+            hybrid.get_repo_packages("file://" + self.repo)
+
+        self.assertEqual(parse.call_count, 1)
+
+    def test_regenerated_repo_is_parsed_again(self, repo_cache):
+        hybrid.get_repo_packages(self.repo)
+        createrepo_lib.write_repo(self.repo, [])
+
+        self.assertEqual(hybrid.get_repo_packages(self.repo), set())
+
+    def test_metadata_is_cached(self, repo_cache):
+        packages = hybrid.get_repo_metadata(self.repo)
+
+        self.assertEqual([pkg.name for pkg in packages], ["pkg"])
+        self.assertIs(hybrid.get_repo_metadata(self.repo), packages)
+
+    def test_metadata_weighted_by_xml_size(self, repo_cache):
+        hybrid.get_repo_metadata(self.repo)
+
+        repomd = cr.Repomd(os.path.join(self.repo, "repodata/repomd.xml"))
+        self.assertEqual(
+            repo_cache.weight, sum(rec.size_open for rec in repomd.records)
+        )
@@ -1504,6 +1504,54 @@ class TestGatherPhase(helpers.PungiTestCase):
             )
         )
 
+    @mock.patch("pungi.phases.gather.link_files")
+    @mock.patch("pungi.phases.gather.gather_wrapper")
+    def test_notifies_linked_variants(self, gather_wrapper, link_files):
+        compose = helpers.DummyCompose(self.topdir, {})
+        compose.notifier = mock.Mock()
+        compose.all_variants["Client"].is_empty = True
+        early = []
+        late = []
+
+        phase = gather.GatherPhase(compose, mock.Mock())
+        phase.add_linked_listener(lambda v, a: early.append((v.uid, a)))
+        phase.run()
+        phase.add_linked_listener(lambda v, a: late.append((v.uid, a)))
+
+        self.assertTrue(phase.wait_until_linked())
+        expected = [
+            ("Everything", "x86_64"),
+            ("Everything", "amd64"),
+            ("Server", "x86_64"),
+            ("Server", "amd64"),
+        ]
+        six.assertCountEqual(self, early, expected)
+        self.assertEqual(early, late)
+        self.assertIs(compose.get_rpm_manifest(), phase.manifest)
+
+    @mock.patch("pungi.phases.gather.link_files")
+    @mock.patch("pungi.phases.gather.gather_wrapper")
+    def test_failure_finishes_linking(self, gather_wrapper, link_files):
+        compose = helpers.DummyCompose(self.topdir, {})
+        compose.notifier = mock.Mock()
+        link_files.side_effect = helpers.boom
+
+        phase = gather.GatherPhase(compose, mock.Mock())
+        with self.assertRaises(Exception):
+            phase.run()
+
+        self.assertFalse(phase.wait_until_linked())
+
+    @mock.patch("pungi.phases.gather.repo_cache")
+    def test_stop_clears_repo_cache(self, repo_cache):
+        compose = helpers.DummyCompose(self.topdir, {})
+        compose.notifier = mock.Mock()
+
+        phase = gather.GatherPhase(compose, mock.Mock())
+        phase.stop()
+
+        repo_cache.clear.assert_called_once_with()
+
     @mock.patch("pungi.phases.gather.link_files")
     @mock.patch("pungi.phases.gather.gather_wrapper")
     def test_writes_manifest_when_skipped(self, gather_wrapper, link_files):
@@ -1875,3 +1923,66 @@ class TestMakeLookasideRepo(helpers.PungiTestCase):
         )
 
         self.assertCorrect(repopath, dl_dir + "/download/", MockCR, mock_run)
+
+    @mock.patch("pungi.phases.gather.createrepo_lib.write_repo")
+    @mock.patch("pungi.phases.gather.get_package_cache")
+    @mock.patch("pungi.phases.gather.run")
+    def test_create_repo_in_process(self, mock_run, get_cache, write_repo):
+        self.compose.conf.update(
+            {"pkgset_source": "repos", "createrepo_in_process": True}
+        )
+        cache = get_cache.return_value
+        cache.get_nevras.return_value = {"pkg/pkg-1.0-1.src.rpm": "pkg-0:1.0-1.src"}
+        prefix = os.path.join(self.compose.paths.work.topdir("global"), "download")
+        pkgset_repo = self.compose.paths.work.pkgset_repo("p2", self.arch)
+
+        pkg_map = {
+            self.arch: {
+                self.variant.uid: {
+                    "rpm": [{"path": os.path.join(prefix, "pkg/pkg-1.0-1.x86_64.rpm")}],
+                    "srpm": [{"path": os.path.join(prefix, "pkg/pkg-1.0-1.src.rpm")}],
+                }
+            }
+        }
+
+        repopath = gather._make_lookaside_repo(
+            self.compose, self.variant, self.arch, pkg_map, self.package_sets
+        )
+
+        self.assertEqual(self.repodir, repopath)
+        self.assertEqual(mock_run.call_args_list, [])
+        self.assertEqual(cache.get_nevras.call_args_list, [mock.call(pkgset_repo)])
+        self.assertEqual(
+            cache.get_packages.call_args_list,
+            [
+                mock.call(
+                    [
+                        (
+                            os.path.join(prefix, "pkg/pkg-1.0-1.src.rpm"),
+                            "pkg/pkg-1.0-1.src.rpm",
+                            "pkg-0:1.0-1.src",
+                        ),
+                        (
+                            os.path.join(prefix, "pkg/pkg-1.0-1.x86_64.rpm"),
+                            "pkg/pkg-1.0-1.x86_64.rpm",
+                            None,
+                        ),
+                    ],
+                    "sha256",
+                    [pkgset_repo],
+                    location_base="file://%s/" % prefix,
+                    num_workers=3,
+                )
+            ],
+        )
+        self.assertEqual(
+            write_repo.call_args_list,
+            [
+                mock.call(
+                    repopath,
+                    cache.get_packages.return_value,
+                    checksum_type="sha256",
+                    extra_files=[],
+                )
+            ],
+        )
@@ -32,7 +32,7 @@ class TestImageChecksumPhase(PungiTestCase):
         self.assertIn("media_checksum_one_file", str(ctx.exception))
 
     @mock.patch("os.path.exists")
-    @mock.patch("kobo.shortcuts.compute_file_checksums")
+    @mock.patch("pungi.checksums.compute_file_checksums")
     @mock.patch("pungi.phases.image_checksum.dump_checksums")
     def test_checksum_one_file(self, dump_checksums, cc, exists):
         compose = DummyCompose(
@@ -57,7 +57,7 @@ class TestImageChecksumPhase(PungiTestCase):
         compose.image.add_checksum.assert_called_once_with(None, "sha256", "cafebabe")
 
     @mock.patch("os.path.exists")
-    @mock.patch("kobo.shortcuts.compute_file_checksums")
+    @mock.patch("pungi.checksums.compute_file_checksums")
     @mock.patch("pungi.phases.image_checksum.dump_checksums")
     def test_checksum_save_individuals(self, dump_checksums, cc, exists):
         compose = DummyCompose(self.topdir, {"media_checksums": ["md5", "sha256"]})
@@ -99,7 +99,7 @@ class TestImageChecksumPhase(PungiTestCase):
         )
 
     @mock.patch("os.path.exists")
-    @mock.patch("kobo.shortcuts.compute_file_checksums")
+    @mock.patch("pungi.checksums.compute_file_checksums")
     @mock.patch("pungi.phases.image_checksum.dump_checksums")
     def test_checksum_one_file_custom_name(self, dump_checksums, cc, exists):
         compose = DummyCompose(
@@ -130,7 +130,7 @@ class TestImageChecksumPhase(PungiTestCase):
         compose.image.add_checksum.assert_called_once_with(None, "sha256", "cafebabe")
 
     @mock.patch("os.path.exists")
-    @mock.patch("kobo.shortcuts.compute_file_checksums")
+    @mock.patch("pungi.checksums.compute_file_checksums")
     @mock.patch("pungi.phases.image_checksum.dump_checksums")
     def test_checksum_save_individuals_custom_name(self, dump_checksums, cc, exists):
         compose = DummyCompose(
@@ -180,7 +180,7 @@ class TestImageChecksumPhase(PungiTestCase):
         )
 
     @mock.patch("os.path.exists")
-    @mock.patch("kobo.shortcuts.compute_file_checksums")
+    @mock.patch("pungi.checksums.compute_file_checksums")
     @mock.patch("pungi.phases.image_checksum.dump_checksums")
     def test_checksum_save_individuals_custom_name_str_format(
         self, dump_checksums, cc, exists
@@ -3,7 +3,9 @@
 import itertools
 import mock
 import os
+import shutil
 import six
+import tempfile
 
 try:
     import unittest2 as unittest
@@ -212,3 +214,137 @@ class TestCmpGraftPoints(unittest.TestCase):
 
     def test_all_kinds(self):
         self.assertSorted("etc/file", "ppc/file", "c.txt", "d.txt", "a.rpm", "b.rpm")
+
+
+class TestGraftPoints(unittest.TestCase):
+    def setUp(self):
+        self.topdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.topdir)
+
+    def touch(self, path):
+        path = os.path.join(self.topdir, path)
+        if path.endswith("/"):
+            os.makedirs(path)
+        else:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, "w").close()
+        return path
+
+    def test_scan_tree(self):
+        foo = self.touch("tree/foo")
+        bar = self.touch("tree/a/b/bar")
+        empty = self.touch("tree/c/")
+
+        self.assertEqual(
+            iso.get_graft_points(self.topdir, [os.path.join(self.topdir, "tree")]),
+            {
+                "foo": foo,
+                "a/": os.path.join(self.topdir, "tree/a/"),
+                "a/b/": os.path.join(self.topdir, "tree/a/b/"),
+                "a/b/bar": bar,
+                "c/": empty,
+            },
+        )
+
+    def test_later_paths_take_precedence(self):
+        self.assertEqual(
+            iso.get_graft_points(
+                self.topdir,
+                [{"a/foo": "/1/foo", "a/bar": "/1/bar"}, {"a/foo": "/2/foo"}],
+            ),
+            {"a/foo": "/2/foo", "a/bar": "/1/bar"},
+        )
+
+    def test_exclusive_path_replaces_directories(self):
+        self.touch("excl/a/foo")
+        self.touch("excl/c/d/baz")
+
+        result = iso.get_graft_points(
+            self.topdir,
+            [{"top": "/1/top", "a/bar": "/1/bar", "a/x/y": "/1/y", "b/z": "/1/z"}],
+            exclusive_paths=[os.path.join(self.topdir, "excl")],
+        )
+
+        six.assertCountEqual(
+            self, result, ["top", "a/", "a/foo", "b/z", "c/", "c/d/", "c/d/baz"]
+        )
+
+    def test_write_graft_points(self):
+        gp = os.path.join(self.topdir, "graft-points")
+        tree = {
+            "Packages/": "/t/Packages/",
+            "Packages/foo.rpm": "/t/Packages/foo.rpm",
+            "images/boot.iso": "/t/images/boot.iso",
+            "images/install.img": "/t/images/install.img",
+            "empty/": "/t/empty/",
+            "emptyish/": "/t/emptyish/",
+            "emptyish/lost+found": "/t/emptyish/lost+found",
+            "extra/TRANS.TBL": "/t/extra/TRANS.TBL",
+            "readme": "/t/readme",
+        }
+
+        iso.write_graft_points(
+            gp, tree, exclude=["*/lost+found", "*/boot.iso", "extra/*.TBL"]
+        )
+
+        with open(gp) as f:
+            self.assertEqual(
+                f.read().splitlines(),
+                [
+                    "images/install.img=/t/images/install.img",
+                    "empty/=/t/empty/",
+                    "readme=/t/readme",
+                    "Packages/foo.rpm=/t/Packages/foo.rpm",
+                ],
+            )
+
+    def test_empty_dir_with_prefix_sibling_is_kept(self):
+        tree = iso.GraftTree({"a/": "/t/a/", "ab/foo": "/t/ab/foo"})
+
+        six.assertCountEqual(
+            self,
+            tree.iter_graft_points(),
+            [("a/", "/t/a/"), ("ab/foo", "/t/ab/foo")],
+        )
+
+    def test_graft_does_not_modify_source(self):
+        source = iso.GraftTree({"f/foo.rpm": "/t/foo.rpm"})
+        tree = iso.GraftTree({"Server/Packages/f/bar.rpm": "/t/bar.rpm"})
+
+        tree.graft("Server/Packages", source)
+        tree["Server/Packages/f/foo.rpm"] = "/other/foo.rpm"
+
+        self.assertEqual(
+            dict(tree),
+            {
+                "Server/Packages/f/bar.rpm": "/t/bar.rpm",
+                "Server/Packages/f/foo.rpm": "/other/foo.rpm",
+            },
+        )
+        self.assertEqual(dict(source), {"f/foo.rpm": "/t/foo.rpm"})
+
+    def test_mapping_interface(self):
+        tree = iso.GraftTree({"a/": "/t/a/", "a/b": "/t/a/b"})
+
+        self.assertIn("a/", tree)
+        self.assertEqual(tree["a/b"], "/t/a/b")
+        self.assertNotIn("a", tree)
+        del tree["a/b"]
+        self.assertEqual(len(tree), 1)
+        with self.assertRaises(KeyError):
+            tree["a/b"]
+
+    @mock.patch("pungi.wrappers.iso.get_graft_points")
+    def test_cache_scans_directory_once(self, ggp):
+        ggp.return_value = {"foo": "/t/foo"}
+        cache = iso.GraftTreeCache(self.topdir)
+
+        first = cache.get("/t")
+        second = cache.get("/t")
+
+        self.assertIs(first, second)
+        self.assertEqual(dict(first), {"foo": "/t/foo"})
+        self.assertEqual(ggp.call_args_list, [mock.call(self.topdir, ["/t"])])
@@ -11,10 +11,16 @@ import tempfile
 
 import os
 import shutil
+import threading
 
+import koji
 import six
 
-from pungi.wrappers.kojiwrapper import KojiWrapper, get_buildroot_rpms
+from pungi.wrappers.kojiwrapper import (
+    KojiTaskWatcher,
+    KojiWrapper,
+    get_buildroot_rpms,
+)
 
 from .helpers import FIXTURE_DIR
 
@@ -367,6 +373,33 @@ class KojiWrapperTest(KojiWrapperBaseTestCase):
         self.koji.koji_proxy.multiCall.assert_called_with(strict=True)
         self.assertEqual(ret, [1, 2])
 
+    @mock.patch("pungi.wrappers.kojiwrapper.koji.ClientSession")
+    def test_pooled_session(self, ClientSession):
+        main_session = self.koji.koji_proxy
+
+        with self.koji.pooled_session() as session:
+            self.assertIs(self.koji.koji_proxy, session)
+            self.assertIsNot(session, main_session)
+
+        self.assertIs(self.koji.koji_proxy, main_session)
+
+        # The session went back to the pool and is reused.
+        with self.koji.pooled_session() as second_session:
+            self.assertIs(second_session, session)
+        self.assertEqual(ClientSession.call_count, 1)
+
+    @mock.patch("pungi.wrappers.kojiwrapper.koji.ClientSession")
+    def test_pooled_session_is_per_thread(self, ClientSession):
+        main_session = self.koji.koji_proxy
+        seen = []
+
+        with self.koji.pooled_session():
+            t = threading.Thread(target=lambda: seen.append(self.koji.koji_proxy))
+            t.start()
+            t.join()
+
+        self.assertEqual(seen, [main_session])
+
 
 class LiveMediaTestCase(KojiWrapperBaseTestCase):
     def test_get_live_media_cmd_minimal(self):
@@ -1213,3 +1246,190 @@ class TestGetBuildrootRPMs(unittest.TestCase):
                 "coreutils-8.24-6.fc23.x86_64",
             ],
         )
+
+
+class FakeHub(object):
+    """Fake Koji hub answering multicalls of getTaskInfo.
+
+    :param dict states: mapping of task ids to list of state names returned by
+        consecutive polls. The last state is repeated forever.
+    """
+
+    def __init__(self, states, fail=0):
+        self.states = states
+        self.fail = fail
+        self.multicall = False
+        self.batches = []
+        self._batch = []
+
+    def getTaskInfo(self, task_id):
+        assert self.multicall, "getTaskInfo called outside of multicall"
+        self._batch.append(task_id)
+
+    def multiCall(self, strict=False):
+        self.multicall = False
+        batch, self._batch = self._batch, []
+        self.batches.append(batch)
+        if self.fail:
+            self.fail -= 1
+            raise koji.GenericError("Connection refused")
+        result = []
+        for task_id in batch:
+            states = self.states[task_id]
+            state = states.pop(0) if len(states) > 1 else states[0]
+            result.append([{"id": task_id, "state": koji.TASK_STATES[state]}])
+        return result
+
+
+@mock.patch("time.sleep", new=mock.Mock())
+class KojiTaskWatcherTest(KojiWrapperBaseTestCase):
+    def _get_watcher(self, hub):
+        self.koji.koji_proxy = hub
+        return KojiTaskWatcher(self.koji, min_interval=0, max_interval=0)
+
+    def test_batches_outstanding_tasks(self):
+        hub = FakeHub(
+            {
+                1: ["OPEN", "OPEN", "CLOSED"],
+                2: ["OPEN", "FAILED"],
+                3: ["CANCELED"],
+            }
+        )
+        watcher = self._get_watcher(hub)
+
+        # Register all tasks before the watcher thread makes its first call.
+        with watcher._lock:
+            waiters = [watcher.watch(task_id) for task_id in (1, 2, 3)]
+
+        states = [waiter.result(timeout=10) for waiter in waiters]
+
+        self.assertEqual(
+            states,
+            [
+                koji.TASK_STATES["CLOSED"],
+                koji.TASK_STATES["FAILED"],
+                koji.TASK_STATES["CANCELED"],
+            ],
+        )
+        self.assertEqual(hub.batches, [[1, 2, 3], [1, 2], [1]])
+        self.assertEqual(watcher.polls, 3)
+
+    def test_fail_after_max_retries(self):
+        hub = FakeHub({1: ["OPEN"]}, fail=5)
+        watcher = self._get_watcher(hub)
+
+        with self.assertRaises(RuntimeError) as ctx:
+            watcher.wait(1, max_retries=2)
+
+        self.assertIn("Too many connection errors", str(ctx.exception))
+        self.assertEqual(hub.batches, [[1], [1]])
+
+    def test_recover_from_connection_error(self):
+        hub = FakeHub({1: ["CLOSED"]}, fail=2)
+        watcher = self._get_watcher(hub)
+
+        self.assertEqual(watcher.wait(1), koji.TASK_STATES["CLOSED"])
+        self.assertEqual(hub.batches, [[1], [1], [1]])
+
+    @mock.patch("pungi.wrappers.kojiwrapper.run")
+    def test_run_blocking_cmd_in_process(self, run):
+        self.koji.compose.conf["koji_watch_tasks_in_process"] = True
+        self.koji.compose.koji_task_watcher = self._get_watcher(
+            FakeHub({1234: ["OPEN", "CLOSED"]})
+        )
+        run.return_value = (0, "Created task: 1234\n")
+
+        result = self.koji.run_blocking_cmd(["koji", "image-build"])
+
+        self.assertDictEqual(
+            result, {"retcode": 0, "output": "Task 1234: CLOSED\n", "task_id": 1234}
+        )
+        self.assertEqual(run.call_args[0][0], ["koji", "image-build", "--nowait"])
+
+    def test_watch_task_in_process_failed(self):
+        self.koji.compose.conf["koji_watch_tasks_in_process"] = True
+        self.koji.koji_module.config.weburl = "https://koji.example.com/koji"
+        self.koji.compose.koji_task_watcher = self._get_watcher(
+            FakeHub({1234: ["FAILED"]})
+        )
+
+        self.assertEqual(self.koji.watch_task(1234, log_file=self.tmpfile), 1)
+
+        with open(self.tmpfile) as f:
+            self.assertIn("Task 1234: FAILED\n", f.read())
+
+
+class FakeBuildHub(object):
+    """Fake Koji hub session answering getBuild. All sessions created for one
+    test share `calls`, so that the total number of requests can be counted.
+    """
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.multicall = False
+        self._batch = []
+
+    def getBuild(self, build_id):
+        if not self.multicall:
+            self.calls.append(("getBuild", [build_id]))
+            return {"id": build_id}
+        self._batch.append(build_id)
+
+    def multiCall(self, strict=False):
+        self.multicall = False
+        batch, self._batch = self._batch, []
+        self.calls.append(("multiCall", batch))
+        return [[{"id": build_id}] for build_id in batch]
+
+
+class BatchedMulticallTest(KojiWrapperBaseTestCase):
+    def setUp(self):
+        super(BatchedMulticallTest, self).setUp()
+        self.calls = []
+        self.koji.koji_proxy = FakeBuildHub(self.calls)
+        self.koji._create_session = lambda: FakeBuildHub(self.calls)
+
+    def test_single_batch(self):
+        result = self.koji.batched_multicall_map("getBuild", [1, 2, 3])
+
+        self.assertEqual(result, [{"id": 1}, {"id": 2}, {"id": 3}])
+        self.assertEqual(self.calls, [("multiCall", [1, 2, 3])])
+        self.assertEqual(self.koji._session_pool, [])
+
+    def test_concurrent_batches(self):
+        build_ids = list(range(250))
+
+        result = self.koji.batched_multicall_map(
+            "getBuild", build_ids, batch_size=100, num_threads=3
+        )
+
+        self.assertEqual(result, [{"id": build_id} for build_id in build_ids])
+        # One request per batch, no individual calls.
+        six.assertCountEqual(
+            self,
+            self.calls,
+            [
+                ("multiCall", build_ids[:100]),
+                ("multiCall", build_ids[100:200]),
+                ("multiCall", build_ids[200:]),
+            ],
+        )
+        self.assertLessEqual(len(self.koji._session_pool), 3)
+
+    def test_kwargs(self):
+        self.koji.koji_proxy.getBuild = mock.Mock()
+        self.koji.koji_proxy.multiCall = mock.Mock(return_value=[[1], [2]])
+
+        result = self.koji.batched_multicall_map(
+            "getBuild", list_of_kwargs=[{"build_id": 1}, {"build_id": 2}]
+        )
+
+        self.assertEqual(result, [1, 2])
+        self.assertEqual(
+            self.koji.koji_proxy.getBuild.call_args_list,
+            [mock.call(build_id=1), mock.call(build_id=2)],
+        )
+
+    def test_no_calls(self):
+        self.assertEqual(self.koji.batched_multicall_map("getBuild", []), [])
+        self.assertEqual(self.calls, [])
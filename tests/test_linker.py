@@ -4,6 +4,7 @@
 import mock
 import errno
 import os
+import six
 import stat
 
 from pungi import linker
@@ -229,6 +230,36 @@ class TestLinkerLink(TestLinkerBase):
         self.assertTrue(self.same_inode(self.path_src, dst))
         self.assertFalse(os.path.islink(dst))
 
+    def test_reflink_or_copy_file(self):
+        dst = os.path.join(self.topdir, "reflink-or-copy")
+        self.linker.link(self.path_src, dst, link_type="reflink-or-copy")
+        self.assertFalse(os.path.islink(dst))
+        self.assertFalse(self.same_inode(self.path_src, dst))
+        self.assertTrue(self.same_content(self.path_src, dst))
+        self.assertSameStat(self.path_src, dst)
+
+    @mock.patch.dict("pungi.util._reflink_support", clear=True)
+    @mock.patch("pungi.util._ficlone")
+    def test_reflink_file_not_supported(self, ficlone):
+        ficlone.side_effect = IOError(errno.EOPNOTSUPP, "Not supported")
+        dst = os.path.join(self.topdir, "reflink")
+        with self.assertRaises(OSError) as ctx:
+            self.linker.link(self.path_src, dst, link_type="reflink")
+        self.assertEqual(ctx.exception.errno, errno.EOPNOTSUPP)
+        self.assertFalse(os.path.exists(dst))
+
+    @mock.patch.dict("pungi.util._reflink_support", clear=True)
+    @mock.patch("pungi.util._ficlone")
+    @mock.patch("os.link")
+    def test_hardlink_or_reflink_file(self, link, ficlone):
+        link.side_effect = OSError(errno.EXDEV, "Cross-device link")
+        dst = os.path.join(self.topdir, "hardlink-or-reflink")
+        self.linker.link(self.path_src, dst, link_type="hardlink-or-reflink")
+        self.assertEqual(link.call_args_list, [mock.call(self.path_src, dst)])
+        self.assertEqual(len(ficlone.call_args_list), 1)
+        self.assertTrue(os.path.isfile(dst))
+        self.assertFalse(self.same_inode(self.path_src, dst))
+
     def test_link_file_test_mode(self):
         self.linker = linker.Linker(logger=self.logger, test=True)
 
@@ -348,3 +379,69 @@ class TestLinkerLink(TestLinkerBase):
         self.assertTrue(self.same_inode(self.file1, self.hardlink1))
         self.linker.link(self.src_dir, self.dst_dir, link_type="copy")
         self.assertTrue(self.same_inode(self.dst_file1, self.dst_hardlink1))
+
+
+class TestLinkerPoolQueueTree(TestLinkerBase):
+    def setUp(self):
+        super(TestLinkerPoolQueueTree, self).setUp()
+        self.pool = linker.LinkerPool(link_type="hardlink")
+        self.src_dir = self.mkdir("src")
+        self.dst_dir = os.path.join(self.topdir, "dst")
+        self.files = ["file1", "file2", "sub/file3", "sub/deep/file4", "symlink"]
+        for f in self.files[:-1]:
+            self.touch(os.path.join("src", f), f)
+        os.symlink("sub", os.path.join(self.src_dir, "symlink"))
+
+    def test_queue_tree_in_batches(self):
+        with mock.patch.object(self.pool, "queue_put") as queue_put:
+            self.pool.queue_tree(self.src_dir, self.dst_dir, batch_size=3)
+
+        # Directories are created before anything is linked.
+        self.assertTrue(os.path.isdir(os.path.join(self.dst_dir, "sub/deep")))
+        self.assertFalse(os.path.exists(os.path.join(self.dst_dir, "file1")))
+
+        batches = [c[0][0] for c in queue_put.call_args_list]
+        self.assertEqual([len(b) for b in batches], [3, 2])
+        six.assertCountEqual(
+            self,
+            [(src, dst) for batch in batches for src, dst, _ in batch],
+            [
+                (os.path.join(self.src_dir, f), os.path.join(self.dst_dir, f))
+                for f in self.files
+            ],
+        )
+
+    def test_link_tree(self):
+        with linker.linker_pool("hardlink", num_workers=2) as pool:
+            pool.queue_tree(self.src_dir, self.dst_dir, batch_size=2)
+
+        for f in self.files[:-1]:
+            self.assertTrue(
+                self.same_inode(
+                    os.path.join(self.src_dir, f), os.path.join(self.dst_dir, f)
+                )
+            )
+        self.assertEqual(os.readlink(os.path.join(self.dst_dir, "symlink")), "sub")
+
+    def test_skip_dir_symlinks(self):
+        with mock.patch.object(self.pool, "queue_put") as queue_put:
+            self.pool.queue_tree(self.src_dir, self.dst_dir, skip_dir_symlinks=True)
+
+        six.assertCountEqual(
+            self,
+            [dst for c in queue_put.call_args_list for _, dst, _ in c[0][0]],
+            [os.path.join(self.dst_dir, f) for f in self.files[:-1]],
+        )
+
+    @mock.patch("pungi.linker.scandir", new=None)
+    def test_link_tree_without_scandir(self):
+        with linker.linker_pool("hardlink", num_workers=2) as pool:
+            pool.queue_tree(self.src_dir, self.dst_dir, batch_size=2)
+
+        for f in self.files[:-1]:
+            self.assertTrue(
+                self.same_inode(
+                    os.path.join(self.src_dir, f), os.path.join(self.dst_dir, f)
+                )
+            )
+        self.assertEqual(os.readlink(os.path.join(self.dst_dir, "symlink")), "sub")
@@ -127,3 +127,75 @@ class MediaSplitterTestCase(unittest.TestCase):
         self.assertEqual(
             ms.split(), [{"files": ["first", "second", "third"], "size": bl(145)}]
         )
+
+    def test_packed_uses_fewer_discs(self):
+        ms = media_split.MediaSplitter(bl(100))
+        ms.add_file("first", bl(60), group="a")
+        ms.add_file("second", bl(70), group="b")
+        ms.add_file("third", bl(40), group="c")
+        ms.add_file("fourth", bl(30), group="d")
+
+        self.assertEqual(len(ms.split()), 3)
+        self.assertEqual(
+            ms.split_packed(),
+            [
+                {"files": ["second", "fourth"], "size": bl(100)},
+                {"files": ["first", "third"], "size": bl(100)},
+            ],
+        )
+
+    def test_packed_keeps_ungrouped_files_first(self):
+        ms = media_split.MediaSplitter(bl(100))
+        ms.add_file("sticky", bl(10), sticky=True)
+        ms.add_file("treeinfo", bl(5))
+        ms.add_file("images", bl(50))
+        ms.add_file("big", bl(80), group="big")
+        ms.add_file("small", bl(30), group="small")
+
+        self.assertEqual(
+            ms.split_packed(),
+            [
+                {"files": ["sticky", "treeinfo", "images", "small"], "size": bl(95)},
+                {"files": ["sticky", "big"], "size": bl(90)},
+            ],
+        )
+
+    def test_packed_keeps_group_together(self):
+        ms = media_split.MediaSplitter(bl(100))
+        ms.add_file("a-1", bl(40), group="a")
+        ms.add_file("b-1", bl(30), group="b")
+        ms.add_file("a-2", bl(40), group="a")
+        ms.add_file("b-2", bl(30), group="b")
+
+        self.assertEqual(
+            ms.split_packed(),
+            [
+                {"files": ["a-1", "a-2"], "size": bl(80)},
+                {"files": ["b-1", "b-2"], "size": bl(60)},
+            ],
+        )
+
+    def test_packed_splits_group_bigger_than_disc(self):
+        ms = media_split.MediaSplitter(bl(100))
+        ms.add_file("a-1", bl(70), group="a")
+        ms.add_file("a-2", bl(60), group="a")
+        ms.add_file("b", bl(30), group="b")
+
+        self.assertEqual(
+            ms.split_packed(),
+            [
+                {"files": ["a-1", "b"], "size": bl(100)},
+                {"files": ["a-2"], "size": bl(60)},
+            ],
+        )
+
+    def test_packed_unlimited_media(self):
+        ms = media_split.MediaSplitter(None)
+        ms.add_file("first", bl(25), group="a")
+        ms.add_file("second", bl(40))
+        ms.add_file("third", bl(80), group="b")
+
+        self.assertEqual(
+            ms.split_packed(),
+            [{"files": ["first", "second", "third"], "size": bl(145)}],
+        )
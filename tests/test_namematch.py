@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+
+import fnmatch
+import unittest
+
+from pungi.namematch import NameIndex, split_patterns
+
+NAMES = [
+    "bash",
+    "bash-completion",
+    "bash-doc",
+    "foo",
+    "foo-devel",
+    "foo-devel-docs",
+    "foo[bar]",
+    "glibc-langpack-cs",
+    "glibc-langpack-en",
+    "hunspell-cs",
+    "kernel",
+    "kernel-core",
+    "python3-foo",
+    "python3-foo-tests",
+    "zsh",
+]
+
+PATTERNS = [
+    "bash",
+    "missing",
+    "bash*",
+    "foo-*",
+    "*",
+    "*-devel",
+    "python3-*-tests",
+    "glibc-langpack-??",
+    "kernel-[cd]*",
+    "kernel-[!c]*",
+    "foo[bar]",
+    "foo[[]bar]",
+    "foo[",
+    "[",
+    "a.b*",
+    "zsh?",
+    "",
+]
+
+
+class TestSplitPatterns(unittest.TestCase):
+    def test_split(self):
+        exact, prefixes, other = split_patterns(["foo", "foo-*", "*-devel", "*"])
+        self.assertEqual(exact, set(["foo"]))
+        self.assertEqual(prefixes, set(["foo-", ""]))
+        self.assertEqual(other, ["*-devel"])
+
+
+class TestNameIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = NameIndex(NAMES)
+
+    def assertMatchesFnmatch(self, patterns):
+        expected = set(
+            name
+            for name in NAMES
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+        )
+        self.assertEqual(self.index.match(patterns), expected, patterns)
+
+    def test_single_patterns(self):
+        for pattern in PATTERNS:
+            self.assertMatchesFnmatch([pattern])
+
+    def test_combined_patterns(self):
+        self.assertMatchesFnmatch(PATTERNS)
+        self.assertMatchesFnmatch(["bash", "foo-*", "*-tests", "kernel-[cd]*"])
+
+    def test_no_patterns(self):
+        self.assertEqual(self.index.match([]), set())
+
+    def test_prefix_at_end_of_list(self):
+        self.assertEqual(self.index.match(["zsh*", "zzz*"]), set(["zsh"]))
@@ -7,6 +7,7 @@ try:
 except ImportError:
     import unittest
 import random
+import threading
 import time
 
 from pungi.phases import weaver
@@ -131,3 +132,207 @@ class TestWeaver(unittest.TestCase):
         self.assertMissed(self.p4)
         self.assertFinalized(self.p5)
         self.assertFinalized(self.p6)
+
+
+class TestGraphWeaver(unittest.TestCase):
+    def setUp(self):
+        self.compose = DummyCompose(None, {})
+        self.order = []
+
+    def _phase(self, name, fail=False):
+        phase = mock.Mock()
+        phase.name = name
+
+        def start():
+            self.order.append(name)
+            if fail:
+                boom()
+
+        phase.start.side_effect = start
+        return phase
+
+    def _task(self, name, fail=False):
+        def task():
+            self.order.append(name)
+            if fail:
+                boom()
+
+        return task
+
+    def _run(self, weaver_phase):
+        weaver_phase.start()
+        weaver_phase.stop()
+
+    def test_respects_dependencies(self):
+        p1 = self._phase("p1")
+        p2 = self._phase("p2")
+        weaver_phase = weaver.GraphWeaverPhase(self.compose)
+        weaver_phase.add_phase(p2, requires=["p1"])
+        weaver_phase.add_phase(p1)
+
+        self._run(weaver_phase)
+
+        self.assertEqual(self.order, ["p1", "p2"])
+        self.assertEqual(p1.mock_calls, [mock.call.start(), mock.call.stop()])
+        self.assertEqual(p2.mock_calls, [mock.call.start(), mock.call.stop()])
+
+    def test_runs_callables(self):
+        weaver_phase = weaver.GraphWeaverPhase(self.compose)
+        weaver_phase.add_phase(self._phase("p1"))
+        weaver_phase.add("task", lambda: self.order.append("task"), requires=["p1"])
+
+        self._run(weaver_phase)
+
+        self.assertEqual(self.order, ["p1", "task"])
+
+    def test_critical_path_first(self):
+        weaver_phase = weaver.GraphWeaverPhase(self.compose, max_running=1)
+        weaver_phase.add("short", self._task("short"))
+        weaver_phase.add("long", self._task("long"))
+        weaver_phase.add("after-long", self._task("after-long"), requires=["long"])
+        weaver_phase.add("heavy", self._task("heavy"), weight=5)
+
+        self._run(weaver_phase)
+
+        self.assertEqual(self.order, ["heavy", "long", "short", "after-long"])
+
+    def test_stop_on_failure(self):
+        weaver_phase = weaver.GraphWeaverPhase(self.compose, max_running=1)
+        weaver_phase.add("t1", self._task("t1", fail=True))
+        weaver_phase.add("t2", self._task("t2"), requires=["t1"])
+        weaver_phase.add("t3", self._task("t3"))
+
+        with self.assertRaises(Exception) as ctx:
+            self._run(weaver_phase)
+
+        self.assertEqual("BOOM", str(ctx.exception))
+        self.assertEqual(self.order, ["t1"])
+
+    def test_phases_are_not_limited(self):
+        started = threading.Event()
+        weaver_phase = weaver.GraphWeaverPhase(self.compose, max_running=1)
+        phase = self._phase("phase")
+        # The phase only finishes once the task is running.
+        phase.stop.side_effect = lambda: started.wait(5)
+        weaver_phase.add_phase(phase, weight=5)
+        weaver_phase.add("task", started.set)
+
+        self._run(weaver_phase)
+
+        self.assertTrue(started.is_set())
+        self.assertEqual(self.order, ["phase"])
+
+    def test_signal(self):
+        weaver_phase = weaver.GraphWeaverPhase(self.compose)
+        phase = self._phase("phase")
+        phase.stop.side_effect = lambda: self.order.append("phase-stop")
+        # Signalled while the phase is running.
+        phase.start.side_effect = lambda: weaver_phase.signal("part")
+        weaver_phase.add_phase(phase)
+        weaver_phase.add_signal("part", "phase")
+        weaver_phase.add("task", self._task("task"), requires=["part"])
+        weaver_phase.add("after", self._task("after"), requires=["phase", "task"])
+
+        self._run(weaver_phase)
+
+        self.assertEqual(self.order[-1], "after")
+        self.assertIn("task", self.order)
+
+    def test_unsignalled_item_finishes_with_owner(self):
+        weaver_phase = weaver.GraphWeaverPhase(self.compose)
+        weaver_phase.add_phase(self._phase("phase"))
+        weaver_phase.add_signal("part", "phase")
+        weaver_phase.add("task", self._task("task"), requires=["part"])
+
+        self._run(weaver_phase)
+
+        self.assertEqual(self.order, ["phase", "task"])
+
+    def test_signal_unknown_item(self):
+        weaver_phase = weaver.GraphWeaverPhase(self.compose)
+        weaver_phase.signal("missing")
+        weaver_phase.add("task", self._task("task"))
+
+        self._run(weaver_phase)
+
+        self.assertEqual(self.order, ["task"])
+
+    def test_signal_with_unknown_owner(self):
+        weaver_phase = weaver.GraphWeaverPhase(self.compose)
+        weaver_phase.add_signal("part", "missing")
+
+        with self.assertRaises(ValueError) as ctx:
+            weaver_phase.start()
+
+        self.assertIn("unknown item 'missing'", str(ctx.exception))
+
+    def test_phase_items(self):
+        class Phase(object):
+            name = "phase"
+            start = staticmethod(self._task("phase"))
+            stop = staticmethod(self._task("phase-stop"))
+
+        phase = Phase()
+        weaver_phase = weaver.GraphWeaverPhase(self.compose, max_running=1)
+        weaver_phase.add("prep", self._task("prep"))
+        weaver_phase.add("meta", self._task("meta"), requires=["prep"])
+        weaver_phase.add_phase_items(
+            phase,
+            [
+                ("item-1", self._task("item-1"), []),
+                ("item-2", self._task("item-2"), ["meta"]),
+            ],
+            requires=["prep"],
+        )
+        weaver_phase.add("checksums", self._task("checksums"), requires=["phase"])
+
+        self._run(weaver_phase)
+
+        self.assertEqual(self.order[0], "prep")
+        self.assertLess(self.order.index("phase"), self.order.index("item-1"))
+        self.assertLess(self.order.index("meta"), self.order.index("item-2"))
+        self.assertEqual(self.order[-2:], ["phase-stop", "checksums"])
+        self.assertEqual(
+            sorted(self.order),
+            sorted(
+                ["prep", "phase", "meta", "item-1", "item-2", "phase-stop", "checksums"]
+            ),
+        )
+
+    def test_independent_items_finish_on_failure(self):
+        p1 = self._phase("p1", fail=True)
+        p2 = self._phase("p2")
+        weaver_phase = weaver.GraphWeaverPhase(self.compose)
+        weaver_phase.add_phase(p1)
+        weaver_phase.add_phase(p2)
+
+        with self.assertRaises(Exception):
+            self._run(weaver_phase)
+
+        self.assertEqual(p2.mock_calls, [mock.call.start(), mock.call.stop()])
+
+    def test_unknown_dependency(self):
+        weaver_phase = weaver.GraphWeaverPhase(self.compose)
+        weaver_phase.add_phase(self._phase("p1"), requires=["missing"])
+
+        with self.assertRaises(ValueError) as ctx:
+            weaver_phase.start()
+
+        self.assertIn("unknown item 'missing'", str(ctx.exception))
+
+    def test_cycle(self):
+        weaver_phase = weaver.GraphWeaverPhase(self.compose)
+        weaver_phase.add_phase(self._phase("p1"), requires=["p2"])
+        weaver_phase.add_phase(self._phase("p2"), requires=["p1"])
+
+        with self.assertRaises(ValueError) as ctx:
+            weaver_phase.start()
+
+        self.assertIn("cycle", str(ctx.exception))
+
+    def test_duplicate_name(self):
+        weaver_phase = weaver.GraphWeaverPhase(self.compose)
+        weaver_phase.add_phase(self._phase("p1"))
+
+        with self.assertRaises(ValueError):
+            weaver_phase.add_phase(self._phase("p1"))
@@ -179,3 +179,53 @@ class TestCreateArchRepos(helpers.PungiTestCase):
                 mock.call("[DONE ] %s", "Copying repodata for reuse: %s" % old_repo),
             ]
         )
+
+    @mock.patch("pungi.phases.pkgset.common.get_package_cache")
+    @mock.patch("pungi.phases.pkgset.common.createrepo_lib.write_repo")
+    @mock.patch("pungi.phases.pkgset.common.run")
+    def test_create_arch_repo_in_process(self, mock_run, write_repo, get_cache):
+        self.compose.conf["createrepo_in_process"] = True
+        self.compose.conf["createrepo_num_workers"] = 4
+        helpers.touch(
+            os.path.join(self.topdir, "work/x86_64/package_list/x86_64.foo.conf"),
+            "Packages/a.rpm\nPackages/b.rpm\n",
+        )
+        rpm = mock.Mock(epoch=None, version="1.0", release="1", arch="noarch")
+        rpm.name = "a"
+        self.pkgset.__getitem__ = mock.Mock(
+            side_effect=lambda path: {"/prefix/Packages/a.rpm": rpm}[path]
+        )
+
+        common._create_arch_repo(
+            None,
+            (self.compose, "x86_64", self.prefix, self.paths, self.pkgset, None),
+            1,
+        )
+
+        self.assertEqual(mock_run.mock_calls, [])
+        cache = get_cache.return_value
+        self.assertEqual(
+            cache.get_packages.mock_calls,
+            [
+                mock.call(
+                    [
+                        (
+                            "/prefix/Packages/a.rpm",
+                            "Packages/a.rpm",
+                            "a-0:1.0-1.noarch",
+                        ),
+                        ("/prefix/Packages/b.rpm", "Packages/b.rpm", None),
+                    ],
+                    "sha256",
+                    [os.path.join(self.topdir, "work/global/repo/foo")],
+                    location_base="file:///prefix",
+                    num_workers=4,
+                )
+            ],
+        )
+        write_repo.assert_called_once_with(
+            os.path.join(self.topdir, "work/x86_64/repo/foo"),
+            cache.get_packages.return_value,
+            checksum_type="sha256",
+            extra_files=[],
+        )
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from pungi.phases.pkgset.header_index import (
+    IndexMismatchError,
+    RpmHeaderIndex,
+    save_header_index,
+)
+
+
+class FakeWrapper(object):
+    def __init__(self, file_path, **kwargs):
+        self.file_path = file_path
+        self.stat = os.stat(file_path)
+        self.name = "bash"
+        self.epoch = None
+        self.version = "4.3"
+        self.release = "1.fc33"
+        self.arch = "x86_64"
+        self.sourcerpm = "bash-4.3-1.fc33.src.rpm"
+        self.signature = "DEADBEEF"
+        self.checksum_type = "sha256"
+        self.is_source = False
+        self.is_system_release = False
+        self.excludearch = []
+        self.exclusivearch = ["x86_64"]
+        self.requires = set(["glibc", "ncurses-libs"])
+        self.provides = set(["bash"])
+        self.__dict__.update(kwargs)
+
+    @classmethod
+    def from_index_record(cls, file_path, stat, record):
+        obj = cls.__new__(cls)
+        obj.file_path = file_path
+        obj.stat = stat
+        obj.__dict__.update(record)
+        obj.requires = set(obj.requires)
+        obj.provides = set(obj.provides)
+        return obj
+
+
+class TestRpmHeaderIndex(unittest.TestCase):
+    def setUp(self):
+        self.topdir = tempfile.mkdtemp()
+        self.rpm = os.path.join(self.topdir, "bash.rpm")
+        with open(self.rpm, "w") as f:
+            f.write("bash")
+        self.db = os.path.join(self.topdir, "index.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.topdir)
+
+    def _save(self, *objs):
+        save_header_index(
+            self.db, dict((obj.file_path, obj) for obj in objs), FakeWrapper
+        )
+        return RpmHeaderIndex(self.db, FakeWrapper)
+
+    def test_round_trip(self):
+        index = self._save(FakeWrapper(self.rpm, epoch=1))
+
+        obj = index.lookup(self.rpm)
+
+        self.assertEqual(obj.name, "bash")
+        self.assertEqual(obj.epoch, 1)
+        self.assertEqual(obj.arch, "x86_64")
+        self.assertEqual(obj.signature, "DEADBEEF")
+        self.assertFalse(obj.is_source)
+        self.assertEqual(obj.exclusivearch, ["x86_64"])
+        self.assertEqual(obj.requires, set(["glibc", "ncurses-libs"]))
+        self.assertEqual(obj.provides, set(["bash"]))
+        self.assertEqual(obj.stat.st_ino, os.stat(self.rpm).st_ino)
+
+    def test_mapping_interface(self):
+        index = self._save(FakeWrapper(self.rpm))
+
+        self.assertEqual(len(index), 1)
+        self.assertIn(self.rpm, index)
+        self.assertEqual(list(index), [self.rpm])
+        self.assertEqual(index[self.rpm].name, "bash")
+        self.assertEqual([path for path, _ in index.items()], [self.rpm])
+        self.assertRaises(KeyError, index.__getitem__, "/missing.rpm")
+
+    def test_lookup_changed_file(self):
+        index = self._save(FakeWrapper(self.rpm))
+        with open(self.rpm, "w") as f:
+            f.write("bash-updated")
+
+        self.assertIsNone(index.lookup(self.rpm))
+
+    def test_lookup_missing_file(self):
+        index = self._save(FakeWrapper(self.rpm))
+        os.remove(self.rpm)
+
+        self.assertIsNone(index.lookup(self.rpm))
+
+    def test_add_appends(self):
+        index = self._save(FakeWrapper(self.rpm))
+        other = os.path.join(self.topdir, "zsh.rpm")
+        with open(other, "w") as f:
+            f.write("zsh")
+
+        index.add(FakeWrapper(other, name="zsh"))
+        index.commit()
+
+        reopened = RpmHeaderIndex(self.db, FakeWrapper)
+        self.assertEqual(len(reopened), 2)
+        self.assertEqual(reopened.lookup(other).name, "zsh")
+
+    def test_contains_relative_path(self):
+        index = self._save(FakeWrapper(self.rpm))
+        cwd = os.getcwd()
+        os.chdir(self.topdir)
+        try:
+            self.assertIn("bash.rpm", index)
+        finally:
+            os.chdir(cwd)
+
+    def test_readonly_does_not_modify_index(self):
+        self._save(FakeWrapper(self.rpm)).close()
+        os.chmod(self.db, 0o444)
+        with open(self.db, "rb") as f:
+            data = f.read()
+
+        index = RpmHeaderIndex(self.db, FakeWrapper, readonly=True)
+
+        self.assertEqual(index.lookup(self.rpm).name, "bash")
+        index.close()
+        with open(self.db, "rb") as f:
+            self.assertEqual(f.read(), data)
+
+    def test_readonly_missing_index(self):
+        with self.assertRaises(IndexMismatchError):
+            RpmHeaderIndex(self.db, FakeWrapper, readonly=True)
+        self.assertFalse(os.path.exists(self.db))
+
+    def test_readonly_different_version(self):
+        self._save(FakeWrapper(self.rpm)).close()
+        conn = sqlite3.connect(self.db)
+        conn.execute("PRAGMA user_version = 1000")
+        conn.commit()
+        conn.close()
+
+        with self.assertRaises(IndexMismatchError):
+            RpmHeaderIndex(self.db, FakeWrapper, readonly=True)
+
+    def test_readonly_different_schema(self):
+        conn = sqlite3.connect(self.db)
+        conn.execute("CREATE TABLE headers (path TEXT)")
+        conn.execute("PRAGMA user_version = 1")
+        conn.commit()
+        conn.close()
+
+        with self.assertRaises(IndexMismatchError):
+            RpmHeaderIndex(self.db, FakeWrapper, readonly=True)
@@ -14,6 +14,7 @@ import re
 from dogpile.cache import make_region
 
 from pungi.phases.pkgset import pkgsets
+from pungi.phases.pkgset.header_index import RpmHeaderIndex
 from tests import helpers
 
 
@@ -85,6 +86,7 @@ class MockFileCache(dict):
     def __init__(self, _wrapper):
         super(MockFileCache, self).__init__()
         self.file_cache = self
+        self.inode_cache = {}
 
     def add(self, file_path):
         obj = MockFile(file_path)
@@ -124,6 +126,34 @@ class FakePool(object):
         pass
 
 
+class FakeProcessPool(object):
+    """This class will be substituted for multiprocessing.Pool. It runs all
+    the work in the current process.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+
+    def imap_unordered(self, func, iterable):
+        return [func(item) for item in iterable]
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+def fake_read_rpm_headers(file_paths):
+    return [(path, os.stat(path), {}) for path in file_paths]
+
+
+def fake_from_index_record(file_path, stat, record):
+    obj = MockFile(file_path)
+    obj.stat = stat
+    return obj
+
+
 class PkgsetCompareMixin(object):
     def assertPkgsetEqual(self, actual, expected):
         for k, v1 in expected.items():
@@ -662,6 +692,86 @@ class TestKojiPkgset(PkgsetCompareMixin, helpers.PungiTestCase):
         )
 
 
+@mock.patch("pungi.phases.pkgset.pkgsets._create_reader_processes", new=FakeProcessPool)
+@mock.patch("pungi.phases.pkgset.pkgsets._read_rpm_headers", new=fake_read_rpm_headers)
+@mock.patch(
+    "pungi.phases.pkgset.pkgsets.ExtendedRpmWrapper.from_index_record",
+    new=fake_from_index_record,
+)
+@mock.patch("kobo.pkgset.FileCache", new=MockFileCache)
+class TestKojiPkgsetProcessReader(PkgsetCompareMixin, helpers.PungiTestCase):
+    def setUp(self):
+        super(TestKojiPkgsetProcessReader, self).setUp()
+        self.addCleanup(pkgsets.stop_reader_processes)
+        with open(os.path.join(helpers.FIXTURE_DIR, "tagged-rpms.json")) as f:
+            self.tagged_rpms = json.load(f)
+
+        self.koji_wrapper = mock.Mock()
+        self.koji_wrapper.koji_proxy.listTaggedRPMS.return_value = self.tagged_rpms
+        self.koji_wrapper.koji_module.pathinfo = MockPathInfo(self.topdir)
+
+    def test_read_in_processes(self):
+        for filename in [
+            "rpms/pungi@4.1.3@3.fc25@noarch",
+            "rpms/pungi@4.1.3@3.fc25@src",
+            "rpms/bash@4.3.42@4.fc24@x86_64",
+            "rpms/bash@4.3.42@4.fc24@src",
+            "rpms/bash-debuginfo@4.3.42@4.fc24@x86_64",
+        ]:
+            helpers.touch(os.path.join(self.topdir, filename))
+
+        pkgset = pkgsets.KojiPackageSet(
+            "pkgset",
+            self.koji_wrapper,
+            [None],
+            arches=["x86_64", "noarch", "src"],
+            reader_backend="processes",
+            reader_chunk_size=2,
+        )
+
+        result = pkgset.populate("f25")
+
+        self.assertPkgsetEqual(
+            result,
+            {
+                "src": ["rpms/pungi@4.1.3@3.fc25@src", "rpms/bash@4.3.42@4.fc24@src"],
+                "noarch": ["rpms/pungi@4.1.3@3.fc25@noarch"],
+                "x86_64": [
+                    "rpms/bash@4.3.42@4.fc24@x86_64",
+                    "rpms/bash-debuginfo@4.3.42@4.fc24@x86_64",
+                ],
+            },
+        )
+        self.assertEqual(len(pkgset.file_cache), 5)
+
+
+class TestReaderProcesses(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(pkgsets.stop_reader_processes)
+
+    @mock.patch("pungi.phases.pkgset.pkgsets._create_reader_processes")
+    def test_pool_is_shared(self, create):
+        create.side_effect = lambda num: mock.Mock()
+        first = pkgsets.get_reader_processes(4)
+        second = pkgsets.get_reader_processes(8)
+
+        self.assertIs(first, second)
+        self.assertEqual(create.call_args_list, [mock.call(4)])
+
+        pkgsets.stop_reader_processes()
+
+        self.assertEqual(first.mock_calls, [mock.call.close(), mock.call.join()])
+        self.assertIsNot(pkgsets.get_reader_processes(4), first)
+
+    @mock.patch("multiprocessing.get_context", create=True)
+    def test_processes_are_spawned(self, get_context):
+        pool = pkgsets._create_reader_processes(3)
+
+        self.assertEqual(get_context.call_args_list, [mock.call("spawn")])
+        self.assertIs(pool, get_context.return_value.Pool.return_value)
+        get_context.return_value.Pool.assert_called_once_with(3)
+
+
 class TestReuseKojiPkgset(helpers.PungiTestCase):
     def setUp(self):
         super(TestReuseKojiPkgset, self).setUp()
@@ -672,6 +782,12 @@ class TestReuseKojiPkgset(helpers.PungiTestCase):
         )
 
         self.koji_wrapper = mock.Mock()
+        self.koji_wrapper.batched_multicall_map.side_effect = (
+            lambda method, list_of_kwargs: [
+                getattr(self.koji_wrapper.koji_proxy, method)(**kwargs)
+                for kwargs in list_of_kwargs
+            ]
+        )
 
         self.tag = "test-tag"
         self.inherited_tag = "inherited-test-tag"
@@ -754,6 +870,17 @@ class TestReuseKojiPkgset(helpers.PungiTestCase):
                 ),
             ],
         )
+        self.koji_wrapper.batched_multicall_map.assert_called_once_with(
+            "queryHistory",
+            list_of_kwargs=[
+                {
+                    "tables": ["tag_listing", "tag_inheritance"],
+                    "tag": self.inherited_tag,
+                    "afterEvent": 1,
+                    "beforeEvent": 4,
+                }
+            ],
+        )
         self.assert_not_reuse()
 
     @mock.patch("pungi.paths.os.path.exists", return_value=True)
@@ -870,6 +997,39 @@ class TestReuseKojiPkgset(helpers.PungiTestCase):
         self.assertEqual(old_repo_dir, self.pkgset.reuse)
         self.assertEqual(self.pkgset.file_cache, self.pkgset.old_file_cache)
 
+    @mock.patch("pungi.phases.pkgset.pkgsets.copy_all")
+    @mock.patch("pungi.paths.os.path.exists", return_value=True)
+    @mock.patch.object(helpers.paths.Paths, "get_old_compose_topdir")
+    def test_reuse_pkgset_with_header_index(
+        self, mock_old_topdir, mock_exists, mock_copy_all
+    ):
+        mock_old_topdir.return_value = self.old_compose_dir
+        self.pkgset._get_koji_event_from_file = mock.Mock(side_effect=[3, 1])
+        self.koji_wrapper.koji_proxy.queryHistory.return_value = {
+            "tag_listing": [],
+            "tag_inheritance": [],
+        }
+        self.koji_wrapper.koji_proxy.getFullInheritance.return_value = []
+        bash = mock.Mock(file_path="/p/bash.rpm", stat=mock.Mock(st_dev=1, st_ino=2))
+        self.pkgset.load_old_file_cache = mock.Mock(
+            return_value={
+                "allow_invalid_sigkeys": self.pkgset._allow_invalid_sigkeys,
+                "packages": self.pkgset.packages,
+                "populate_only_packages": self.pkgset.populate_only_packages,
+                "extra_builds": self.pkgset.extra_builds,
+                "sigkeys": self.pkgset.sigkey_ordering,
+                "include_packages": None,
+                "rpms_by_arch": {"x86_64": [bash]},
+                "srpms_by_name": {},
+            }
+        )
+        self.pkgset.old_file_cache = mock.Mock(spec=RpmHeaderIndex)
+
+        self.assertTrue(self.pkgset.try_to_reuse(self.compose, self.tag))
+
+        self.assertIsNot(self.pkgset.file_cache, self.pkgset.old_file_cache)
+        self.assertIs(self.pkgset.file_cache["/p/bash.rpm"], bash)
+
 
 @mock.patch("kobo.pkgset.FileCache", new=MockFileCache)
 class TestMergePackageSets(PkgsetCompareMixin, unittest.TestCase):
@@ -75,7 +75,7 @@ class TestPopulateGlobalPkgset(helpers.PungiTestCase):
         self.compose = helpers.DummyCompose(
             self.topdir, {"pkgset_koji_tag": "f25", "sigkeys": ["foo", "bar"]}
         )
-        self.koji_wrapper = mock.Mock()
+        self.koji_wrapper = mock.MagicMock()
         self.pkgset_path = os.path.join(
             self.topdir, "work", "global", "pkgset_global.pickle"
         )
@@ -100,6 +100,7 @@ class TestPopulateGlobalPkgset(helpers.PungiTestCase):
         pkgsets[0].assert_has_calls(
             [mock.call.populate("f25", 123456, inherit=True, include_packages=set())],
         )
+        self.koji_wrapper.pooled_session.assert_called_once_with()
 
     def mock_materialize(self, compose, pkgset, prefix, mmd):
         self.assertEqual(prefix, "/prefix")
@@ -145,6 +146,36 @@ class TestPopulateGlobalPkgset(helpers.PungiTestCase):
             ]
         )
 
+    @mock.patch(
+        "pungi.phases.pkgset.sources.source_koji.MaterializedPackageSet.create_many"
+    )
+    @mock.patch("pungi.phases.pkgset.pkgsets.KojiPackageSet")
+    def test_populate_keeps_tag_order(self, KojiPackageSet, create_many):
+        tags = ["f25", "f25-extra", "f25-updates", "f25-testing", "f25-other"]
+        self.compose = helpers.DummyCompose(
+            self.topdir,
+            {
+                "pkgset_koji_tag": tags,
+                "sigkeys": ["foo", "bar"],
+                "pkgset_koji_num_threads": 3,
+            },
+        )
+
+        def make_pkgset(name, *args, **kwargs):
+            pkgset = mock.Mock(reuse=None)
+            pkgset.name = name
+            return pkgset
+
+        KojiPackageSet.side_effect = make_pkgset
+        create_many.side_effect = lambda partials: [p.args[1] for p in partials]
+
+        pkgsets = source_koji.populate_global_pkgset(
+            self.compose, self.koji_wrapper, "/prefix", 123456
+        )
+
+        self.assertEqual([pkgset.name for pkgset in pkgsets], tags)
+        self.assertEqual(self.koji_wrapper.pooled_session.call_count, len(tags))
+
     @mock.patch("pungi.phases.pkgset.sources.source_koji.MaterializedPackageSet.create")
     @mock.patch("pungi.phases.pkgset.pkgsets.KojiPackageSet.populate")
     @mock.patch("pungi.phases.pkgset.pkgsets.KojiPackageSet.save_file_list")
@@ -674,6 +705,50 @@ class TestFilterByWhitelist(unittest.TestCase):
         self.assertEqual(expected, set())
 
 
+class TestGetModulesFromKojiTags(helpers.PungiTestCase):
+    @mock.patch("pungi.phases.pkgset.sources.source_koji._add_module_to_variant")
+    def test_gets_builds_in_batch(self, add_module_to_variant):
+        compose = helpers.DummyCompose(
+            self.topdir, {"pkgset_koji_module_tag": "module-tag"}
+        )
+        variant = compose.variants["Server"]
+        koji_wrapper = mock.Mock()
+        koji_wrapper.koji_proxy.listTagged.return_value = [
+            {
+                "build_id": idx,
+                "name": "mod%d" % idx,
+                "version": "master",
+                "release": "1.c%d" % idx,
+                "tag_name": "module-tag",
+            }
+            for idx in range(3)
+        ]
+        koji_wrapper.koji_proxy.getFullInheritance.return_value = []
+        koji_wrapper.batched_multicall_map.side_effect = lambda method, ids: [
+            {
+                "id": build_id,
+                "extra": {
+                    "typeinfo": {"module": {"content_koji_tag": "tag-%d" % build_id}}
+                },
+            }
+            for build_id in ids
+        ]
+        add_module_to_variant.side_effect = lambda kw, v, build, *a, **k: (
+            "nsvc-%d" % build["id"]
+        )
+        variant_tags = {variant: []}
+
+        source_koji._get_modules_from_koji_tags(
+            compose, koji_wrapper, {"id": 1}, variant, variant_tags, {}, []
+        )
+
+        koji_wrapper.batched_multicall_map.assert_called_once_with(
+            "getBuild", [2, 1, 0]
+        )
+        self.assertEqual(koji_wrapper.koji_proxy.getBuild.call_args_list, [])
+        self.assertEqual(variant_tags[variant], ["tag-2", "tag-1", "tag-0"])
+
+
 @unittest.skipIf(Modulemd is None, "Skipping tests, no module support")
 class TestAddModuleToVariant(helpers.PungiTestCase):
     def setUp(self):
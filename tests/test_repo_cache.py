@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import threading
+
+import mock
+
+from pungi.repo_cache import RepoCache, get_repomd_checksum
+from tests import helpers
+
+
+class TestRepoCache(helpers.PungiTestCase):
+    def setUp(self):
+        super(TestRepoCache, self).setUp()
+        self.cache = RepoCache(max_weight=10)
+
+    def test_loads_value_once(self):
+        loader = mock.Mock(return_value=("value", 1))
+
+        self.assertEqual(self.cache.get("key", loader), "value")
+        self.assertEqual(self.cache.get("key", loader), "value")
+
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(self.cache.weight, 1)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.get("a", lambda: ("a", 4))
+        self.cache.get("b", lambda: ("b", 4))
+        # Using "a" makes "b" the oldest one.
+        self.cache.get("a", mock.Mock())
+        self.cache.get("c", lambda: ("c", 4))
+
+        self.assertIn("a", self.cache)
+        self.assertNotIn("b", self.cache)
+        self.assertIn("c", self.cache)
+        self.assertEqual(self.cache.weight, 8)
+
+    def test_does_not_cache_too_large_value(self):
+        self.cache.get("a", lambda: ("a", 4))
+
+        self.assertEqual(self.cache.get("big", lambda: ("big", 11)), "big")
+
+        self.assertNotIn("big", self.cache)
+        self.assertIn("a", self.cache)
+
+    def test_resize_evicts_least_recently_used(self):
+        self.cache.get("a", lambda: ("a", 4))
+        self.cache.get("b", lambda: ("b", 4))
+
+        self.cache.resize(5)
+
+        self.assertNotIn("a", self.cache)
+        self.assertIn("b", self.cache)
+        self.assertEqual(self.cache.weight, 4)
+        self.assertEqual(self.cache.max_weight, 5)
+
+    def test_concurrent_requests_load_once(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "value", 1
+
+        results = []
+
+        def worker():
+            results.append(self.cache.get("key", loader))
+
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for t in threads:
+            t.start()
+        started.wait()
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, ["value"] * 3)
+        self.assertEqual(len(calls), 1)
+
+    def test_key_locks_are_released(self):
+        self.cache.get("a", lambda: ("a", 4))
+        self.cache.get("a", mock.Mock())
+        self.cache.get("big", lambda: ("big", 11))
+
+        self.assertEqual(self.cache._key_locks, {})
+
+    def test_clear(self):
+        self.cache.get("a", lambda: ("a", 4))
+
+        self.cache.clear()
+
+        self.assertNotIn("a", self.cache)
+        self.assertEqual(self.cache.weight, 0)
+
+    def test_get_repomd_checksum(self):
+        repo = os.path.join(self.topdir, "repo")
+        helpers.touch(os.path.join(repo, "repodata/repomd.xml"), "<repomd/>")
+
+        self.assertEqual(
+            get_repomd_checksum(repo), hashlib.sha256(b"<repomd/>").hexdigest()
+        )
+        self.assertEqual(
+            get_repomd_checksum("file://" + repo), get_repomd_checksum(repo)
+        )
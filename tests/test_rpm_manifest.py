@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from pungi.rpm_manifest import RpmManifest
+from tests import helpers
+
+BASH_SRC = "bash-0:4.3.30-2.fc21.src"
+
+
+class TestRpmManifest(helpers.PungiTestCase):
+    def setUp(self):
+        super(TestRpmManifest, self).setUp()
+        self.manifest = RpmManifest()
+        self.manifest.compose.id = "Test-20151203.0.t"
+        self.manifest.compose.type = "test"
+        self.manifest.compose.date = "20151203"
+        self.manifest.compose.respin = 0
+        self.manifest.add(
+            "Server", "x86_64", BASH_SRC, "Server/source/bash.src.rpm", None, "source"
+        )
+        self.manifest.add(
+            "Server",
+            "x86_64",
+            "bash-0:4.3.30-2.fc21.x86_64",
+            "Server/x86_64/bash.rpm",
+            None,
+            "binary",
+            srpm_nevra=BASH_SRC,
+        )
+        self.manifest.add(
+            "Server", "amd64", BASH_SRC, "Server/source/bash.src.rpm", None, "source"
+        )
+
+    def test_get_packages(self):
+        self.assertEqual(
+            self.manifest.get_packages("Server", "x86_64", "binary"),
+            [("bash-0:4.3.30-2.fc21.x86_64", "Server/x86_64/bash.rpm")],
+        )
+        self.assertEqual(self.manifest.get_packages("Server", "x86_64", "debug"), [])
+        self.assertEqual(self.manifest.get_packages("Client", "x86_64", "binary"), [])
+
+    def test_get_packages_for_all_arches(self):
+        self.assertEqual(
+            self.manifest.get_packages("Server", None, "source"),
+            [(BASH_SRC, "Server/source/bash.src.rpm")] * 2,
+        )
+
+    def test_index_loaded_file(self):
+        path = os.path.join(self.topdir, "rpms.json")
+        self.manifest.dump(path)
+
+        manifest = RpmManifest.from_file(path)
+
+        self.assertEqual(manifest.rpms, self.manifest.rpms)
+        for arch in ("x86_64", "amd64", None):
+            for category in ("binary", "source"):
+                self.assertEqual(
+                    sorted(manifest.get_packages("Server", arch, category)),
+                    sorted(self.manifest.get_packages("Server", arch, category)),
+                )
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+
+from pungi.solv_cache import SolvCache, get_local_path
+from tests import helpers
+
+
+class TestSolvCache(helpers.PungiTestCase):
+    def setUp(self):
+        super(TestSolvCache, self).setUp()
+        self.repo = os.path.join(self.topdir, "repo")
+        helpers.touch(os.path.join(self.repo, "repodata", "repomd.xml"), "<repomd/>")
+        self.key = hashlib.sha256(b"<repomd/>").hexdigest()
+        self.store = os.path.join(self.topdir, "store")
+        self.cachedir = os.path.join(self.topdir, "cache")
+        self.cache = SolvCache(self.store)
+
+    def test_get_local_path(self):
+        self.assertEqual(get_local_path("file:///repo"), "/repo")
+        self.assertEqual(get_local_path("/repo"), "/repo")
+        self.assertIsNone(get_local_path("http://example.com/repo"))
+
+    def test_get_key(self):
+        self.assertEqual(self.cache.get_key(self.repo), self.key)
+        self.assertEqual(self.cache.get_key("file://" + self.repo), self.key)
+
+    def test_get_key_missing_repomd(self):
+        self.assertIsNone(self.cache.get_key(os.path.join(self.topdir, "missing")))
+
+    def test_get_key_remote_repo(self):
+        self.assertIsNone(self.cache.get_key("http://example.com/repo"))
+
+    def test_store_and_link(self):
+        helpers.touch(os.path.join(self.cachedir, "pungi-repo-0.solv"), "solv")
+        helpers.touch(
+            os.path.join(self.cachedir, "pungi-repo-0-filenames.solvx"), "files"
+        )
+
+        self.assertEqual(
+            self.cache.store_from(self.cachedir, "pungi-repo-0", self.key), 2
+        )
+        self.assertEqual(
+            sorted(os.listdir(self.store)),
+            [self.key + "-filenames.solvx", self.key + ".solv"],
+        )
+
+        other = os.path.join(self.topdir, "other-cache")
+        self.assertEqual(self.cache.link_into(other, "lookaside-repo-0", self.key), 2)
+        solv = os.path.join(other, "lookaside-repo-0.solv")
+        self.assertTrue(os.path.islink(solv))
+        with open(solv) as f:
+            self.assertEqual(f.read(), "solv")
+        self.assertTrue(
+            os.path.islink(os.path.join(other, "lookaside-repo-0-filenames.solvx"))
+        )
+
+    def test_linked_files_are_not_stored_again(self):
+        helpers.touch(os.path.join(self.store, self.key + ".solv"), "solv")
+        self.cache.link_into(self.cachedir, "pungi-repo-0", self.key)
+
+        self.assertEqual(
+            self.cache.store_from(self.cachedir, "pungi-repo-0", self.key), 0
+        )
+
+    def test_link_replaces_stale_file(self):
+        helpers.touch(os.path.join(self.store, self.key + ".solv"), "solv")
+        helpers.touch(os.path.join(self.cachedir, "pungi-repo-0.solv"), "stale")
+
+        self.cache.link_into(self.cachedir, "pungi-repo-0", self.key)
+
+        with open(os.path.join(self.cachedir, "pungi-repo-0.solv")) as f:
+            self.assertEqual(f.read(), "solv")
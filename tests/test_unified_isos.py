@@ -155,6 +155,33 @@ def get_repos_mapping(path):
     }
 
 
+def get_old_repos_mapping(path):
+    def _repo(variant, arch):
+        return [os.path.join(path, variant, arch, "os")]
+
+    def _debug(variant, arch):
+        return [os.path.join(path, variant, arch, "debug", "tree")]
+
+    def _source(variant):
+        return [os.path.join(path, variant, "source", "tree")]
+
+    return {
+        "i386": {"Client": _repo("Client", "i386")},
+        "debug-i386": {"Client": _debug("Client", "i386")},
+        "s390x": {"Server": _repo("Server", "s390x")},
+        "debug-s390x": {"Server": _debug("Server", "s390x")},
+        "src": {"Client": _source("Client"), "Server": _source("Server")},
+        "x86_64": {
+            "Client": _repo("Client", "x86_64"),
+            "Server": _repo("Server", "x86_64"),
+        },
+        "debug-x86_64": {
+            "Client": _debug("Client", "x86_64"),
+            "Server": _debug("Server", "x86_64"),
+        },
+    }
+
+
 class TestLinkToTemp(PungiTestCase):
     def setUp(self):
         super(TestLinkToTemp, self).setUp()
@@ -201,6 +228,7 @@ class TestLinkToTemp(PungiTestCase):
         self.assertEqual(self.isos.comps, get_comps_mapping(self.compose_path))
         self.assertEqual(self.isos.productid, get_productid_mapping(self.compose_path))
         self.assertEqual(self.isos.repos, get_repos_mapping(self.isos.temp_dir))
+        self.assertEqual(self.isos.old_repos, get_old_repos_mapping(self.compose_path))
 
         six.assertCountEqual(
             self,
@@ -357,8 +385,12 @@ class TestCreaterepo(PungiTestCase):
         self.maxDiff = None
         self.comps = get_comps_mapping(self.compose_path)
 
-    def mock_cr(self, path, groupfile, update):
+    def mock_cr(self, path, groupfile, update, update_md_path):
         self.assertTrue(update)
+        arch, variant = path.split("/")[-2:]
+        self.assertEqual(
+            update_md_path, get_old_repos_mapping(self.compose_path)[arch][variant]
+        )
         touch(os.path.join(path, "repodata", "repomd.xml"))
         return ("/".join(path.split("/")[-2:]), groupfile)
 
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import errno
 import mock
 import os
 
@@ -488,6 +489,74 @@ class TestFindOldCompose(unittest.TestCase):
         self.assertEqual(old, self.tmp_dir + "/Fedora-Rawhide-Base-1-20160229.0")
 
 
+class TestOldComposeIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_scans_directory_once(self):
+        touch(self.tmp_dir + "/Fedora-Rawhide-20160229.0/STATUS", "FINISHED")
+        touch(self.tmp_dir + "/Fedora-26-20160229.0/STATUS", "FINISHED")
+        index = util.OldComposeIndex(self.tmp_dir)
+
+        with mock.patch("os.listdir", wraps=os.listdir) as listdir:
+            rawhide = index.find("Fedora", "Rawhide", "")
+            self.assertEqual(index.find("Fedora", "Rawhide", ""), rawhide)
+            f26 = index.find("Fedora", "26", "")
+
+        self.assertEqual(rawhide, self.tmp_dir + "/Fedora-Rawhide-20160229.0")
+        self.assertEqual(f26, self.tmp_dir + "/Fedora-26-20160229.0")
+        self.assertEqual(listdir.call_args_list, [mock.call(self.tmp_dir)])
+
+    def test_changes_visible_after_refresh(self):
+        touch(self.tmp_dir + "/Fedora-Rawhide-20160229.0/STATUS", "FINISHED")
+        index = util.OldComposeIndex(self.tmp_dir)
+        self.assertEqual(
+            index.find("Fedora", "Rawhide", ""),
+            self.tmp_dir + "/Fedora-Rawhide-20160229.0",
+        )
+
+        touch(self.tmp_dir + "/Fedora-Rawhide-20160229.1/STATUS", "FINISHED")
+        self.assertEqual(
+            index.find("Fedora", "Rawhide", ""),
+            self.tmp_dir + "/Fedora-Rawhide-20160229.0",
+        )
+
+        index.refresh()
+        self.assertEqual(
+            index.find("Fedora", "Rawhide", ""),
+            self.tmp_dir + "/Fedora-Rawhide-20160229.1",
+        )
+
+    def test_status_read_once_for_different_statuses(self):
+        touch(self.tmp_dir + "/Fedora-Rawhide-20160229.0/STATUS", "DOOMED")
+        index = util.OldComposeIndex([self.tmp_dir])
+
+        with mock.patch("pungi.util.open", create=True, wraps=open) as o:
+            self.assertIsNone(
+                index.find("Fedora", "Rawhide", "", allowed_statuses=["FINISHED"])
+            )
+            self.assertEqual(
+                index.find("Fedora", "Rawhide", ""),
+                self.tmp_dir + "/Fedora-Rawhide-20160229.0",
+            )
+
+        self.assertEqual(len(o.call_args_list), 1)
+
+    def test_single_allowed_status(self):
+        touch(self.tmp_dir + "/Fedora-Rawhide-20160229.0/STATUS", "FINISHED")
+        touch(self.tmp_dir + "/Fedora-Rawhide-20160229.1/STATUS", "DOOMED")
+        index = util.OldComposeIndex(self.tmp_dir)
+
+        self.assertEqual(
+            index.find("Fedora", "Rawhide", "", allowed_statuses="FINISHED"),
+            self.tmp_dir + "/Fedora-Rawhide-20160229.0",
+        )
+        self.assertIsNone(index.find("Fedora", "Rawhide", "", allowed_statuses="DONE"))
+
+
 class TestHelpers(PungiTestCase):
     def test_process_args(self):
         self.assertEqual(util.process_args("--opt=%s", None), [])
@@ -1014,6 +1083,100 @@ class TestCopyAll(PungiTestCase):
         self.assertEqual(os.readlink(os.path.join(self.dst, "symlink")), "broken")
 
 
+@mock.patch.dict("pungi.util._reflink_support", clear=True)
+@mock.patch.dict("pungi.util._copy_file_range_support", clear=True)
+class TestCopyFile(PungiTestCase):
+    def setUp(self):
+        super(TestCopyFile, self).setUp()
+        self.src = os.path.join(self.topdir, "src")
+        self.dst = os.path.join(self.topdir, "dst")
+        touch(self.src, "hello")
+        os.utime(self.src, (-1, 10))
+
+    def assertCopied(self):
+        with open(self.dst) as f:
+            self.assertEqual(f.read(), "hello")
+        self.assertEqual(os.stat(self.dst).st_mtime, 10)
+        self.assertNotEqual(os.stat(self.src).st_ino, os.stat(self.dst).st_ino)
+
+    @mock.patch("pungi.util._ficlone")
+    def test_reflink(self, ficlone):
+        util.copy_file(self.src, self.dst)
+
+        self.assertEqual(len(ficlone.call_args_list), 1)
+        self.assertEqual(list(util._reflink_support.values()), [True])
+        self.assertEqual(os.stat(self.dst).st_mtime, 10)
+
+    @mock.patch("pungi.util._ficlone")
+    def test_reflink_not_supported_is_remembered(self, ficlone):
+        ficlone.side_effect = IOError(errno.EOPNOTSUPP, "Not supported")
+
+        util.copy_file(self.src, self.dst)
+        self.assertCopied()
+        os.unlink(self.dst)
+        util.copy_file(self.src, self.dst)
+        self.assertCopied()
+
+        self.assertEqual(len(ficlone.call_args_list), 1)
+        self.assertEqual(list(util._reflink_support.values()), [False])
+
+    @mock.patch("pungi.util._ficlone")
+    def test_reflink_other_error_is_raised(self, ficlone):
+        ficlone.side_effect = IOError(errno.EIO, "I/O error")
+
+        with self.assertRaises(IOError):
+            util.copy_file(self.src, self.dst)
+
+        self.assertFalse(os.path.exists(self.dst))
+        self.assertEqual(util._reflink_support, {})
+
+    @mock.patch("pungi.util._ficlone")
+    def test_copy_without_reflink(self, ficlone):
+        util.copy_file(self.src, self.dst, reflink=False)
+
+        self.assertCopied()
+        self.assertEqual(ficlone.call_args_list, [])
+
+    def test_refuses_to_copy_onto_hardlink(self):
+        os.link(self.src, self.dst)
+
+        with self.assertRaises(util.SameFileError):
+            util.copy_file(self.src, self.dst)
+
+        with open(self.src) as f:
+            self.assertEqual(f.read(), "hello")
+
+    def test_refuses_to_copy_onto_symlink(self):
+        os.symlink(self.src, self.dst)
+
+        with self.assertRaises(util.SameFileError):
+            util.copy_file(self.src, self.dst)
+
+        with open(self.src) as f:
+            self.assertEqual(f.read(), "hello")
+
+    def test_replaces_existing_file(self):
+        touch(self.dst, "old content")
+        other = os.path.join(self.topdir, "other")
+        os.link(self.dst, other)
+
+        util.copy_file(self.src, self.dst)
+
+        self.assertCopied()
+        with open(other) as f:
+            self.assertEqual(f.read(), "old content")
+        self.assertEqual(sorted(os.listdir(self.topdir)), ["dst", "other", "src"])
+
+    @mock.patch("pungi.util._ficlone")
+    def test_reflink_refuses_same_file(self, ficlone):
+        os.link(self.src, self.dst)
+
+        with self.assertRaises(util.SameFileError):
+            util.reflink_file(self.src, self.dst)
+
+        self.assertEqual(ficlone.call_args_list, [])
+
+
 class TestMoveAll(PungiTestCase):
     def setUp(self):
         super(TestMoveAll, self).setUp()
@@ -1065,3 +1228,27 @@ class TestAsLocalFile(PungiTestCase):
         with util.as_local_file("file:///tmp/foo") as fn:
             self.assertEqual(fn, "/tmp/foo")
         self.assertEqual(urlretrieve.call_args_list, [])
+
+
+class TestWorklist(unittest.TestCase):
+    def test_returns_only_new_items(self):
+        worklist = util.Worklist()
+
+        self.assertEqual(worklist.get("step", [1, 2]), set([1, 2]))
+        self.assertEqual(worklist.get("step", [1, 2, 3]), set([3]))
+        self.assertEqual(worklist.get("step", [1, 2, 3]), set())
+
+    def test_steps_are_independent(self):
+        worklist = util.Worklist()
+        worklist.get("first", [1, 2])
+
+        self.assertEqual(worklist.get("second", [1, 2]), set([1, 2]))
+
+    def test_retry(self):
+        worklist = util.Worklist()
+        worklist.get("step", [1, 2])
+        worklist.retry("step", 2)
+        worklist.retry("other", 1)
+
+        self.assertEqual(worklist.get("step", [1, 2]), set([2]))
+        self.assertEqual(worklist.get("other", [1]), set([1]))